@@ -4,3 +4,9 @@ from django.apps import AppConfig
 class AgentConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'agent'
+
+    def ready(self):
+        from . import db, page_cache, search
+        db.connect_signals()
+        page_cache.connect_signals()
+        search.connect_signals(self)
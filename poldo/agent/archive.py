@@ -0,0 +1,209 @@
+"""
+Arquivamento e compactação das conversas antigas
+
+Conversas sem atividade há mais de N dias saem das tabelas Conversation
+e Message (que ficam só com dados vivos, usados pela barra lateral) e
+vão para ArchivedConversation: uma linha por conversa com as mensagens
+em JSON comprimido com gzip. Textos repetidos, como as respostas de erro
+"❌ Erro ao processar pergunta", são guardados uma única vez por conversa.
+
+Uma conversa arquivada volta para as tabelas vivas quando é reaberta.
+"""
+
+import gzip
+import json
+from datetime import datetime
+
+from django.db import transaction
+from django.db.models import Max
+from django.db.models.functions import Coalesce
+
+from . import page_cache
+from .models import ArchivedConversation, Conversation, Message
+
+# Início das respostas de erro gravadas por ChatAgent.process_question
+ERROR_PREFIX = "❌ Erro ao processar pergunta"
+
+
+def pack_messages(messages):
+    """
+    Serializa e comprime as mensagens de uma conversa
+
+    Cada texto distinto aparece uma vez em "texts"; as mensagens guardam
+    apenas o índice do texto.
+
+    Args:
+        messages (list): Dicts com role, text e created_at, em ordem
+
+    Returns:
+        bytes: JSON comprimido com gzip
+    """
+    texts = {}
+    rows = [
+        [message['role'], texts.setdefault(message['text'], len(texts)), message['created_at'].isoformat()]
+        for message in messages
+    ]
+    document = {'texts': list(texts), 'messages': rows}
+    return gzip.compress(json.dumps(document, ensure_ascii=False, separators=(',', ':')).encode('utf-8'))
+
+
+def unpack_messages(payload):
+    """
+    Reverte pack_messages
+
+    Args:
+        payload (bytes): JSON comprimido
+
+    Returns:
+        list: Dicts com role, text e created_at, em ordem
+    """
+    document = json.loads(gzip.decompress(bytes(payload)))
+    texts = document['texts']
+    return [
+        {'role': role, 'text': texts[index], 'created_at': datetime.fromisoformat(created_at)}
+        for role, index, created_at in document['messages']
+    ]
+
+
+def archive_conversations(before, batch_size=100, exclude=()):
+    """
+    Arquiva as conversas cuja última atividade é anterior a uma data
+
+    Cada lote é gravado em uma transação: as conversas só somem das
+    tabelas vivas junto com a criação das linhas de arquivo. As conversas
+    do lote são travadas (select_for_update) e a atividade é conferida
+    de novo com a trava: uma mensagem gravada depois da seleção tira a
+    conversa do lote, e uma gravada durante o lote espera a trava (em vez
+    de ser apagada pelo cascade sem ter entrado no arquivo).
+
+    Args:
+        before (datetime): Data limite da última mensagem (ou da criação)
+        batch_size (int): Conversas por transação
+        exclude (iterable): IDs que não devem ser arquivados
+
+    Returns:
+        dict: Conversas e mensagens arquivadas
+    """
+    candidates = Conversation.objects.annotate(
+        last_activity=Coalesce(Max('messages__created_at'), 'created_at')
+    ).filter(last_activity__lt=before).exclude(id__in=list(exclude)).order_by('id')
+
+    archived = messages_archived = 0
+    while True:
+        with transaction.atomic():
+            ids = list(candidates.values_list('id', flat=True)[:batch_size])
+            if not ids:
+                break
+            # FOR UPDATE não combina com o GROUP BY da anotação: trava pelos IDs
+            list(Conversation.objects.select_for_update().filter(id__in=ids).values_list('id', flat=True))
+            batch = list(candidates.filter(id__in=ids))
+            if not batch:
+                # Todas ficaram ativas entre a seleção e a trava
+                continue
+
+            by_conversation = {conversation.id: [] for conversation in batch}
+            for message in Message.objects.filter(conversation_id__in=by_conversation).order_by(
+                'conversation_id', 'created_at', 'id'
+            ).values('conversation_id', 'role', 'text', 'created_at'):
+                by_conversation[message['conversation_id']].append(message)
+
+            ArchivedConversation.objects.bulk_create([
+                ArchivedConversation(
+                    id=conversation.id,
+                    title=conversation.title,
+                    has_user_message=conversation.has_user_message,
+                    created_at=conversation.created_at,
+                    last_message_at=conversation.last_activity,
+                    message_count=len(by_conversation[conversation.id]),
+                    payload=pack_messages(by_conversation[conversation.id]),
+                )
+                for conversation in batch
+            ])
+            # O cascade para Message vira um único DELETE (sem carregar as linhas)
+            Conversation.objects.filter(id__in=by_conversation).delete()
+            page_cache.invalidate(by_conversation, conversation_list=True)
+
+        archived += len(batch)
+        messages_archived += sum(len(messages) for messages in by_conversation.values())
+
+    return {'conversations': archived, 'messages': messages_archived}
+
+
+def restore_conversation(conversation_id):
+    """
+    Devolve uma conversa arquivada às tabelas vivas
+
+    Args:
+        conversation_id (int): ID da conversa
+
+    Returns:
+        Conversation: Conversa restaurada ou None se não estiver arquivada
+    """
+    with transaction.atomic():
+        archived = ArchivedConversation.objects.select_for_update().filter(id=conversation_id).first()
+        if archived is None:
+            return None
+
+        conversation = Conversation.objects.create(
+            id=archived.id,
+            title=archived.title,
+            has_user_message=archived.has_user_message,
+            created_at=archived.created_at,
+        )
+        Message.objects.bulk_create([
+            Message(conversation=conversation, **message)
+            for message in unpack_messages(archived.payload)
+        ])
+        archived.delete()
+    return conversation
+
+
+def dedupe_error_replies(before=None):
+    """
+    Remove tentativas repetidas que falharam com o mesmo erro
+
+    Quando uma conversa tem a mesma pergunta seguida da mesma resposta
+    de erro várias vezes em sequência, mantém só a primeira troca.
+
+    Args:
+        before (datetime, optional): Considera apenas mensagens anteriores
+
+    Returns:
+        int: Número de mensagens removidas
+    """
+    conversations = Message.objects.filter(role='bot', text__startswith=ERROR_PREFIX)
+    if before is not None:
+        conversations = conversations.filter(created_at__lt=before)
+
+    messages = Message.objects.filter(
+        conversation_id__in=conversations.values('conversation_id')
+    ).order_by('conversation_id', 'created_at', 'id').values_list('id', 'conversation_id', 'role', 'text', 'created_at')
+
+    duplicates = []
+    changed = set()
+    previous_exchange = pending_user = None
+    current_conversation = None
+    for message_id, conversation_id, role, text, created_at in messages.iterator():
+        if conversation_id != current_conversation:
+            current_conversation = conversation_id
+            previous_exchange = pending_user = None
+
+        if role == 'user':
+            pending_user = (message_id, text)
+            continue
+
+        exchange = (pending_user[1] if pending_user else None, text)
+        is_old = before is None or created_at < before
+        if text.startswith(ERROR_PREFIX) and exchange == previous_exchange and is_old:
+            duplicates.append(message_id)
+            changed.add(conversation_id)
+            if pending_user:
+                duplicates.append(pending_user[0])
+        else:
+            previous_exchange = exchange
+        pending_user = None
+
+    for start in range(0, len(duplicates), 500):
+        Message.objects.filter(id__in=duplicates[start:start + 500]).delete()
+    page_cache.invalidate(changed)
+    return len(duplicates)
@@ -1,10 +1,25 @@
-import google.generativeai as genai
-import json
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.utils.functional import LazyObject, empty
 from .models import HomelabModel, ConversationModel
-import os
+from .response_cache import get_response_cache, make_key
+from .intent_router import IntentRouter
+from .prompt_builder import PromptBuilder, DEFAULT_TOKEN_BUDGET, estimate_tokens
+from .history import ConversationHistory
+from .single_flight import LeaderCancelled, SingleFlight
+from .llm_client import LLMUnavailable, ResilientClient
+from .llm_backends import get_llm_backend
+from .metrics import metrics
+import time
+import threading
 import logging
+from collections import namedtuple
 logger = logging.getLogger(__name__)
 
+# Snapshot imutável do contexto: uma requisição usa sempre o mesmo,
+# mesmo que os dados sejam recarregados no meio dela
+AgentContext = namedtuple('AgentContext', ['version', 'homelabs_data', 'prompt_builder'])
+
 class ChatAgent:
     """
     CONTROLLER - Camada de Controle (MVC)
@@ -15,73 +30,469 @@ class ChatAgent:
     """
     
     def __init__(self):
-        # Configuração da API do Gemini
-        self.api_key = os.getenv('GEMINI_API_KEY')
-        genai.configure(api_key=self.api_key)
-        
         # CONTROLLER: Usa os Models para acessar dados
         self.homelab_model = HomelabModel()  # Model para dados dos homelabs
         self.conversation_model = ConversationModel()  # Model para conversas
         
-        # Configura o modelo Gemini
-        self.model = genai.GenerativeModel('gemini-2.0-flash')
+        # Backend do modelo (Gemini, falso ou compatível com OpenAI, conforme
+        # POLDO_LLM_BACKEND), envolvido pelos limites de concorrência, taxa,
+        # prazo e pelo circuit breaker
+        client_config = getattr(settings, 'POLDO_LLM_CLIENT', {})
+        self.client = ResilientClient(
+            get_llm_backend(),
+            max_in_flight=client_config.get('MAX_IN_FLIGHT', 8),
+            rate=client_config.get('RATE', 5.0),
+            burst=client_config.get('BURST', 10),
+            timeout=client_config.get('TIMEOUT', 30.0),
+            deadline=client_config.get('DEADLINE', 60.0),
+            retries=client_config.get('RETRIES', 2),
+            backoff=client_config.get('BACKOFF', 0.5),
+            max_backoff=client_config.get('MAX_BACKOFF', 8.0),
+            breaker_threshold=client_config.get('BREAKER_THRESHOLD', 5),
+            breaker_reset=client_config.get('BREAKER_RESET', 30.0),
+        )
+        
+        # Cache de respostas: a chave inclui a versão dos dados dos homelabs
+        self.response_cache = get_response_cache()
+        
+        # Caminho rápido: consultas simples respondidas sem o Gemini
+        self.intent_router = IntentRouter(self.homelab_model)
+        
+        # Perguntas idênticas simultâneas compartilham uma única chamada ao Gemini
+        single_flight_config = getattr(settings, 'POLDO_SINGLE_FLIGHT', {})
+        self.single_flight = SingleFlight(
+            cross_process=single_flight_config.get('CROSS_PROCESS', False),
+            cache_alias=single_flight_config.get('CACHE_ALIAS', 'default'),
+            lock_timeout=single_flight_config.get('LOCK_TIMEOUT', 30.0),
+            poll_interval=single_flight_config.get('POLL_INTERVAL', 0.1),
+        )
         
-        # Carrega os dados dos homelabs para contexto
-        self.homelabs_data = self.homelab_model.get_all_homelabs()
+        # Histórico das conversas gravadas no banco (janela + resumo)
+        history_config = getattr(settings, 'POLDO_HISTORY', {})
+        self.conversation_history = ConversationHistory(
+            max_turns=history_config.get('MAX_TURNS', 6),
+            token_budget=history_config.get('TOKEN_BUDGET', 600),
+            summary_token_budget=history_config.get('SUMMARY_TOKEN_BUDGET', 200),
+        )
         
         # Cria o contexto inicial para o Gemini
         self._setup_context()
     
+    @property
+    def backend(self):
+        """Backend chamado pelo cliente resiliente (pode ser trocado, ex: em testes de carga)"""
+        return self.client.backend
+    
+    @backend.setter
+    def backend(self, backend):
+        self.client.backend = backend
+    
     def _setup_context(self):
         """Configura o contexto inicial com dados dos homelabs"""
-        homelabs_json = json.dumps(self.homelabs_data, indent=2, ensure_ascii=False)
+        self._context_lock = threading.Lock()
+        self._context = self.build_context(*self.homelab_model.get_versioned_data())
         
-        self.system_prompt = f"""
+        self.system_prompt = """
 Você é o Poldo, um assistente especializado em monitoramento de homelabs. 
 
-DADOS DOS HOMELABS DISPONÍVEIS:
-{homelabs_json}
-
 INSTRUÇÕES:
-1. Responda APENAS com base nos dados fornecidos acima
+1. Responda APENAS com base nos dados fornecidos abaixo (tabela CSV, uma linha por homelab e snapshot)
 2. Se o usuário perguntar sobre um homelab que não existe, informe os homelabs disponíveis
 3. Seja direto e objetivo nas respostas
 4. Use emojis quando apropriado para tornar as respostas mais amigáveis
 5. Se perguntarem sobre status completo, liste todas as métricas do homelab
 6. Se perguntarem sobre uma métrica específica, foque apenas nela
 7. Sempre responda em português brasileiro
+8. Quando houver vários snapshots, o valor atual é o do timestamp mais recente
 
 EXEMPLOS DE RESPOSTAS:
 - Para "qual a cpu do homelab-dev?": "🔍 homelab-dev - CPU: 45%"
 - Para "status do homelab-test": Liste todas as métricas do homelab-test
 - Para homelab inexistente: "❌ Homelab não encontrado. Homelabs disponíveis: homelab-dev, homelab-test, homelab-prod"
 """
-
-    def process_question(self, question):
+    
+    @staticmethod
+    def build_context(version, homelabs_data):
+        """
+        Cria o contexto derivado de uma versão dos dados dos homelabs
+        
+        A seção de dados do prompt é montada por pergunta (CSV filtrado e
+        limitado por orçamento de tokens) pelo PromptBuilder.
+        
+        Args:
+            version (str): Versão dos dados
+            homelabs_data: Dados dos homelabs
+            
+        Returns:
+            AgentContext: Contexto imutável
+        """
+        prompt_builder = PromptBuilder(
+            homelabs_data,
+            token_budget=getattr(settings, 'POLDO_PROMPT_TOKEN_BUDGET', DEFAULT_TOKEN_BUDGET)
+        )
+        return AgentContext(version, homelabs_data, prompt_builder)
+    
+    def get_context(self):
+        """
+        Retorna o contexto atual, reconstruindo-o se os dados mudaram
+        
+        Returns:
+            AgentContext: Snapshot a ser usado durante toda a requisição
+        """
+        context = self._context
+        version, data = self.homelab_model.get_versioned_data()
+        if version == context.version:
+            return context
+        
+        with self._context_lock:
+            if self._context.version != version:
+                logger.info("Dados dos homelabs mudaram (versão %s); reconstruindo contexto", version)
+                self._context = self.build_context(version, data)
+            return self._context
+    
+    async def aget_context(self):
+        """
+        Versão assíncrona de get_context
+        
+        Com os dados vindos do banco (POLDO_HOMELAB_SOURCE = 'db'), a
+        consulta roda fora do event loop via sync_to_async.
+        
+        Returns:
+            AgentContext: Snapshot a ser usado durante toda a requisição
+        """
+        if self.homelab_model.source == 'db':
+            return await sync_to_async(self.get_context)()
+        return self.get_context()
+    
+    def _build_prompt(self, context, question, history_context=''):
+        """
+        Monta o prompt completo para uma pergunta
+        
+        Args:
+            context (AgentContext): Snapshot dos dados da requisição
+            question (str): Pergunta do usuário
+            history_context (str): Histórico da conversa (opcional)
+            
+        Returns:
+            str: Prompt com instruções, dados relevantes, histórico e pergunta
+        """
+        data_section = context.prompt_builder.build_data_section(question)
+        homelabs = ', '.join(context.prompt_builder.hosts)
+        
+        prompt = (
+            f"{self.system_prompt}\n"
+            f"HOMELABS DISPONÍVEIS: {homelabs}\n\n"
+            f"DADOS DOS HOMELABS:\n{data_section}\n"
+        )
+        if history_context:
+            prompt += f"{history_context}\n"
+        return f"{prompt}PERGUNTA DO USUÁRIO: {question}"
+    
+    def _fast_answer(self, question, started):
+        """
+        Tenta responder pelo roteador de intenções
+        
+        Args:
+            question (str): Pergunta do usuário
+            started (float): Início da requisição (time.perf_counter)
+            
+        Returns:
+            str: Resposta do caminho rápido ou None
+        """
+        routed = self.intent_router.route(question)
+        if routed is None:
+            return None
+        self.intent_router.record(routed.route, time.perf_counter() - started)
+        return routed.answer
+    
+    def _degraded_answer(self, context, question, started):
+        """
+        Resposta determinística usada enquanto o modelo está indisponível
+        
+        Lista os valores mais recentes dos homelabs e métricas citados na
+        pergunta, direto dos dados, sem chamar o Gemini.
+        
+        Args:
+            context (AgentContext): Snapshot dos dados da requisição
+            question (str): Pergunta do usuário
+            started (float): Início da requisição (time.perf_counter)
+            
+        Returns:
+            str: Resposta em modo degradado
+        """
+        builder = context.prompt_builder
+        lines = ["⚠️ O assistente está sobrecarregado no momento. Dados mais recentes:"]
+        if builder.snapshots:
+            hosts, metrics = builder.select(question)
+            _, latest = builder.snapshots[-1]
+            for name in hosts:
+                if name in latest:
+                    values = ', '.join(
+                        f"{metric}: {latest[name][metric]}" for metric in metrics if metric in latest[name]
+                    )
+                    lines.append(f"🔍 {name} - {values}")
+        lines.append("\nTente novamente em instantes para uma resposta completa.")
+        self.intent_router.record('degraded', time.perf_counter() - started)
+        return '\n'.join(lines)
+    
+    def _generate(self, prompt, cache_key):
+        """
+        Chama o modelo e guarda a resposta no cache
+        
+        Args:
+            prompt (str): Prompt completo
+            cache_key (str): Chave do cache de respostas
+            
+        Returns:
+            str: Resposta do modelo
+        """
+        answer = self.client.generate(prompt).strip()
+        self._count_tokens(prompt, answer)
+        
+        # Apenas respostas bem-sucedidas vão para o cache
+        self.response_cache.set(cache_key, answer)
+        return answer
+    
+    async def _agenerate(self, prompt, cache_key):
+        """
+        Versão assíncrona de _generate
+        
+        Args:
+            prompt (str): Prompt completo
+            cache_key (str): Chave do cache de respostas
+            
+        Returns:
+            str: Resposta do modelo
+        """
+        answer = (await self.client.agenerate(prompt)).strip()
+        self._count_tokens(prompt, answer)
+        
+        await self.response_cache.aset(cache_key, answer)
+        return answer
+    
+    def _count_tokens(self, prompt, answer):
+        """
+        Soma os tokens estimados de uma chamada ao modelo nas métricas
+        
+        Registra só os tamanhos (o prompt tem vários KB e não vai para o log).
+        
+        Args:
+            prompt (str): Prompt enviado
+            answer (str): Resposta recebida
+        """
+        prompt_tokens, answer_tokens = estimate_tokens(prompt), estimate_tokens(answer)
+        backend = getattr(self.backend, 'name', None) or 'unknown'
+        metrics.inc('poldo_llm_prompt_tokens_total', prompt_tokens, backend=backend)
+        metrics.inc('poldo_llm_completion_tokens_total', answer_tokens, backend=backend)
+        logger.debug("Chamada ao modelo: ~%d tokens no prompt, ~%d na resposta", prompt_tokens, answer_tokens)
+    
+    async def _ahistory(self, conversation_id):
+        """
+        Busca o histórico de uma conversa fora do event loop
+        
+        Args:
+            conversation_id (int): ID da conversa ou None
+            
+        Returns:
+            str: Histórico formatado para o prompt
+        """
+        if not conversation_id:
+            return ''
+        return await sync_to_async(self.conversation_history.build)(conversation_id)
+    
+    def process_question(self, question, conversation_id=None):
         """
         Processa a pergunta do usuário usando Gemini AI e retorna uma resposta apropriada
         
         Args:
             question (str): Pergunta do usuário
+            conversation_id (int, optional): Conversa gravada no banco cujo
+                histórico acompanha a pergunta
             
         Returns:
             str: Resposta formatada pelo Gemini
         """
+        started = time.perf_counter()
+        with metrics.span('context'):
+            context = self.get_context()
+        
+        # Consultas simples de métrica são respondidas direto pelo Model
+        with metrics.span('fast_path'):
+            fast = self._fast_answer(question, started)
+        if fast is not None:
+            return fast
+        
+        # Histórico só é buscado quando a pergunta vai além do caminho rápido
+        with metrics.span('history'):
+            history = self.conversation_history.build(conversation_id) if conversation_id else ''
+        
+        # Respostas já geradas para a mesma pergunta, histórico e dados
+        with metrics.span('cache_lookup'):
+            cache_key = make_key(question, context.version, history)
+            cached = self.response_cache.get(cache_key)
+        if cached is not None:
+            self.intent_router.record('cache', time.perf_counter() - started)
+            return cached
+        
         try:
-            # Cria o prompt completo com contexto e pergunta
-            full_prompt = f"{self.system_prompt}\n\nPERGUNTA DO USUÁRIO: {question}"
+            # Cria o prompt completo com contexto, histórico e pergunta
+            with metrics.span('prompt_build'):
+                full_prompt = self._build_prompt(context, question, history)
             
-            # Gera resposta usando Gemini
-            logger.info(full_prompt)
-            response = self.model.generate_content(full_prompt)
-            logger.info(response.text.strip())
-            # Retorna a resposta do Gemini
-            return response.text.strip()
+            # Gera resposta usando Gemini (uma chamada por pergunta idêntica em andamento)
+            with metrics.span('llm'):
+                answer = self.single_flight.do(
+                    cache_key,
+                    lambda: self._generate(full_prompt, cache_key),
+                    lookup=lambda: self.response_cache.get(cache_key)
+                )
+            self.intent_router.record('llm', time.perf_counter() - started)
+            return answer
+            
+        except LLMUnavailable:
+            # Modelo sobrecarregado ou com circuit breaker aberto: responde na hora
+            return self._degraded_answer(context, question, started)
             
         except Exception as e:
             # Em caso de erro na API, retorna uma resposta de fallback
             return f"❌ Erro ao processar pergunta: {str(e)}\n\nPor favor, tente novamente ou verifique sua conexão."
     
+    async def aprocess_question(self, question, conversation_id=None):
+        """
+        Versão assíncrona de process_question para o caminho ASGI
+        
+        Usa a geração assíncrona do backend, então a chamada ao modelo não
+        prende uma thread do worker enquanto aguarda a resposta.
+        
+        Args:
+            question (str): Pergunta do usuário
+            conversation_id (int, optional): Conversa cujo histórico acompanha a pergunta
+            
+        Returns:
+            str: Resposta formatada pelo Gemini
+        """
+        started = time.perf_counter()
+        with metrics.span('context'):
+            context = await self.aget_context()
+        
+        with metrics.span('fast_path'):
+            fast = self._fast_answer(question, started)
+        if fast is not None:
+            return fast
+        
+        with metrics.span('history'):
+            history = await self._ahistory(conversation_id)
+        with metrics.span('cache_lookup'):
+            cache_key = make_key(question, context.version, history)
+            cached = await self.response_cache.aget(cache_key)
+        if cached is not None:
+            self.intent_router.record('cache', time.perf_counter() - started)
+            return cached
+        
+        try:
+            with metrics.span('prompt_build'):
+                full_prompt = self._build_prompt(context, question, history)
+            
+            with metrics.span('llm'):
+                answer = await self.single_flight.ado(
+                    cache_key,
+                    lambda: self._agenerate(full_prompt, cache_key),
+                    lookup=lambda: self.response_cache.aget(cache_key)
+                )
+            self.intent_router.record('llm', time.perf_counter() - started)
+            return answer
+            
+        except LLMUnavailable:
+            return self._degraded_answer(context, question, started)
+            
+        except Exception as e:
+            return f"❌ Erro ao processar pergunta: {str(e)}\n\nPor favor, tente novamente ou verifique sua conexão."
+    
+    async def astream_question(self, question, conversation_id=None):
+        """
+        Gera a resposta do Gemini em partes, conforme chegam do modelo
+        
+        Usa o streaming do backend e repassa cada trecho de texto assim
+        que ele é recebido.
+        
+        Args:
+            question (str): Pergunta do usuário
+            conversation_id (int, optional): Conversa cujo histórico acompanha a pergunta
+            
+        Yields:
+            str: Trechos da resposta do Gemini
+        """
+        started = time.perf_counter()
+        with metrics.span('context'):
+            context = await self.aget_context()
+        
+        with metrics.span('fast_path'):
+            fast = self._fast_answer(question, started)
+        if fast is not None:
+            yield fast
+            return
+        
+        with metrics.span('history'):
+            history = await self._ahistory(conversation_id)
+        with metrics.span('cache_lookup'):
+            cache_key = make_key(question, context.version, history)
+            cached = await self.response_cache.aget(cache_key)
+        if cached is not None:
+            self.intent_router.record('cache', time.perf_counter() - started)
+            yield cached
+            return
+        
+        # Mesma pergunta já em geração: recebe a resposta inteira do líder
+        while (pending := self.single_flight.follow(cache_key)) is not None:
+            try:
+                answer = await pending
+            except LeaderCancelled:
+                # O líder desconectou: tenta de novo (talvez como líder)
+                continue
+            except LLMUnavailable:
+                yield self._degraded_answer(context, question, started)
+                return
+            except Exception as e:
+                yield f"❌ Erro ao processar pergunta: {str(e)}\n\nPor favor, tente novamente ou verifique sua conexão."
+                return
+            self.intent_router.record('llm', time.perf_counter() - started)
+            yield answer
+            return
+        
+        flight = self.single_flight.lead(cache_key)
+        chunks = []
+        try:
+            with metrics.span('prompt_build'):
+                full_prompt = self._build_prompt(context, question, history)
+            
+            # Sem span: o tempo entre os trechos inclui o envio ao cliente
+            llm_started = time.perf_counter()
+            async for chunk in self.client.astream(full_prompt):
+                if not chunks:
+                    metrics.observe('poldo_stage_duration_seconds', time.perf_counter() - llm_started,
+                                    stage='llm_first_chunk')
+                chunks.append(chunk)
+                yield chunk
+            metrics.observe('poldo_stage_duration_seconds', time.perf_counter() - llm_started, stage='llm')
+            
+            answer = ''.join(chunks).strip()
+            self._count_tokens(full_prompt, answer)
+            await self.response_cache.aset(cache_key, answer)
+            self.single_flight.finish(cache_key, answer, future=flight)
+            self.intent_router.record('llm', time.perf_counter() - started)
+            
+        except LLMUnavailable as e:
+            self.single_flight.finish(cache_key, error=e, future=flight)
+            yield self._degraded_answer(context, question, started)
+            
+        except Exception as e:
+            self.single_flight.finish(cache_key, error=e, future=flight)
+            yield f"❌ Erro ao processar pergunta: {str(e)}\n\nPor favor, tente novamente ou verifique sua conexão."
+        finally:
+            # Cliente desconectou no meio do streaming: as seguidoras tentam
+            # de novo (sem efeito se o resultado já foi entregue acima)
+            self.single_flight.finish(cache_key, error=LeaderCancelled("Geração interrompida"), future=flight)
+    
     def process_question_with_history(self, question, conversation_id=None):
         """
         CONTROLLER: Processa a pergunta do usuário usando Models e Gemini AI
@@ -105,11 +516,10 @@ EXEMPLOS DE RESPOSTAS:
         
         try:
             # CONTROLLER: Cria o prompt completo com contexto e histórico
-            full_prompt = f"{self.system_prompt}\n\n{history_context}\n\nPERGUNTA DO USUÁRIO: {question}"
+            full_prompt = self._build_prompt(self.get_context(), question, history_context)
             
             # CONTROLLER: Gera resposta usando Gemini
-            response = self.model.generate_content(full_prompt)
-            answer = response.text.strip()
+            answer = self.client.generate(full_prompt).strip()
             
             # CONTROLLER: Usa o Model para adicionar resposta ao histórico
             self.conversation_model.add_message(conversation_id, 'bot', answer)
@@ -148,3 +558,36 @@ EXEMPLOS DE RESPOSTAS:
     def switch_conversation(self, conversation_id):
         """CONTROLLER: Delega para o Model"""
         return self.conversation_model.switch_conversation(conversation_id)
+
+
+class LazyChatAgent(LazyObject):
+    """
+    ChatAgent criado só no primeiro uso
+
+    Construir o ChatAgent carrega os dados dos homelabs e o SDK do modelo;
+    fazer isso na importação do controller atrasava o startup e a
+    criação de cada worker. O proxy repassa atributos (inclusive
+    atribuições e mock.patch) ao ChatAgent real, criado uma única vez
+    mesmo com várias threads chegando juntas.
+
+    Nas views assíncronas, chame asetup() antes do primeiro uso: a
+    construção lê os dados (no banco, com POLDO_HOMELAB_SOURCE = 'db'),
+    o que não pode rodar no event loop.
+    """
+
+    _lock = threading.Lock()
+
+    def _setup(self):
+        with self._lock:
+            if self._wrapped is empty:
+                self._wrapped = ChatAgent()
+
+    async def asetup(self):
+        """Cria o ChatAgent real fora do event loop, se ainda não existir"""
+        if self._wrapped is empty:
+            await sync_to_async(self._setup)()
+
+    @property
+    def is_ready(self):
+        """Indica se o ChatAgent real já foi criado"""
+        return self._wrapped is not empty
@@ -6,14 +6,84 @@ Este módulo contém a lógica de negócio e controle do sistema.
 processando as requisições e aplicando as regras de negócio.
 """
 
+import asyncio
+import hashlib
+import hmac
 import json
-from django.shortcuts import get_object_or_404
-from django.http import JsonResponse
-from .chat_agent import ChatAgent
-from .models import Conversation, Message
+import time
+from datetime import datetime, timedelta, timezone as dt_timezone
+from asgiref.sync import sync_to_async
+from django.db import transaction
+from django.db.models import Q
+from django.http import JsonResponse, StreamingHttpResponse
+from django.template.loader import render_to_string
+from django.urls import reverse
+from django.utils.functional import SimpleLazyObject
+from django.conf import settings
+from . import page_cache, search
+from .chat_agent import LazyChatAgent
+from .archive import restore_conversation
+from .ingest import sample_buffer
+from .jobs import JobQueue, QueueFull
+from .metrics import metrics, track_request
+from .models import ArchivedConversation, Conversation, Message
 
-# Instância global do ChatAgent (em produção usar cache ou banco de dados)
-chat_agent = ChatAgent()
+# Instância global do ChatAgent, criada na primeira requisição que a usa
+chat_agent = LazyChatAgent()
+
+# Fila de geração em segundo plano deste processo (as threads só são criadas no primeiro job)
+_jobs_config = getattr(settings, 'POLDO_JOBS', {})
+job_queue = JobQueue(
+    workers=_jobs_config.get('WORKERS', 4),
+    max_pending=_jobs_config.get('MAX_PENDING', 100),
+    max_per_key=_jobs_config.get('MAX_PER_CONVERSATION', 10),
+    result_ttl=_jobs_config.get('RESULT_TTL', 600),
+    cache_alias=_jobs_config.get('CACHE_ALIAS', 'default'),
+    lane_timeout=_jobs_config.get('LANE_TIMEOUT', 120),
+)
+
+# Intervalo entre leituras do cache ao esperar um job de outro worker
+JOB_POLL_INTERVAL = 0.25
+
+# Tamanho das páginas da barra lateral e do histórico de mensagens
+SIDEBAR_PAGE_SIZE = 30
+MESSAGE_PAGE_SIZE = 50
+
+# Tamanho máximo do texto da busca
+SEARCH_MAX_LENGTH = 200
+
+_EPOCH = datetime(1970, 1, 1, tzinfo=dt_timezone.utc)
+
+
+def encode_cursor(created_at, pk):
+    """
+    Codifica a posição (created_at, id) de uma linha como cursor opaco
+    
+    Args:
+        created_at (datetime): Data de criação da linha
+        pk (int): ID da linha
+        
+    Returns:
+        str: Cursor no formato "<microssegundos>_<id>"
+    """
+    return f"{(created_at - _EPOCH) // timedelta(microseconds=1)}_{pk}"
+
+
+def decode_cursor(cursor):
+    """
+    Decodifica um cursor gerado por encode_cursor
+    
+    Args:
+        cursor (str): Cursor recebido do cliente
+        
+    Returns:
+        tuple: (created_at, id)
+        
+    Raises:
+        ValueError: Se o cursor for inválido
+    """
+    micros, pk = cursor.split('_')
+    return _EPOCH + timedelta(microseconds=int(micros)), int(pk)
 
 
 class ChatController:
@@ -38,9 +108,11 @@ class ChatController:
         """
         if conversation_id:
             try:
-                return get_object_or_404(Conversation, id=conversation_id)
-            except:
+                conversation = Conversation.objects.filter(id=conversation_id).first()
+            except (TypeError, ValueError):
                 return None
+            # Conversas arquivadas voltam às tabelas vivas ao serem reabertas
+            return conversation or restore_conversation(conversation_id)
         
         return None
     
@@ -70,16 +142,239 @@ class ChatController:
         if not current_conversation:
             current_conversation = ChatController.create_new_conversation()
         
-        all_conversations = Conversation.objects.all()
-        chat_messages = current_conversation.messages.all()
+        # Apenas a primeira página de cada lista; o restante vem por AJAX.
+        # As consultas só rodam se o fragmento não estiver no cache
+        conversation_page = SimpleLazyObject(ChatController.get_conversation_page)
+        message_page = SimpleLazyObject(lambda: ChatController.get_message_page(current_conversation.id))
+        list_version, conversation_version = page_cache.get_versions(current_conversation.id)
         
         return {
             'current_conversation': current_conversation,
-            'all_conversations': all_conversations,
-            'chat_messages': chat_messages,
+            'all_conversations': SimpleLazyObject(lambda: conversation_page[0]),
+            'conversations_cursor': SimpleLazyObject(lambda: conversation_page[1]),
+            'chat_messages': SimpleLazyObject(lambda: message_page[0]),
+            'messages_cursor': SimpleLazyObject(lambda: message_page[1]),
+            'page_cache': dict(
+                page_cache.fragment_settings(), list_version=list_version, conversation_version=conversation_version
+            ),
             'show_result': False
         }
     
+    @staticmethod
+    def get_page_validators(request):
+        """
+        Calcula o ETag e o Last-Modified da página do chat
+        
+        Vêm das versões da lista de conversas e da conversa aberta, sem
+        consultas ao banco. A página traz o token CSRF, então o ETag também
+        depende do cookie CSRF; sem ele (primeira visita), ou sem conversa
+        escolhida, não há GET condicional.
+        
+        Args:
+            request: Objeto request do Django
+            
+        Returns:
+            tuple: (ETag, Last-Modified) ou (None, None)
+        """
+        if hasattr(request, '_poldo_page_validators'):
+            return request._poldo_page_validators
+        
+        validators = (None, None)
+        conversation_id = request.GET.get('conversation_id', '')
+        csrf_cookie = request.COOKIES.get(settings.CSRF_COOKIE_NAME)
+        if page_cache.is_enabled() and conversation_id.isdigit() and csrf_cookie:
+            list_version, conversation_version = page_cache.get_versions(int(conversation_id))
+            etag = hashlib.sha256(
+                f"{conversation_id}:{list_version!r}:{conversation_version!r}:{csrf_cookie}".encode()
+            ).hexdigest()[:32]
+            last_modified = datetime.fromtimestamp(max(list_version, conversation_version), tz=dt_timezone.utc)
+            validators = (etag, last_modified)
+        
+        request._poldo_page_validators = validators
+        return validators
+    
+    @staticmethod
+    def get_conversation_page(cursor=None, limit=SIDEBAR_PAGE_SIZE):
+        """
+        Obtém uma página da lista de conversas (mais recentes primeiro)
+        
+        Paginação por cursor (keyset) sobre (created_at, id): o custo não
+        cresce com o número de páginas. Carrega apenas id, título e data.
+        
+        Args:
+            cursor (str, optional): Cursor da página anterior
+            limit (int): Tamanho da página
+            
+        Returns:
+            tuple: (conversas, cursor da próxima página ou None)
+        """
+        return ChatController._keyset_page(Conversation.objects.all(), cursor, limit)
+    
+    @staticmethod
+    def get_archived_page(cursor=None, limit=SIDEBAR_PAGE_SIZE):
+        """
+        Obtém uma página da lista de conversas arquivadas
+        
+        Args:
+            cursor (str, optional): Cursor da página anterior
+            limit (int): Tamanho da página
+            
+        Returns:
+            tuple: (conversas arquivadas, cursor da próxima página ou None)
+        """
+        return ChatController._keyset_page(ArchivedConversation.objects.all(), cursor, limit)
+    
+    @staticmethod
+    def _keyset_page(queryset, cursor, limit):
+        """Página por (created_at, id) decrescentes, só com id, título e data"""
+        queryset = queryset.only('id', 'title', 'created_at').order_by('-created_at', '-id')
+        if cursor:
+            created_at, pk = decode_cursor(cursor)
+            queryset = queryset.filter(Q(created_at__lt=created_at) | Q(created_at=created_at, id__lt=pk))
+        
+        conversations = list(queryset[:limit + 1])
+        next_cursor = None
+        if len(conversations) > limit:
+            conversations = conversations[:limit]
+            next_cursor = encode_cursor(conversations[-1].created_at, conversations[-1].id)
+        return conversations, next_cursor
+    
+    @staticmethod
+    def get_message_page(conversation_id, cursor=None, limit=MESSAGE_PAGE_SIZE):
+        """
+        Obtém uma página de mensagens de uma conversa
+        
+        Busca as mensagens mais recentes (ou as anteriores ao cursor) pelo
+        índice (conversation, created_at) e devolve em ordem cronológica.
+        
+        Args:
+            conversation_id (int): ID da conversa
+            cursor (str, optional): Cursor da mensagem mais antiga já exibida
+            limit (int): Tamanho da página
+            
+        Returns:
+            tuple: (mensagens como dicts, cursor das anteriores ou None)
+        """
+        queryset = Message.objects.filter(conversation_id=conversation_id).order_by(
+            '-created_at', '-id'
+        ).values('id', 'role', 'text', 'created_at')
+        if cursor:
+            created_at, pk = decode_cursor(cursor)
+            queryset = queryset.filter(Q(created_at__lt=created_at) | Q(created_at=created_at, id__lt=pk))
+        
+        chat_messages = list(queryset[:limit + 1])
+        next_cursor = None
+        if len(chat_messages) > limit:
+            chat_messages = chat_messages[:limit]
+            next_cursor = encode_cursor(chat_messages[-1]['created_at'], chat_messages[-1]['id'])
+        chat_messages.reverse()
+        return chat_messages, next_cursor
+    
+    @staticmethod
+    def handle_conversation_page_request(request):
+        """
+        Manipula o pedido de mais conversas para a barra lateral (AJAX)
+        
+        Com archived=1, lista as conversas arquivadas (reabertas ao clicar).
+        
+        Args:
+            request: Objeto request do Django
+            
+        Returns:
+            JsonResponse: HTML dos itens e cursor da próxima página
+        """
+        archived = request.GET.get('archived') == '1'
+        get_page = ChatController.get_archived_page if archived else ChatController.get_conversation_page
+        try:
+            conversations, next_cursor = get_page(request.GET.get('cursor'))
+        except ValueError:
+            return JsonResponse({
+                'ok': False,
+                'error': 'Cursor inválido'
+            }, status=400)
+        
+        html = render_to_string('agent/_conversation_items.html', {
+            'all_conversations': conversations,
+            'current_conversation_id': request.GET.get('current'),
+        })
+        return JsonResponse({
+            'ok': True,
+            'html': html,
+            'next_cursor': next_cursor
+        })
+    
+    @staticmethod
+    def handle_message_page_request(request, conversation_id):
+        """
+        Manipula o pedido de mensagens anteriores de uma conversa (AJAX)
+        
+        Args:
+            request: Objeto request do Django
+            conversation_id (int): ID da conversa
+            
+        Returns:
+            JsonResponse: HTML das mensagens e cursor das anteriores
+        """
+        try:
+            chat_messages, next_cursor = ChatController.get_message_page(
+                conversation_id, request.GET.get('cursor')
+            )
+        except ValueError:
+            return JsonResponse({
+                'ok': False,
+                'error': 'Cursor inválido'
+            }, status=400)
+        
+        html = render_to_string('agent/_message_items.html', {'chat_messages': chat_messages})
+        return JsonResponse({
+            'ok': True,
+            'html': html,
+            'next_cursor': next_cursor
+        })
+    
+    @staticmethod
+    def handle_search_request(request):
+        """
+        Manipula a busca nas mensagens das conversas (AJAX)
+        
+        Args:
+            request: Objeto request do Django (parâmetro q)
+            
+        Returns:
+            JsonResponse: HTML dos resultados para a barra lateral e os
+                resultados em JSON (conversa, mensagem, papel e trecho)
+        """
+        query = request.GET.get('q', '').strip()
+        if len(query) > SEARCH_MAX_LENGTH:
+            return JsonResponse({
+                'ok': False,
+                'error': f'Busca muito longa (máximo {SEARCH_MAX_LENGTH} caracteres)'
+            }, status=400)
+        
+        with track_request('search'):
+            with metrics.span('search'):
+                results = search.search_messages(query)
+            html = render_to_string('agent/_search_results.html', {
+                'results': results,
+                'query': query,
+                'current_conversation_id': request.GET.get('current'),
+            })
+        return JsonResponse({
+            'ok': True,
+            'html': html,
+            'results': [
+                {
+                    'conversation_id': result.message.conversation_id,
+                    'conversation_title': result.message.conversation.title,
+                    'message_id': result.message.id,
+                    'role': result.message.role,
+                    'created_at': result.message.created_at.isoformat(),
+                    'snippet': result.snippet,
+                }
+                for result in results
+            ]
+        })
+    
     @staticmethod
     def process_message(question, conversation_id=None):
         """
@@ -92,35 +387,87 @@ class ChatController:
         Returns:
             dict: Resultado do processamento com HTML das mensagens
         """
-        # Obtém ou cria a conversa
-        conversation = ChatController.get_or_create_conversation(conversation_id)
+        # Obtém a conversa (uma nova é criada junto com as mensagens)
+        with metrics.span('db_read'):
+            conversation = ChatController.get_or_create_conversation(conversation_id)
         
-        if not conversation:
-            conversation = ChatController.create_new_conversation()
+        # Processa a pergunta usando o ChatAgent, fora de qualquer transação
+        with metrics.span('agent'):
+            answer = chat_agent.process_question(
+                question, conversation.id if conversation else None
+            )
         
-        # Cria mensagem do usuário
-        user_message = Message.objects.create(
-            conversation=conversation,
-            role='user',
-            text=question
-        )
+        # Grava pergunta e resposta de uma vez
+        with metrics.span('db_write'):
+            conversation, user_message, bot_message = ChatController._save_exchange(
+                conversation, question, answer
+            )
+        
+        # Gera HTML das mensagens
+        with metrics.span('render'):
+            user_html = f'<div class="message-bubble user">{user_message.text}</div>'
+            bot_html = f'<div class="message-bubble bot">{bot_message.text}</div>'
+        
+        return {
+            'ok': True,
+            'conversation_id': conversation.id,
+            'user_html': user_html,
+            'bot_html': bot_html
+        }
+    
+    @staticmethod
+    async def aget_or_create_conversation(conversation_id=None):
+        """
+        Versão assíncrona de get_or_create_conversation
         
-        # Atualiza o título da conversa se for a primeira mensagem do usuário
-        ChatController._update_conversation_title(conversation, question)
+        Args:
+            conversation_id (int, optional): ID da conversa
+            
+        Returns:
+            Conversation: Objeto da conversa ou None
+        """
+        if conversation_id:
+            try:
+                conversation = await Conversation.objects.filter(id=conversation_id).afirst()
+            except (TypeError, ValueError):
+                return None
+            return conversation or await sync_to_async(restore_conversation)(conversation_id)
         
-        # Processa a pergunta usando o ChatAgent
-        answer = chat_agent.process_question(question)
+        return None
+    
+    @staticmethod
+    async def aprocess_message(question, conversation_id=None):
+        """
+        Versão assíncrona de process_message para o caminho ASGI
         
-        # Cria mensagem do bot
-        bot_message = Message.objects.create(
-            conversation=conversation,
-            role='bot',
-            text=answer
-        )
+        A chamada ao modelo usa ChatAgent.aprocess_question e a gravação
+        (uma transação) roda fora do event loop via sync_to_async, então o
+        event loop segue livre para outras conversas durante a geração.
         
-        # Gera HTML das mensagens
-        user_html = f'<div class="message-bubble user">{user_message.text}</div>'
-        bot_html = f'<div class="message-bubble bot">{bot_message.text}</div>'
+        Args:
+            question (str): Pergunta do usuário
+            conversation_id (int, optional): ID da conversa
+            
+        Returns:
+            dict: Resultado do processamento com HTML das mensagens
+        """
+        with metrics.span('db_read'):
+            conversation = await ChatController.aget_or_create_conversation(conversation_id)
+        
+        with metrics.span('agent'):
+            await chat_agent.asetup()
+            answer = await chat_agent.aprocess_question(
+                question, conversation.id if conversation else None
+            )
+        
+        with metrics.span('db_write'):
+            conversation, user_message, bot_message = await sync_to_async(ChatController._save_exchange)(
+                conversation, question, answer
+            )
+        
+        with metrics.span('render'):
+            user_html = f'<div class="message-bubble user">{user_message.text}</div>'
+            bot_html = f'<div class="message-bubble bot">{bot_message.text}</div>'
         
         return {
             'ok': True,
@@ -130,18 +477,331 @@ class ChatController:
         }
     
     @staticmethod
-    def _update_conversation_title(conversation, question):
+    def _job_accepted(job, conversation, question):
+        """Resposta 202 de um job enfileirado"""
+        return {
+            'ok': True,
+            'job_id': job.id,
+            'status': job.status,
+            'status_url': reverse('agent:job_status', args=[job.id]),
+            'conversation_id': conversation.id,
+            'user_html': f'<div class="message-bubble user">{question}</div>'
+        }
+    
+    @staticmethod
+    def enqueue_message(question, conversation_id=None):
+        """
+        Enfileira a geração da resposta e retorna na hora
+        
+        A conversa é criada antes (o cliente recebe o ID junto com o do
+        job) e serve de chave da fila: as mensagens de uma conversa são
+        respondidas na ordem de envio.
+        
+        Args:
+            question (str): Pergunta do usuário
+            conversation_id (int, optional): ID da conversa
+            
+        Returns:
+            dict: ID e URL de consulta do job, ID da conversa e HTML da pergunta
+            
+        Raises:
+            QueueFull: Se a fila de geração está cheia
+        """
+        conversation = ChatController.get_or_create_conversation(conversation_id)
+        if not conversation:
+            conversation = Conversation.objects.create(title="Nova Conversa")
+        
+        job = job_queue.submit(conversation.id, ChatController.process_message, question, conversation.id)
+        return ChatController._job_accepted(job, conversation, question)
+    
+    @staticmethod
+    async def aenqueue_message(question, conversation_id=None):
         """
-        Atualiza o título da conversa baseado na primeira pergunta
+        Versão assíncrona de enqueue_message
         
         Args:
-            conversation (Conversation): Objeto da conversa
             question (str): Pergunta do usuário
+            conversation_id (int, optional): ID da conversa
+            
+        Returns:
+            dict: ID e URL de consulta do job, ID da conversa e HTML da pergunta
         """
-        if conversation.messages.filter(role='user').count() == 1:
-            title = question[:40] + "..." if len(question) > 40 else question
-            conversation.title = title
-            conversation.save()
+        conversation = await ChatController.aget_or_create_conversation(conversation_id)
+        if not conversation:
+            conversation = await Conversation.objects.acreate(title="Nova Conversa")
+        
+        job = job_queue.submit(conversation.id, ChatController.process_message, question, conversation.id)
+        return ChatController._job_accepted(job, conversation, question)
+    
+    @staticmethod
+    def wants_async(request, data):
+        """
+        Indica se o cliente pediu a resposta em segundo plano
+        
+        Args:
+            request: Objeto request do Django
+            data (dict): Corpo JSON da requisição
+            
+        Sem um cache que chegue a todos os workers (ver JobQueue.available),
+        o pedido é ignorado e a resposta sai na mesma requisição: a
+        consulta do job poderia cair em outro worker e não encontrá-lo.
+        
+        Returns:
+            bool: True com "Prefer: respond-async" (RFC 7240) ou "async": true
+        """
+        requested = data.get('async') is True or 'respond-async' in request.headers.get('Prefer', '')
+        return requested and job_queue.available()
+    
+    @staticmethod
+    def _queue_full_response():
+        """Resposta 503 com Retry-After quando a fila de geração está cheia"""
+        return JsonResponse({
+            'ok': False,
+            'error': 'Muitas mensagens sendo respondidas agora. Tente novamente em instantes.'
+        }, status=503, headers={'Retry-After': str(_jobs_config.get('RETRY_AFTER', 2))})
+    
+    @staticmethod
+    async def ahandle_job_request(request, job_id):
+        """
+        Manipula a consulta do estado de um job de geração
+        
+        Com ?wait=N, espera até N segundos (limitado por
+        POLDO_JOBS['MAX_WAIT']) o job terminar antes de responder, sem
+        ocupar uma thread durante a espera.
+        
+        Args:
+            request: Objeto request do Django
+            job_id (str): ID do job
+            
+        Returns:
+            JsonResponse: Estado do job (queued, running, done ou error) e,
+                quando terminado, o resultado de process_message
+        """
+        try:
+            wait = min(max(float(request.GET.get('wait', 0)), 0.0), _jobs_config.get('MAX_WAIT', 25))
+        except ValueError:
+            return JsonResponse({
+                'ok': False,
+                'error': 'Parâmetro wait inválido'
+            }, status=400)
+        
+        job = job_queue.get(job_id)
+        if job is not None and wait and not job.done.is_set():
+            loop = asyncio.get_running_loop()
+            finished = loop.create_future()
+            
+            def wake():
+                # Chamado na thread do worker; o loop pode já ter desistido (timeout)
+                if not loop.is_closed():
+                    loop.call_soon_threadsafe(lambda: finished.done() or finished.set_result(None))
+            
+            job.add_done_callback(wake)
+            try:
+                await asyncio.wait_for(finished, wait)
+            except asyncio.TimeoutError:
+                pass
+        
+        state = await job_queue.aget_state(job_id)
+        if job is None and wait:
+            # Job de outro worker: acompanha o estado no cache compartilhado
+            ends_at = time.monotonic() + wait
+            while state is not None and state['status'] in ('queued', 'running') and time.monotonic() < ends_at:
+                await asyncio.sleep(JOB_POLL_INTERVAL)
+                state = await job_queue.aget_state(job_id)
+        
+        if state is None:
+            return JsonResponse({
+                'ok': False,
+                'error': 'Job não encontrado'
+            }, status=404)
+        return JsonResponse({'ok': state['status'] != 'error', **state})
+    
+    @staticmethod
+    async def astream_message(question, conversation_id=None):
+        """
+        Processa uma mensagem enviando a resposta em partes (Server-Sent Events)
+        
+        Emite um evento "start" com a mensagem do usuário, um evento de
+        dados para cada trecho gerado pelo modelo e um evento "done" ao
+        final. Pergunta e resposta são gravadas juntas, uma única vez, no fim.
+        
+        Args:
+            question (str): Pergunta do usuário
+            conversation_id (int, optional): ID da conversa
+            
+        Yields:
+            str: Eventos SSE já formatados
+        """
+        conversation = await ChatController.aget_or_create_conversation(conversation_id)
+        
+        # O cliente precisa do ID da conversa já no primeiro evento
+        if not conversation:
+            conversation = await Conversation.objects.acreate(title="Nova Conversa")
+        
+        yield ChatController._sse({
+            'conversation_id': conversation.id,
+            'user_html': f'<div class="message-bubble user">{question}</div>'
+        }, event='start')
+        
+        await chat_agent.asetup()
+        chunks = []
+        async for chunk in chat_agent.astream_question(question, conversation.id):
+            chunks.append(chunk)
+            yield ChatController._sse({'text': chunk})
+        
+        conversation, user_message, bot_message = await sync_to_async(ChatController._save_exchange)(
+            conversation, question, ''.join(chunks).strip()
+        )
+        
+        yield ChatController._sse({
+            'conversation_id': conversation.id,
+            'bot_html': f'<div class="message-bubble bot">{bot_message.text}</div>'
+        }, event='done')
+    
+    @staticmethod
+    def _sse(data, event=None):
+        """
+        Formata um evento Server-Sent Events com payload JSON
+        
+        Args:
+            data (dict): Dados do evento
+            event (str, optional): Nome do evento
+            
+        Returns:
+            str: Evento SSE pronto para envio
+        """
+        payload = json.dumps(data, ensure_ascii=False)
+        if event:
+            return f"event: {event}\ndata: {payload}\n\n"
+        return f"data: {payload}\n\n"
+    
+    @staticmethod
+    def _save_exchange(conversation, question, answer):
+        """
+        Grava a pergunta e a resposta em uma única transação
+        
+        As duas mensagens entram em um único bulk_create. O título é
+        definido na primeira pergunta sem COUNT: a flag has_user_message
+        da conversa diz se ela já recebeu alguma pergunta.
+        
+        Args:
+            conversation (Conversation): Conversa ou None para criar uma nova
+            question (str): Pergunta do usuário
+            answer (str): Resposta do bot
+            
+        Returns:
+            tuple: (conversa, mensagem do usuário, mensagem do bot)
+        """
+        title = ChatController._title_for(question)
+        title_changed = False
+        
+        with transaction.atomic():
+            if conversation is None:
+                conversation = Conversation.objects.create(title=title, has_user_message=True)
+            elif not conversation.has_user_message:
+                # Só a primeira pergunta atualiza o título (o filtro evita corrida)
+                Conversation.objects.filter(pk=conversation.pk, has_user_message=False).update(
+                    title=title, has_user_message=True
+                )
+                conversation.title = title
+                conversation.has_user_message = True
+                title_changed = True
+            
+            user_message, bot_message = Message.objects.bulk_create([
+                Message(conversation=conversation, role='user', text=question),
+                Message(conversation=conversation, role='bot', text=answer),
+            ])
+            
+            # bulk_create e update não disparam post_save: invalida a página aqui
+            page_cache.invalidate([conversation.id], conversation_list=title_changed)
+        
+        return conversation, user_message, bot_message
+    
+    @staticmethod
+    def _title_for(question):
+        """
+        Gera o título da conversa baseado na primeira pergunta
+        
+        Args:
+            question (str): Pergunta do usuário
+            
+        Returns:
+            str: Título (até 40 caracteres)
+        """
+        return question[:40] + "..." if len(question) > 40 else question
+    
+    @staticmethod
+    def get_stats():
+        """
+        Retorna os contadores de monitoramento do ChatAgent
+        
+        Returns:
+            dict: Estatísticas do cache de respostas, do roteador de intenções,
+                da coalescência, do cliente do modelo, a versão dos dados e a fila de geração
+        """
+        return {
+            'response_cache': chat_agent.response_cache.stats(),
+            'intent_router': chat_agent.intent_router.stats(),
+            'single_flight': chat_agent.single_flight.stats(),
+            'llm_client': chat_agent.client.stats(),
+            'homelab_data': chat_agent.homelab_model.stats(),
+            'jobs': job_queue.stats(),
+        }
+    
+    @staticmethod
+    def get_metrics():
+        """
+        Gera as métricas no formato de texto do Prometheus
+        
+        Junta os histogramas por etapa e por requisição com a profundidade
+        da fila de geração e os contadores do ChatAgent (cache, caminho
+        rápido, coalescência e cliente do modelo). Não cria o ChatAgent se
+        ele ainda não foi usado.
+        
+        Returns:
+            str: Métricas em texto
+        """
+        jobs = job_queue.stats()
+        gauges = [
+            ('poldo_job_queue_depth', {}, jobs['queued'], 'Jobs de geração esperando na fila'),
+            ('poldo_job_running', {}, jobs['running'], 'Jobs de geração rodando'),
+            ('poldo_job_queue_capacity', {}, jobs['max_pending'], 'Máximo de jobs de geração pendentes'),
+            ('poldo_job_rejected', {}, jobs['rejected'], 'Jobs recusados com a fila cheia'),
+            ('poldo_job_failed', {}, jobs['failed'], 'Jobs de geração que falharam'),
+        ]
+        if chat_agent.is_ready:
+            stats = ChatController.get_stats()
+            cache = stats['response_cache']
+            router = stats['intent_router']
+            flight = stats['single_flight']
+            client = stats['llm_client']
+            backend = {'backend': cache['backend']}
+            gauges += [
+                ('poldo_response_cache_hits', backend, cache['hits'], 'Acertos do cache de respostas'),
+                ('poldo_response_cache_misses', backend, cache['misses'], 'Falhas do cache de respostas'),
+                ('poldo_response_cache_hit_ratio', backend, cache['hit_rate'], 'Taxa de acerto do cache de respostas'),
+                ('poldo_fast_path_hit_ratio', {}, router['fast_path_hit_rate'],
+                 'Fração das perguntas respondidas sem o modelo'),
+                ('poldo_single_flight_coalesced', {}, flight['coalesced'],
+                 'Chamadas ao modelo evitadas por coalescência'),
+                ('poldo_llm_in_flight', {}, client['in_flight'], 'Chamadas ao modelo em andamento'),
+                ('poldo_llm_calls', {}, client['calls'], 'Chamadas (tentativas) ao modelo'),
+                ('poldo_llm_failures', {}, client['failures'], 'Falhas nas chamadas ao modelo'),
+                ('poldo_llm_rejected', {}, client['rejected'], 'Chamadas recusadas pelos limites ou pelo breaker'),
+                ('poldo_llm_breaker_open', {}, int(client['breaker_state'] != 'closed'),
+                 'Circuit breaker do modelo aberto (1) ou fechado (0)'),
+            ]
+            shared = stats['homelab_data']['shared']
+            if shared and shared['generation'] is not None:
+                gauges.append(('poldo_shared_snapshot_generation', {}, shared['generation'],
+                               'Geração do snapshot compartilhado mapeada por este worker'))
+                gauges.append(('poldo_shared_snapshot_age_seconds', {}, shared['age'],
+                               'Segundos desde a última publicação do snapshot compartilhado'))
+            gauges += [
+                ('poldo_route_requests', {'route': route}, entry['count'], 'Perguntas respondidas por rota')
+                for route, entry in sorted(router['routes'].items())
+            ]
+        return metrics.render(gauges)
     
     @staticmethod
     def validate_message_data(data):
@@ -178,22 +838,80 @@ class ChatController:
             JsonResponse: Resposta JSON com resultado
         """
         try:
-            # Parse do JSON
-            data = json.loads(request.body)
-            
-            # Valida os dados
-            is_valid, question, conversation_id, error = ChatController.validate_message_data(data)
-            
-            if not is_valid:
-                return JsonResponse({
-                    'ok': False,
-                    'error': error
-                }, status=400)
+            with track_request('send_message'):
+                # Parse do JSON
+                with metrics.span('parse'):
+                    data = json.loads(request.body)
+                
+                # Valida os dados
+                with metrics.span('validate'):
+                    is_valid, question, conversation_id, error = ChatController.validate_message_data(data)
+                
+                if not is_valid:
+                    return JsonResponse({
+                        'ok': False,
+                        'error': error
+                    }, status=400)
+                
+                # Em segundo plano, se o cliente pediu: responde já com o ID do job
+                if ChatController.wants_async(request, data):
+                    try:
+                        return JsonResponse(ChatController.enqueue_message(question, conversation_id), status=202)
+                    except QueueFull:
+                        return ChatController._queue_full_response()
+                
+                # Processa a mensagem
+                result = ChatController.process_message(question, conversation_id)
+                
+                with metrics.span('response'):
+                    return JsonResponse(result)
             
-            # Processa a mensagem
-            result = ChatController.process_message(question, conversation_id)
+        except json.JSONDecodeError:
+            return JsonResponse({
+                'ok': False,
+                'error': 'JSON inválido'
+            }, status=400)
+        except Exception as e:
+            return JsonResponse({
+                'ok': False,
+                'error': f'Erro interno: {str(e)}'
+            }, status=500)
+    
+    @staticmethod
+    async def ahandle_send_message_request(request):
+        """
+        Versão assíncrona de handle_send_message_request (ASGI)
+        
+        Args:
+            request: Objeto request do Django
             
-            return JsonResponse(result)
+        Returns:
+            JsonResponse: Resposta JSON com resultado
+        """
+        try:
+            with track_request('send_message'):
+                with metrics.span('parse'):
+                    data = json.loads(request.body)
+                
+                with metrics.span('validate'):
+                    is_valid, question, conversation_id, error = ChatController.validate_message_data(data)
+                
+                if not is_valid:
+                    return JsonResponse({
+                        'ok': False,
+                        'error': error
+                    }, status=400)
+                
+                if ChatController.wants_async(request, data):
+                    try:
+                        return JsonResponse(await ChatController.aenqueue_message(question, conversation_id), status=202)
+                    except QueueFull:
+                        return ChatController._queue_full_response()
+                
+                result = await ChatController.aprocess_message(question, conversation_id)
+                
+                with metrics.span('response'):
+                    return JsonResponse(result)
             
         except json.JSONDecodeError:
             return JsonResponse({
@@ -205,3 +923,113 @@ class ChatController:
                 'ok': False,
                 'error': f'Erro interno: {str(e)}'
             }, status=500)
+    
+    @staticmethod
+    async def ahandle_stream_message_request(request):
+        """
+        Manipula a requisição de envio de mensagem com resposta em streaming
+        
+        Args:
+            request: Objeto request do Django
+            
+        Returns:
+            StreamingHttpResponse: Fluxo text/event-stream com a resposta,
+            ou JsonResponse em caso de erro de validação
+        """
+        try:
+            data = json.loads(request.body)
+        except json.JSONDecodeError:
+            return JsonResponse({
+                'ok': False,
+                'error': 'JSON inválido'
+            }, status=400)
+        
+        is_valid, question, conversation_id, error = ChatController.validate_message_data(data)
+        
+        if not is_valid:
+            return JsonResponse({
+                'ok': False,
+                'error': error
+            }, status=400)
+        
+        response = StreamingHttpResponse(
+            ChatController.astream_message(question, conversation_id),
+            content_type='text/event-stream'
+        )
+        response['Cache-Control'] = 'no-cache'
+        response['X-Accel-Buffering'] = 'no'
+        return response
+
+
+class IngestController:
+    """
+    CONTROLLER - Recebe snapshots de métricas dos coletores
+    
+    Valida a requisição e entrega os snapshots ao buffer de ingestão,
+    que grava no banco em lotes.
+    """
+    
+    @staticmethod
+    def parse_snapshots(data):
+        """
+        Extrai a lista de snapshots do corpo da requisição
+        
+        Aceita uma lista de snapshots, {"snapshots": [...]} ou um único
+        snapshot.
+        
+        Args:
+            data: Corpo JSON já decodificado
+            
+        Returns:
+            list: Lista de snapshots
+        """
+        if isinstance(data, dict):
+            data = data.get('snapshots', [data])
+        if not isinstance(data, list) or not all(isinstance(item, dict) for item in data):
+            raise ValueError('Formato inválido: envie uma lista de snapshots')
+        return data
+    
+    @staticmethod
+    def handle_ingest_request(request):
+        """
+        Manipula o envio de snapshots de métricas
+        
+        Args:
+            request: Objeto request do Django
+            
+        Returns:
+            JsonResponse: Número de amostras aceitas (202) ou erro
+        """
+        config = getattr(settings, 'POLDO_INGEST', {})
+        token = config.get('TOKEN')
+        if not token and not config.get('ALLOW_ANONYMOUS'):
+            # Endpoint sem CSRF: sem token, qualquer um gravaria métricas
+            return JsonResponse({
+                'ok': False,
+                'error': 'Ingestão desabilitada: defina POLDO_INGEST_TOKEN'
+            }, status=403)
+        if token and not hmac.compare_digest(request.headers.get('Authorization', ''), f'Bearer {token}'):
+            return JsonResponse({
+                'ok': False,
+                'error': 'Não autorizado'
+            }, status=401)
+        
+        try:
+            snapshots = IngestController.parse_snapshots(json.loads(request.body))
+            accepted = sample_buffer.add_snapshots(snapshots)
+        except json.JSONDecodeError:
+            return JsonResponse({
+                'ok': False,
+                'error': 'JSON inválido'
+            }, status=400)
+        except ValueError as e:
+            return JsonResponse({
+                'ok': False,
+                'error': str(e)
+            }, status=400)
+        
+        return JsonResponse({
+            'ok': True,
+            'snapshots': len(snapshots),
+            'samples': accepted
+        }, status=202)
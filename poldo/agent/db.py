@@ -0,0 +1,44 @@
+"""
+Ajustes das conexões com o banco de dados
+
+Toda nova conexão SQLite recebe os PRAGMAs de POLDO_SQLITE_PRAGMAS:
+WAL (leitores não bloqueiam o escritor), synchronous=NORMAL (um fsync por
+checkpoint em vez de um por commit), busy_timeout (espera o lock em vez
+de falhar com "database is locked") e mmap_size (leituras sem cópia).
+
+Toda conexão (qualquer banco) recebe o contador de consultas por
+requisição de agent/metrics.py.
+"""
+
+from django.conf import settings
+from django.db.backends.signals import connection_created
+
+from .metrics import install_query_counter
+
+# PRAGMAs que só valem para arquivos (bancos em memória os ignoram)
+_FILE_ONLY = {'journal_mode', 'mmap_size'}
+
+
+def configure_sqlite(sender, connection, **kwargs):
+    """
+    Aplica os PRAGMAs configurados a uma nova conexão SQLite
+
+    Args:
+        sender: Classe do backend que criou a conexão
+        connection: Conexão Django recém-criada
+    """
+    if connection.vendor != 'sqlite':
+        return
+
+    in_memory = connection.is_in_memory_db()
+    with connection.cursor() as cursor:
+        for name, value in getattr(settings, 'POLDO_SQLITE_PRAGMAS', {}).items():
+            if in_memory and name in _FILE_ONLY:
+                continue
+            cursor.execute(f'PRAGMA {name} = {value}')
+
+
+def connect_signals():
+    """Registra os ajustes de conexão (chamado em AgentConfig.ready)"""
+    connection_created.connect(configure_sqlite, dispatch_uid='poldo_configure_sqlite')
+    connection_created.connect(install_query_counter, dispatch_uid='poldo_query_counter')
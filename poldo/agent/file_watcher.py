@@ -0,0 +1,90 @@
+"""
+Observador de arquivos de dados
+
+Informa quando um arquivo (ex: homelabs.json) pode ter mudado, para que
+o Model recarregue os dados sem reiniciar o processo.
+
+Backends:
+- 'poll': compara mtime/tamanho/inode, no máximo uma vez por intervalo
+- 'inotify': eventos do kernel via pacote opcional inotify_simple
+  (cai para 'poll' se o pacote não estiver instalado)
+"""
+
+import logging
+import os
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+try:
+    from inotify_simple import INotify, flags
+except ImportError:  # inotify é opcional
+    INotify = None
+
+
+class FileWatcher:
+    """
+    Observa um arquivo e responde se ele mudou desde a última consulta
+    """
+
+    def __init__(self, path, poll_interval=2.0, backend='poll'):
+        self.path = str(path)
+        self.poll_interval = poll_interval
+        self._lock = threading.Lock()
+        self._checked_at = 0.0
+        self._signature = self._stat()
+        self._dirty = threading.Event()
+
+        self.backend = 'poll'
+        if backend == 'inotify':
+            if INotify is None:
+                logger.warning("inotify_simple não instalado; usando polling para %s", self.path)
+            else:
+                self.backend = 'inotify'
+                self._start_inotify()
+
+    def _stat(self):
+        try:
+            stat = os.stat(self.path)
+        except FileNotFoundError:
+            return None
+        return (stat.st_mtime_ns, stat.st_size, stat.st_ino)
+
+    def changed(self):
+        """
+        Indica se o arquivo mudou desde a última chamada
+
+        Returns:
+            bool: True se houve (ou pode ter havido) mudança
+        """
+        if self.backend == 'inotify':
+            if self._dirty.is_set():
+                self._dirty.clear()
+                return True
+            return False
+
+        now = time.monotonic()
+        if now - self._checked_at < self.poll_interval:
+            return False
+        with self._lock:
+            self._checked_at = now
+            signature = self._stat()
+            if signature == self._signature:
+                return False
+            self._signature = signature
+            return True
+
+    def _start_inotify(self):
+        # Observa o diretório: substituições atômicas (rename) trocam o inode do arquivo
+        inotify = INotify()
+        directory, name = os.path.split(os.path.abspath(self.path))
+        inotify.add_watch(directory, flags.CLOSE_WRITE | flags.MOVED_TO | flags.CREATE | flags.DELETE)
+
+        def run():
+            while True:
+                for event in inotify.read():
+                    if event.name == name:
+                        self._dirty.set()
+
+        threading.Thread(target=run, name=f"inotify:{name}", daemon=True).start()
@@ -0,0 +1,182 @@
+"""
+Histórico das conversas gravadas no banco para o prompt
+
+Em vez de colar a conversa inteira, o prompt recebe as últimas trocas
+(uma consulta pelo índice (conversation, created_at)), limitadas por
+número de turnos e por orçamento de tokens. As trocas que saem da
+janela são dobradas em um resumo acumulado guardado na própria
+Conversation, então o tamanho do prompt fica constante mesmo em
+conversas longas.
+
+O resumo é extrativo (pergunta e primeira linha da resposta de cada
+troca), sem chamadas extras ao modelo.
+"""
+
+from django.db.models import Q
+
+from .archive import ERROR_PREFIX
+from .models import Conversation, Message
+from .prompt_builder import estimate_tokens
+
+# Limites padrão (POLDO_HISTORY nas settings)
+DEFAULT_MAX_TURNS = 6
+DEFAULT_TOKEN_BUDGET = 600
+DEFAULT_SUMMARY_TOKEN_BUDGET = 200
+
+# Mensagens buscadas além da janela: a troca que acabou de sair dela e a
+# última mensagem já resumida (que mostra que não há lacuna antes)
+FOLD_SLACK = 3
+
+# Limite da busca de recuperação (trocas antigas ainda não resumidas)
+CATCH_UP_LIMIT = 200
+
+# Tamanho máximo de cada lado de uma troca dentro do resumo
+SUMMARY_SNIPPET = 100
+
+
+class ConversationHistory:
+    """
+    MODEL - Janela de histórico e resumo acumulado de uma conversa
+    """
+
+    def __init__(self, max_turns=DEFAULT_MAX_TURNS, token_budget=DEFAULT_TOKEN_BUDGET,
+                 summary_token_budget=DEFAULT_SUMMARY_TOKEN_BUDGET):
+        self.max_turns = max_turns
+        self.token_budget = token_budget
+        self.summary_token_budget = summary_token_budget
+
+    def build(self, conversation_id):
+        """
+        Monta o histórico de uma conversa para o prompt
+
+        Atualiza o resumo gravado quando trocas saem da janela.
+
+        Args:
+            conversation_id (int): ID da conversa
+
+        Returns:
+            str: Resumo e trocas recentes ("" para conversa sem histórico)
+        """
+        limit = 2 * self.max_turns + FOLD_SLACK
+        fetched = list(
+            Message.objects.filter(conversation_id=conversation_id)
+            .order_by('-created_at', '-id')
+            .values_list('id', 'role', 'text', 'conversation__summary', 'conversation__summary_until')[:limit]
+        )
+        if not fetched:
+            return ''
+
+        summary, summary_until = fetched[0][3], fetched[0][4]
+        unfolded = [row[:3] for row in fetched if summary_until is None or row[0] > summary_until]
+        window, to_fold = self._split_window(unfolded)
+
+        # Trocas mais antigas que a busca e ainda fora do resumo (ex: várias
+        # respostas do caminho rápido seguidas, ou conversas anteriores a ele)
+        if len(fetched) == limit and unfolded and unfolded[-1][0] == fetched[-1][0]:
+            to_fold.extend(self._catch_up(conversation_id, summary_until, fetched[-1][0]))
+
+        if to_fold:
+            summary = self._fold(conversation_id, summary, summary_until, to_fold)
+
+        return self.format(summary, reversed(window))
+
+    def _split_window(self, messages):
+        """
+        Separa as mensagens que cabem na janela das que devem ser resumidas
+
+        Args:
+            messages (list): (id, role, text), da mais recente para a mais antiga
+
+        Returns:
+            tuple: (janela, a resumir), ambas da mais recente para a mais antiga
+        """
+        used = turns = 0
+        for index, (_, role, text) in enumerate(messages):
+            cost = estimate_tokens(text)
+            if used + cost > self.token_budget or turns >= self.max_turns:
+                # Não deixa uma resposta na janela sem a pergunta dela
+                if role == 'user' and index and messages[index - 1][1] == 'bot':
+                    index -= 1
+                return messages[:index], messages[index:]
+            used += cost
+            if role == 'user':
+                turns += 1
+        return messages, []
+
+    def _catch_up(self, conversation_id, summary_until, before_id):
+        queryset = Message.objects.filter(conversation_id=conversation_id, id__lt=before_id)
+        if summary_until is not None:
+            queryset = queryset.filter(id__gt=summary_until)
+        return list(queryset.order_by('-created_at', '-id').values_list('id', 'role', 'text')[:CATCH_UP_LIMIT])
+
+    def _fold(self, conversation_id, summary, summary_until, messages):
+        """
+        Acrescenta trocas ao resumo e grava o novo resumo na conversa
+
+        A gravação é condicional ao resumo lido: se outra requisição já o
+        atualizou, a dela prevalece.
+
+        Args:
+            conversation_id (int): ID da conversa
+            summary (str): Resumo atual
+            summary_until (int): ID da última mensagem já resumida
+            messages (list): (id, role, text), da mais recente para a mais antiga
+
+        Returns:
+            str: Novo resumo
+        """
+        lines = summary.splitlines() if summary else []
+        question = None
+        for _, role, text in reversed(messages):
+            if role == 'user':
+                if question is not None:
+                    lines.append(f"- Usuário: {question}")
+                question = _snippet(text)
+            else:
+                answer = "(erro, sem resposta)" if text.startswith(ERROR_PREFIX) else _snippet(text)
+                lines.append(f"- Usuário: {question} → Poldo: {answer}" if question else f"- Poldo: {answer}")
+                question = None
+        if question is not None:
+            lines.append(f"- Usuário: {question}")
+
+        # Mantém as linhas mais recentes dentro do orçamento do resumo
+        kept, used = [], 0
+        for line in reversed(lines):
+            used += estimate_tokens(line)
+            if kept and used > self.summary_token_budget:
+                break
+            kept.append(line)
+        new_summary = '\n'.join(reversed(kept))
+
+        Conversation.objects.filter(id=conversation_id).filter(
+            Q(summary_until__isnull=True) if summary_until is None else Q(summary_until=summary_until)
+        ).update(summary=new_summary, summary_until=max(row[0] for row in messages))
+        return new_summary
+
+    @staticmethod
+    def format(summary, messages):
+        """
+        Formata resumo e trocas recentes para o prompt
+
+        Args:
+            summary (str): Resumo acumulado
+            messages (iterable): (id, role, text), em ordem cronológica
+
+        Returns:
+            str: Seções de resumo e histórico
+        """
+        parts = []
+        if summary:
+            parts.append(f"RESUMO DA CONVERSA ANTERIOR:\n{summary}\n")
+        lines = [
+            f"{'Usuário' if role == 'user' else 'Poldo'}: {text}"
+            for _, role, text in messages
+        ]
+        if lines:
+            parts.append("HISTÓRICO DA CONVERSA:\n" + '\n'.join(lines) + '\n')
+        return '\n'.join(parts)
+
+
+def _snippet(text):
+    first_line = text.strip().splitlines()[0] if text.strip() else ''
+    return first_line[:SUMMARY_SNIPPET] + ('...' if len(first_line) > SUMMARY_SNIPPET else '')
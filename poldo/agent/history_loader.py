@@ -0,0 +1,165 @@
+"""
+Leitura incremental do histórico de snapshots dos homelabs
+
+O histórico pode crescer para semanas de snapshots de centenas de hosts,
+então nada aqui carrega o arquivo inteiro na memória: os snapshots são
+produzidos um a um, com uso de memória constante.
+
+Formatos aceitos:
+- JSON: uma lista de snapshots (formato atual do homelabs_history.json),
+  lida em blocos com json.JSONDecoder.raw_decode
+- JSON Lines (.jsonl): um snapshot por linha, só com acréscimos; permite
+  acompanhar o arquivo a partir de um offset ("tail") sem relê-lo
+"""
+
+import json
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Tamanho dos blocos lidos do arquivo (caracteres)
+CHUNK_SIZE = 64 * 1024
+
+_WHITESPACE = ' \t\r\n'
+
+
+def is_jsonl(path):
+    """
+    Indica se o arquivo de histórico está no formato JSON Lines
+
+    Args:
+        path (str): Caminho do arquivo
+
+    Returns:
+        bool: True para .jsonl ou conteúdo que não começa com '['
+    """
+    if str(path).endswith('.jsonl'):
+        return True
+    with open(path, 'r', encoding='utf-8') as file:
+        while True:
+            char = file.read(1)
+            if not char:
+                return False
+            if char not in _WHITESPACE:
+                return char != '['
+
+
+def iter_snapshots(path, chunk_size=CHUNK_SIZE):
+    """
+    Produz os snapshots do histórico um a um
+
+    Args:
+        path (str): Caminho do arquivo (JSON ou JSON Lines)
+        chunk_size (int): Tamanho dos blocos lidos
+
+    Yields:
+        dict: Snapshot ({"timestamp": ..., "homelab-x": {...}})
+    """
+    if is_jsonl(path):
+        for snapshot, _ in tail_snapshots(path):
+            if snapshot is not None:
+                yield snapshot
+        return
+
+    with open(path, 'r', encoding='utf-8') as file:
+        yield from _iter_json_array(file, chunk_size)
+
+
+def _iter_json_array(file, chunk_size):
+    decoder = json.JSONDecoder()
+    buffer, pos = '', 0
+    started = eof = False
+
+    while True:
+        separators = _WHITESPACE + ',' if started else _WHITESPACE
+        while pos < len(buffer) and buffer[pos] in separators:
+            pos += 1
+
+        if pos < len(buffer):
+            if not started:
+                if buffer[pos] != '[':
+                    raise ValueError("Histórico JSON deve ser uma lista de snapshots")
+                started = True
+                pos += 1
+                continue
+            if buffer[pos] == ']':
+                return
+            try:
+                snapshot, pos = decoder.raw_decode(buffer, pos)
+            except json.JSONDecodeError:
+                # Snapshot incompleto no fim do bloco: lê mais antes de desistir
+                if eof:
+                    raise
+            else:
+                yield snapshot
+                continue
+        elif eof:
+            if started:
+                raise ValueError("Histórico JSON truncado: lista não foi fechada")
+            return
+
+        chunk = file.read(chunk_size)
+        buffer = buffer[pos:] + chunk
+        pos = 0
+        eof = not chunk
+
+
+def tail_snapshots(path, offset=0):
+    """
+    Lê os snapshots de um histórico JSON Lines a partir de um offset
+
+    Só consome linhas completas: uma linha sendo escrita pelo coletor fica
+    para a próxima leitura. Uma linha completa inválida (JSON quebrado ou
+    que não é um objeto) vai para o log e é pulada com snapshot None, só
+    para avançar o offset; senão a leitura pararia nela para sempre. O
+    offset retornado pode ser guardado para continuar de onde parou sem
+    reler o arquivo.
+
+    Args:
+        path (str): Caminho do arquivo .jsonl
+        offset (int): Posição (bytes) de onde continuar
+
+    Yields:
+        tuple: (snapshot ou None se a linha foi pulada, offset da próxima linha)
+    """
+    with open(path, 'rb') as file:
+        file.seek(offset)
+        for line in file:
+            if not line.endswith(b'\n'):
+                break
+            offset += len(line)
+            if not line.strip():
+                continue
+            try:
+                snapshot = json.loads(line)
+            except ValueError:
+                snapshot = None
+            if not isinstance(snapshot, dict):
+                logger.warning("Linha inválida no histórico %s (até o byte %d): ignorada", path, offset)
+                snapshot = None
+            yield snapshot, offset
+
+
+def append_snapshot(path, snapshot):
+    """
+    Acrescenta um snapshot ao histórico JSON Lines
+
+    Args:
+        path (str): Caminho do arquivo .jsonl
+        snapshot (dict): Snapshot a gravar
+    """
+    with open(path, 'a', encoding='utf-8') as file:
+        file.write(snapshot_line(snapshot))
+
+
+def snapshot_line(snapshot):
+    """
+    Serializa um snapshot como uma linha JSON Lines
+
+    Args:
+        snapshot (dict): Snapshot
+
+    Returns:
+        str: JSON compacto terminado em quebra de linha
+    """
+    return json.dumps(snapshot, ensure_ascii=False, separators=(',', ':')) + '\n'
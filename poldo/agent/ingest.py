@@ -0,0 +1,316 @@
+"""
+Ingestão de métricas enviadas pelos coletores
+
+Os snapshots recebidos pela API vão para um buffer em memória que é
+gravado no banco com bulk_create em lotes, quando atinge um tamanho
+máximo ou quando a amostra mais antiga passa de uma idade máxima.
+
+As linhas são validadas ao entrar no buffer (um snapshot inválido
+recusa só a sua requisição, não o lote dos outros coletores). Se a
+gravação falhar, as amostras voltam para o buffer e são gravadas na
+próxima tentativa; ao encerrar o processo, o buffer é gravado. Linhas
+que o banco recusa (IntegrityError) nunca seriam gravadas: são isoladas
+lote a lote, registradas no log e descartadas, sem travar as demais.
+"""
+
+import atexit
+import logging
+import threading
+import time
+from datetime import datetime
+
+from django.conf import settings
+from django.db import IntegrityError, close_old_connections, transaction
+from django.utils import timezone
+
+from .models import Host, MetricSample, parse_metric_value
+
+logger = logging.getLogger(__name__)
+
+# Limites das colunas: uma linha longa demais derrubaria o lote inteiro no PostgreSQL
+HOST_NAME_MAX = Host._meta.get_field('name').max_length
+METRIC_NAME_MAX = MetricSample._meta.get_field('metric').max_length
+
+
+def snapshot_rows(snapshot, default_time=None):
+    """
+    Converte um snapshot em linhas de amostras
+
+    Args:
+        snapshot (dict): {"timestamp": ..., "homelab-x": {"cpu": "52%", ...}}
+        default_time (datetime): Momento usado se o snapshot não tiver timestamp
+
+    Returns:
+        list: Lista de (host, métrica, valor numérico, valor original, momento)
+
+    Raises:
+        ValueError: Timestamp inválido, nome de host/métrica longo demais
+            ou métrica sem valor (null)
+    """
+    collected_at = _parse_time(snapshot.get('timestamp')) or default_time or timezone.now()
+    rows = []
+    for name, metrics in snapshot.items():
+        if name == 'timestamp' or not isinstance(metrics, dict):
+            continue
+        if not name or len(name) > HOST_NAME_MAX:
+            raise ValueError(f'Nome de host inválido (1 a {HOST_NAME_MAX} caracteres): {name[:HOST_NAME_MAX]!r}')
+        for metric, raw in metrics.items():
+            if not metric or len(metric) > METRIC_NAME_MAX:
+                raise ValueError(
+                    f'Nome de métrica inválido em {name} (1 a {METRIC_NAME_MAX} caracteres): '
+                    f'{metric[:METRIC_NAME_MAX]!r}'
+                )
+            if raw is None:
+                raise ValueError(f'Métrica sem valor (null) em {name}: {metric!r}')
+            value = parse_metric_value(raw) if not isinstance(raw, (list, dict)) else None
+            rows.append((name, metric, value, raw, collected_at))
+    return rows
+
+
+def _parse_time(value):
+    if value is None or value == '':
+        return None
+    if not isinstance(value, str):
+        raise ValueError(f'Timestamp inválido (use ISO 8601, ex: "2025-01-01T12:00:00"): {value!r}')
+    parsed = datetime.fromisoformat(value)
+    return timezone.make_aware(parsed) if timezone.is_naive(parsed) else parsed
+
+
+class SampleBuffer:
+    """
+    Buffer de amostras com gravação em lote
+
+    Thread-safe: várias requisições podem acrescentar amostras ao mesmo
+    tempo; a gravação troca o buffer inteiro e grava fora do lock. Se ela
+    falhar, as amostras voltam para o início do buffer (até max_pending;
+    acima disso as mais antigas são descartadas e contadas em dropped).
+    Amostras recusadas pelo banco não voltam: são contadas em rejected.
+    """
+
+    def __init__(self, max_size=5000, max_age=2.0, batch_size=1000, max_pending=50000):
+        self.max_size = max_size
+        self.max_age = max_age
+        self.batch_size = batch_size
+        self.max_pending = max_pending
+        self._rows = []
+        self._oldest = None
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._timer = None
+        self.flushed_samples = 0
+        self.flushes = 0
+        self.failed_flushes = 0
+        self.dropped = 0
+        self.rejected = 0
+
+    def add_snapshots(self, snapshots):
+        """
+        Acrescenta snapshots ao buffer e grava se o limite for atingido
+
+        Args:
+            snapshots (list): Snapshots no formato do homelabs.json
+
+        Returns:
+            int: Número de amostras aceitas
+
+        Raises:
+            ValueError: Se algum snapshot é inválido (nada é aceito)
+        """
+        now = timezone.now()
+        rows = [row for snapshot in snapshots for row in snapshot_rows(snapshot, now)]
+
+        with self._lock:
+            self._rows.extend(rows)
+            if self._oldest is None:
+                self._oldest = time.monotonic()
+            should_flush = (
+                len(self._rows) >= self.max_size
+                or time.monotonic() - self._oldest >= self.max_age
+            )
+            if not should_flush:
+                self._schedule()
+
+        if should_flush:
+            try:
+                self.flush()
+            except Exception:
+                # As amostras já foram aceitas e continuam no buffer
+                logger.exception("Falha ao gravar as amostras; nova tentativa em %.1fs", self.max_age)
+        return len(rows)
+
+    def _schedule(self):
+        # Garante a gravação por tempo mesmo sem novas requisições
+        if self._timer is None:
+            self._timer = threading.Timer(self.max_age, self._flush_from_timer)
+            self._timer.daemon = True
+            self._timer.start()
+
+    def _flush_from_timer(self):
+        try:
+            self.flush()
+        except Exception:
+            logger.exception("Falha ao gravar as amostras; nova tentativa em %.1fs", self.max_age)
+        finally:
+            close_old_connections()
+
+    def _requeue(self, rows):
+        """Devolve ao início do buffer as amostras de uma gravação que falhou"""
+        with self._lock:
+            self._rows[:0] = rows
+            excess = len(self._rows) - self.max_pending
+            if excess > 0:
+                del self._rows[:excess]
+                self.dropped += excess
+                logger.error("Buffer de ingestão cheio: %d amostras antigas descartadas", excess)
+            self.failed_flushes += 1
+            if self._oldest is None:
+                self._oldest = time.monotonic()
+            self._schedule()
+
+    def flush(self):
+        """
+        Grava no banco todas as amostras do buffer
+
+        Returns:
+            int: Número de amostras gravadas
+
+        Raises:
+            DatabaseError: Se a gravação falhar (as amostras voltam ao buffer)
+        """
+        with self._lock:
+            rows, self._rows = self._rows, []
+            self._oldest = None
+            if self._timer is not None:
+                self._timer.cancel()
+                self._timer = None
+        if not rows:
+            return 0
+
+        try:
+            self._write(rows)
+            written = len(rows)
+        except IntegrityError:
+            # Alguma linha nunca será aceita: isola em lotes em vez de devolvê-la ao buffer
+            written = self._write_isolated(rows)
+        except BaseException:
+            self._requeue(rows)
+            raise
+
+        self.flushes += 1
+        self.flushed_samples += written
+        return written
+
+    def _write(self, rows):
+        """Grava as amostras e atualiza os hosts em uma única transação"""
+        with self._flush_lock, transaction.atomic():
+            hosts = self._ensure_hosts({row[0] for row in rows})
+            MetricSample.objects.bulk_create(
+                (
+                    MetricSample(host=hosts[name], metric=metric, value=value, raw=raw, collected_at=collected_at)
+                    for name, metric, value, raw, collected_at in rows
+                ),
+                batch_size=self.batch_size
+            )
+            self._update_last_seen(hosts, rows)
+
+    def _write_isolated(self, rows):
+        """
+        Grava lote a lote e, nos lotes recusados, linha a linha
+
+        Linhas que ainda falham com IntegrityError são registradas no log
+        e descartadas; outros erros devolvem ao buffer o que não foi gravado.
+
+        Returns:
+            int: Número de amostras gravadas
+        """
+        written = 0
+        for start in range(0, len(rows), self.batch_size):
+            batch = rows[start:start + self.batch_size]
+            try:
+                self._write(batch)
+                written += len(batch)
+                continue
+            except IntegrityError:
+                pass
+            except BaseException:
+                self._requeue(rows[start:])
+                raise
+
+            for position, row in enumerate(batch):
+                try:
+                    self._write([row])
+                    written += 1
+                except IntegrityError as e:
+                    self.rejected += 1
+                    logger.error("Amostra recusada pelo banco e descartada (%s/%s): %s", row[0], row[1], e)
+                except BaseException:
+                    self._requeue(batch[position:] + rows[start + len(batch):])
+                    raise
+        return written
+
+    def _ensure_hosts(self, names):
+        """Cria os hosts que ainda não existem e retorna {nome: Host}"""
+        Host.objects.bulk_create(
+            [Host(name=name) for name in names],
+            batch_size=self.batch_size,
+            ignore_conflicts=True
+        )
+        return Host.objects.in_bulk(list(names), field_name='name')
+
+    def _update_last_seen(self, hosts, rows):
+        """Avança Host.last_seen_at para o snapshot mais recente recebido"""
+        latest = {}
+        for name, _, _, _, collected_at in rows:
+            if name not in latest or collected_at > latest[name]:
+                latest[name] = collected_at
+
+        changed = []
+        for name, collected_at in latest.items():
+            host = hosts[name]
+            if host.last_seen_at is None or collected_at > host.last_seen_at:
+                host.last_seen_at = collected_at
+                changed.append(host)
+        Host.objects.bulk_update(changed, ['last_seen_at'], batch_size=self.batch_size)
+
+    def close(self):
+        """Grava o que restou no buffer (ao encerrar o processo)"""
+        with self._lock:
+            if self._timer is not None:
+                self._timer.cancel()
+                self._timer = None
+        try:
+            flushed = self.flush()
+        except Exception:
+            logger.exception("Amostras pendentes perdidas ao encerrar: %d", len(self._rows))
+            return
+        if flushed:
+            logger.info("%d amostras pendentes gravadas ao encerrar", flushed)
+
+    def stats(self):
+        """
+        Retorna os contadores do buffer
+
+        Returns:
+            dict: Amostras pendentes, gravações (e falhas) e amostras gravadas,
+            descartadas e recusadas pelo banco
+        """
+        return {
+            'pending': len(self._rows),
+            'flushes': self.flushes,
+            'flushed_samples': self.flushed_samples,
+            'failed_flushes': self.failed_flushes,
+            'dropped': self.dropped,
+            'rejected': self.rejected,
+        }
+
+
+_config = getattr(settings, 'POLDO_INGEST', {})
+
+# Buffer compartilhado pelas requisições de ingestão deste processo
+sample_buffer = SampleBuffer(
+    max_size=_config.get('MAX_BUFFER', 5000),
+    max_age=_config.get('MAX_AGE', 2.0),
+    batch_size=_config.get('BATCH_SIZE', 1000),
+    max_pending=_config.get('MAX_PENDING', 50000),
+)
+atexit.register(sample_buffer.close)
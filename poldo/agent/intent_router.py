@@ -0,0 +1,165 @@
+"""
+Roteador determinístico de intenções (caminho rápido)
+
+A maior parte das perguntas é a consulta de uma única métrica de um
+homelab ("qual a cpu do homelab-dev?"). Esses casos são respondidos
+direto do HomelabModel, sem chamar o modelo. Tudo que o roteador não
+consegue interpretar com segurança segue para o Gemini.
+"""
+
+import re
+import threading
+from collections import namedtuple
+
+from .response_cache import normalize_question
+
+# Palavras (já normalizadas, sem acento) que identificam cada métrica
+METRIC_ALIASES = {
+    'cpu': ('cpu', 'processador'),
+    'memoria': ('memoria', 'memory'),
+    'ram': ('ram',),
+    'docker': ('docker', 'container', 'containers'),
+    'portas': ('porta', 'portas', 'port', 'ports'),
+    'rede': ('rede', 'ip', 'endereco'),
+    'status': ('status', 'estado'),
+}
+
+METRIC_LABELS = {
+    'cpu': 'CPU',
+    'memoria': 'Memória',
+    'ram': 'RAM',
+    'docker': 'Docker',
+    'portas': 'Portas',
+    'rede': 'Rede',
+    'status': 'Status',
+}
+
+# Perguntas com estas palavras pedem raciocínio (tendência, comparação...)
+# ou se referem a outro momento ("ontem", "semana passada"): o caminho
+# rápido só conhece o snapshot atual
+LLM_ONLY_WORDS = {
+    'media', 'historico', 'tendencia', 'compare', 'comparar', 'comparacao',
+    'maior', 'menor', 'mais', 'menos', 'porque', 'quando', 'evolucao',
+    'variacao', 'todos', 'todas',
+    'ontem', 'anteontem', 'antes', 'anterior', 'passado', 'passada',
+    'semana', 'mes', 'dia', 'dias', 'hora', 'horas', 'era', 'estava', 'foi',
+}
+
+# Tamanho máximo (em palavras) de uma consulta simples
+MAX_WORDS = 10
+
+RouteResult = namedtuple('RouteResult', ['route', 'answer'])
+
+_ALIAS_TO_METRIC = {alias: metric for metric, aliases in METRIC_ALIASES.items() for alias in aliases}
+_WORD_RE = re.compile(r'[\w-]+')
+
+
+class IntentRouter:
+    """
+    CONTROLLER - Interpreta consultas simples e responde pelo Model
+
+    Rotas:
+    - 'metric': uma métrica de um homelab
+    - 'status': status completo de um homelab
+    As rotas 'cache' e 'llm' são registradas pelo ChatAgent, para que as
+    estatísticas cubram todas as perguntas.
+    """
+
+    FAST_ROUTES = ('metric', 'status')
+
+    def __init__(self, homelab_model):
+        self.homelab_model = homelab_model
+        self._stats = {}
+        self._lock = threading.Lock()
+
+    def route(self, question):
+        """
+        Tenta responder a pergunta sem o modelo
+
+        Args:
+            question (str): Pergunta do usuário
+
+        Returns:
+            RouteResult: Rota e resposta, ou None se a pergunta deve ir ao Gemini
+        """
+        words = _WORD_RE.findall(normalize_question(question))
+        if not words or len(words) > MAX_WORDS:
+            return None
+
+        # Índice do snapshot: nomes e métricas já em dicts, sem listas por pergunta
+        index = self.homelab_model.get_index()
+        names = index.hosts
+        homelabs = {word for word in words if word in names}
+        unknown = {word for word in words if word.startswith('homelab') and word not in names}
+        if len(homelabs) != 1 or unknown:
+            return None
+
+        metrics = {_ALIAS_TO_METRIC[word] for word in words if word in _ALIAS_TO_METRIC}
+        if LLM_ONLY_WORDS.intersection(words) or len(metrics) != 1:
+            return None
+
+        host = names[homelabs.pop()]
+        metric = metrics.pop()
+        if metric not in index.metrics:
+            return None
+
+        if metric == 'status':
+            return self._status_answer(host)
+        return self._metric_answer(host, metric)
+
+    def _metric_answer(self, host, metric):
+        value = host.raw.get(metric)
+        if value is None:
+            return None
+        return RouteResult('metric', f"🔍 {host.name} - {METRIC_LABELS[metric]}: {self._format(value)}")
+
+    def _status_answer(self, host):
+        lines = [f"📊 Status do {host.name}:"]
+        for metric, value in host.raw.items():
+            lines.append(f"• {METRIC_LABELS.get(metric, metric)}: {self._format(value)}")
+        return RouteResult('status', '\n'.join(lines))
+
+    @staticmethod
+    def _format(value):
+        if isinstance(value, (list, tuple)):
+            return ', '.join(str(item) for item in value)
+        return str(value)
+
+    def record(self, route, elapsed):
+        """
+        Registra uma pergunta atendida por uma rota
+
+        Args:
+            route (str): Nome da rota (metric, status, cache, llm)
+            elapsed (float): Latência em segundos
+        """
+        with self._lock:
+            entry = self._stats.setdefault(route, {'count': 0, 'total': 0.0, 'max': 0.0})
+            entry['count'] += 1
+            entry['total'] += elapsed
+            entry['max'] = max(entry['max'], elapsed)
+
+    def stats(self):
+        """
+        Retorna taxa de acerto do caminho rápido e latência por rota
+
+        Returns:
+            dict: Total, acertos do caminho rápido, taxa e latências (ms)
+        """
+        with self._lock:
+            routes = {
+                route: {
+                    'count': entry['count'],
+                    'avg_ms': entry['total'] / entry['count'] * 1000,
+                    'max_ms': entry['max'] * 1000,
+                }
+                for route, entry in self._stats.items()
+            }
+        total = sum(entry['count'] for entry in routes.values())
+        fast = sum(routes[route]['count'] for route in self.FAST_ROUTES if route in routes)
+        return {
+            'total': total,
+            'fast_path_hits': fast,
+            'fast_path_hit_rate': fast / total if total else 0.0,
+            'routes': routes,
+        }
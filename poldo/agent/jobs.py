@@ -0,0 +1,428 @@
+"""
+Fila de geração de respostas em segundo plano
+
+Com o modelo lento, /chat/send/ segurava a requisição HTTP durante toda
+a geração e o proxy reverso derrubava a conexão por timeout, mesmo com
+a resposta sendo gerada e gravada depois. Com a fila, o envio responde
+na hora (202) com o ID do job, e o cliente consulta o resultado
+(GET /chat/jobs/<id>/, com ?wait= para esperar até o job terminar).
+
+- Sem broker externo: um pool de threads por processo
+- Ordem por conversa: os jobs de uma mesma conversa rodam um de cada
+  vez, na ordem de envio; conversas diferentes rodam em paralelo
+- Fila limitada: acima de MAX_PENDING jobs (ou MAX_PER_CONVERSATION em
+  uma conversa) o envio é recusado com QueueFull, para o cliente tentar
+  de novo depois em vez de acumular esperas
+- O estado de cada job também vai para o cache do Django (CACHE_ALIAS),
+  então, com um cache compartilhado, qualquer worker responde à consulta
+- Vários processos: com um cache compartilhado, cada job recebe uma
+  senha da sua conversa (cache.incr) e só roda quando todas as senhas
+  anteriores foram atendidas, em qualquer worker. As senhas são pegas
+  fora do lock da fila (são chamadas ao cache) e, enquanto não é a vez
+  de um job, a conversa é reagendada a cada poll_interval sem prender
+  uma thread do pool. Um job cuja vez não chega em lane_timeout (worker
+  derrubado no meio) roda assim mesmo.
+  Com um cache por processo (LocMemCache) e vários workers, a consulta
+  cairia em outro worker: o controller só aceita o modo assíncrono com
+  cache compartilhado ou POLDO_SINGLE_PROCESS
+"""
+
+import logging
+import threading
+import time
+import uuid
+from collections import OrderedDict, deque
+from concurrent.futures import ThreadPoolExecutor
+
+from django.core.cache import caches
+from django.db import close_old_connections
+
+from .metrics import metrics
+from .response_cache import is_shared_cache, reaches_all_workers
+
+logger = logging.getLogger(__name__)
+
+QUEUED, RUNNING, DONE, ERROR = 'queued', 'running', 'done', 'error'
+
+# Validade das senhas das conversas no cache (renovada a cada job)
+LANE_TTL = 86400
+
+
+class QueueFull(Exception):
+    """A fila (ou a conversa) já tem o máximo de jobs pendentes"""
+
+
+class Job:
+    """Uma geração enfileirada e o seu resultado"""
+
+    __slots__ = ('id', 'key', 'ticket', 'turn_ends_at', 'status', 'result', 'error', 'created_at', 'started_at',
+                 'finished_at', 'done', '_callbacks', '_lock', '_func', '_args')
+
+    def __init__(self, key, func, args):
+        self.id = uuid.uuid4().hex
+        self.key = key
+        # Senha na fila da conversa entre processos (None = só a ordem local)
+        self.ticket = None
+        # Prazo para a vez chegar (definido na primeira espera)
+        self.turn_ends_at = None
+        self.status = QUEUED
+        self.result = None
+        self.error = None
+        self.created_at = time.time()
+        self.started_at = None
+        self.finished_at = None
+        self.done = threading.Event()
+        self._callbacks = []
+        self._lock = threading.Lock()
+        self._func = func
+        self._args = args
+
+    def add_done_callback(self, callback):
+        """
+        Chama callback() quando o job terminar (na hora, se já terminou)
+
+        Usado pela consulta assíncrona para esperar sem ocupar uma thread.
+        """
+        with self._lock:
+            if not self.done.is_set():
+                self._callbacks.append(callback)
+                return
+        callback()
+
+    def _finish(self):
+        """Marca o job como terminado e chama os callbacks registrados"""
+        with self._lock:
+            self.done.set()
+            callbacks, self._callbacks = self._callbacks, []
+        for callback in callbacks:
+            try:
+                callback()
+            except Exception:
+                # Um callback com erro não pode parar o worker da conversa
+                logger.exception("Callback do job %s falhou", self.id)
+
+    def as_dict(self):
+        """
+        Estado do job para a resposta da consulta
+
+        Returns:
+            dict: id, status, resultado (ou erro) e tempos
+        """
+        return {
+            'job_id': self.id,
+            'status': self.status,
+            'result': self.result,
+            'error': self.error,
+            'queued_s': (self.started_at or time.time()) - self.created_at,
+            'run_s': (self.finished_at or time.time()) - self.started_at if self.started_at else None,
+        }
+
+
+class _Lane:
+    """Fila local de uma chave (conversa): só o primeiro job pode estar rodando"""
+
+    __slots__ = ('jobs', 'unticketed', 'ticket_lock')
+
+    def __init__(self):
+        self.jobs = deque()
+        # Jobs ainda sem senha, na ordem da fila (protegido pelo lock da JobQueue)
+        self.unticketed = []
+        # Serializa as senhas da conversa, fora do lock da JobQueue
+        self.ticket_lock = threading.Lock()
+
+
+class JobQueue:
+    """
+    CONTROLLER - Pool de threads com ordem por chave e fila limitada
+    """
+
+    def __init__(self, workers=4, max_pending=100, max_per_key=10, result_ttl=600, cache_alias='default',
+                 lane_timeout=120.0, poll_interval=0.1):
+        self.workers = workers
+        self.max_pending = max_pending
+        self.max_per_key = max_per_key
+        self.result_ttl = result_ttl
+        self.cache_alias = cache_alias
+        self.lane_timeout = lane_timeout
+        self.poll_interval = poll_interval
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='poldo-job')
+        # Fila de cada chave (conversa), ver _Lane
+        self._lanes = {}
+        # Jobs por ID, na ordem de criação (os terminados expiram após result_ttl)
+        self._jobs = OrderedDict()
+        self._lock = threading.Lock()
+        self.pending = 0
+        self.running = 0
+        self.submitted = 0
+        self.completed = 0
+        self.failed = 0
+        self.rejected = 0
+
+    def _cache_key(self, job_id):
+        return f'poldo:job:{job_id}'
+
+    def _lane_keys(self, key):
+        # Próxima senha e última senha atendida da conversa
+        return f'poldo:job-lane:{key}:next', f'poldo:job-lane:{key}:served'
+
+    def available(self):
+        """
+        Indica se o estado dos jobs chega a todos os workers
+
+        Returns:
+            bool: True com um cache compartilhado ou POLDO_SINGLE_PROCESS
+        """
+        return reaches_all_workers(self.cache_alias)
+
+    def _take_ticket(self, key):
+        """Senha do próximo job da conversa, comum a todos os processos (None se falhar)"""
+        if not is_shared_cache(self.cache_alias):
+            return None
+        cache = caches[self.cache_alias]
+        next_key, served_key = self._lane_keys(key)
+        try:
+            cache.add(next_key, 0, timeout=LANE_TTL)
+            cache.add(served_key, 0, timeout=LANE_TTL)
+            ticket = cache.incr(next_key)
+            cache.touch(next_key, LANE_TTL)
+            cache.touch(served_key, LANE_TTL)
+            return ticket
+        except Exception:
+            logger.exception("Falha ao pegar a senha da conversa %s; job só na ordem local", key)
+            return None
+
+    def _assign_tickets(self, lane):
+        """
+        Pega as senhas dos jobs da conversa que ainda não têm uma
+
+        As chamadas ao cache ficam fora do lock da fila; o lock da conversa
+        garante que as senhas saem na mesma ordem da fila local. Quem chega
+        depois espera esse lock e encontra o seu job já com senha.
+        """
+        with lane.ticket_lock:
+            with self._lock:
+                jobs, lane.unticketed = lane.unticketed, []
+            for job in jobs:
+                job.ticket = self._take_ticket(job.key)
+
+    def _is_turn(self, job):
+        """Indica se as senhas anteriores da conversa já foram atendidas (em qualquer worker)"""
+        cache = caches[self.cache_alias]
+        _, served_key = self._lane_keys(job.key)
+        try:
+            served = cache.get(served_key)
+            if served is None or served >= job.ticket - 1:
+                return True
+            if job.turn_ends_at is None:
+                job.turn_ends_at = time.monotonic() + self.lane_timeout
+            elif time.monotonic() >= job.turn_ends_at:
+                logger.warning("Job %s: senha %d esperou %.0fs pela anterior; rodando assim mesmo",
+                               job.id, job.ticket, self.lane_timeout)
+                cache.set(served_key, job.ticket - 1, timeout=LANE_TTL)
+                return True
+            return False
+        except Exception:
+            logger.exception("Falha ao consultar a vez do job %s no cache", job.id)
+            return True
+
+    def _retry_later(self, key):
+        """Volta a tentar a conversa depois de poll_interval, sem ocupar uma thread do pool"""
+        timer = threading.Timer(self.poll_interval, self._executor.submit, (self._drain, key))
+        timer.daemon = True
+        timer.start()
+
+    def _end_turn(self, job):
+        """Marca a senha do job como atendida, liberando o próximo da conversa"""
+        cache = caches[self.cache_alias]
+        _, served_key = self._lane_keys(job.key)
+        try:
+            cache.incr(served_key)
+        except ValueError:
+            # Chave expirada ou removida do cache
+            cache.set(served_key, job.ticket, timeout=LANE_TTL)
+        except Exception:
+            logger.exception("Falha ao liberar a vez do job %s no cache", job.id)
+
+    def _publish(self, job):
+        try:
+            caches[self.cache_alias].set(self._cache_key(job.id), job.as_dict(), self.result_ttl)
+        except Exception:
+            # O estado local continua valendo para este processo
+            logger.exception("Falha ao gravar o estado do job %s no cache", job.id)
+
+    def submit(self, key, func, *args):
+        """
+        Enfileira func(*args) na fila da chave
+
+        Args:
+            key: Chave de ordenação (ID da conversa)
+            func (callable): Função executada no pool (o retorno vira o resultado)
+            *args: Argumentos da função
+
+        Returns:
+            Job: Job enfileirado
+
+        Raises:
+            QueueFull: Se a fila ou a chave já têm o máximo de jobs pendentes
+        """
+        job = Job(key, func, args)
+        with self._lock:
+            self._expire()
+            lane = self._lanes.get(key)
+            if self.pending >= self.max_pending or (lane and len(lane.jobs) >= self.max_per_key):
+                self.rejected += 1
+                raise QueueFull("Fila de geração cheia")
+            self.pending += 1
+            self.submitted += 1
+            self._jobs[job.id] = job
+            if lane is None:
+                lane = self._lanes[key] = _Lane()
+            lane.jobs.append(job)
+            lane.unticketed.append(job)
+            start_lane = len(lane.jobs) == 1
+
+        self._assign_tickets(lane)
+        self._publish(job)
+        if start_lane:
+            self._executor.submit(self._drain, key)
+        return job
+
+    def _drain(self, key):
+        """
+        Roda os jobs de uma chave, um de cada vez, até a fila dela esvaziar
+
+        Se ainda não é a vez do próximo job (senha de outro worker
+        pendente), devolve a thread ao pool e tenta de novo depois.
+        """
+        with self._lock:
+            lane = self._lanes[key]
+        while True:
+            with self._lock:
+                job = lane.jobs[0]
+            # O job pode ter entrado na fila e ainda não ter senha
+            self._assign_tickets(lane)
+            if job.ticket is not None and not self._is_turn(job):
+                self._retry_later(key)
+                return
+
+            with self._lock:
+                self.running += 1
+            self._run(job)
+            with self._lock:
+                self.running -= 1
+                self.pending -= 1
+                lane.jobs.popleft()
+                if not lane.jobs:
+                    del self._lanes[key]
+                    return
+
+    def _run(self, job):
+        try:
+            self._execute(job)
+        finally:
+            if job.ticket is not None:
+                self._end_turn(job)
+
+    def _execute(self, job):
+        job.started_at = time.time()
+        job.status = RUNNING
+        metrics.observe('poldo_job_wait_seconds', job.started_at - job.created_at)
+        self._publish(job)
+
+        close_old_connections()
+        try:
+            job.result = job._func(*job._args)
+            job.status = DONE
+        except Exception as e:
+            logger.exception("Job %s falhou", job.id)
+            job.error = str(e)
+            job.status = ERROR
+        finally:
+            close_old_connections()
+
+        job.finished_at = time.time()
+        job._func = job._args = None
+        metrics.observe('poldo_job_run_seconds', job.finished_at - job.started_at, status=job.status)
+        with self._lock:
+            if job.status == DONE:
+                self.completed += 1
+            else:
+                self.failed += 1
+        self._publish(job)
+        job._finish()
+
+    def _expire(self):
+        """Remove os jobs terminados há mais de result_ttl (chamado com o lock)"""
+        limit = time.time() - self.result_ttl
+        expired = []
+        for job_id, job in self._jobs.items():
+            if job.created_at >= limit:
+                break
+            if job.finished_at is not None and job.finished_at < limit:
+                expired.append(job_id)
+        for job_id in expired:
+            del self._jobs[job_id]
+
+    def get(self, job_id):
+        """
+        Busca um job deste processo
+
+        Args:
+            job_id (str): ID do job
+
+        Returns:
+            Job: Job ou None se não existe (ou expirou) neste processo
+        """
+        with self._lock:
+            return self._jobs.get(job_id)
+
+    def get_state(self, job_id):
+        """
+        Estado de um job, deste processo ou, se não estiver aqui, do cache
+
+        Args:
+            job_id (str): ID do job
+
+        Returns:
+            dict: Estado (ver Job.as_dict) ou None se não encontrado
+        """
+        job = self.get(job_id)
+        if job is not None:
+            return job.as_dict()
+        return caches[self.cache_alias].get(self._cache_key(job_id))
+
+    async def aget_state(self, job_id):
+        """
+        Versão assíncrona de get_state
+
+        Args:
+            job_id (str): ID do job
+
+        Returns:
+            dict: Estado (ver Job.as_dict) ou None se não encontrado
+        """
+        job = self.get(job_id)
+        if job is not None:
+            return job.as_dict()
+        return await caches[self.cache_alias].aget(self._cache_key(job_id))
+
+    def stats(self):
+        """
+        Retorna os contadores da fila
+
+        Returns:
+            dict: Profundidade (pendentes, na fila, rodando), limites e totais
+        """
+        with self._lock:
+            return {
+                'workers': self.workers,
+                'max_pending': self.max_pending,
+                'pending': self.pending,
+                'queued': self.pending - self.running,
+                'running': self.running,
+                'conversations': len(self._lanes),
+                'submitted': self.submitted,
+                'completed': self.completed,
+                'failed': self.failed,
+                'rejected': self.rejected,
+            }
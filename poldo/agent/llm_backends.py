@@ -0,0 +1,308 @@
+"""
+Backends de modelo de linguagem
+
+Todo backend implementa a mesma interface (LLMBackend): geração
+síncrona, assíncrona e em streaming, sempre com texto puro. O backend é
+escolhido em settings.POLDO_LLM_BACKEND:
+
+- 'gemini': Google Gemini (requer GEMINI_API_KEY)
+- 'fake': modelo local determinístico com latência e vazão configuráveis,
+  para benchmarks, testes de carga e CI sem rede
+- 'openai': qualquer servidor compatível com a API de chat completions
+  da OpenAI (ex: llama.cpp, vLLM, Ollama), só com a biblioteca padrão
+"""
+
+import asyncio
+import json
+import os
+import threading
+import time
+import urllib.error
+import urllib.request
+from concurrent.futures import TimeoutError as FutureTimeoutError
+
+from django.conf import settings
+
+
+class LLMBackend:
+    """
+    Interface dos backends de modelo
+
+    Subclasses implementam generate, agenerate e astream.
+    """
+
+    name = None
+
+    def generate(self, prompt):
+        """
+        Gera a resposta completa
+
+        Args:
+            prompt (str): Prompt completo
+
+        Returns:
+            str: Texto da resposta
+        """
+        raise NotImplementedError
+
+    async def agenerate(self, prompt):
+        """
+        Versão assíncrona de generate (padrão: roda generate em outra thread)
+
+        Args:
+            prompt (str): Prompt completo
+
+        Returns:
+            str: Texto da resposta
+        """
+        return await asyncio.to_thread(self.generate, prompt)
+
+    async def astream(self, prompt):
+        """
+        Gera a resposta em partes (padrão: uma única parte)
+
+        Args:
+            prompt (str): Prompt completo
+
+        Yields:
+            str: Trechos da resposta
+        """
+        yield await self.agenerate(prompt)
+
+
+class GeminiBackend(LLMBackend):
+    """
+    Backend do Google Gemini
+    """
+
+    name = 'gemini'
+
+    def __init__(self, model_name='gemini-2.0-flash', api_key=None):
+        import google.generativeai as genai
+
+        genai.configure(api_key=api_key or os.getenv('GEMINI_API_KEY'))
+        self.model_name = model_name
+        self.model = genai.GenerativeModel(model_name)
+
+    def generate(self, prompt):
+        return self.model.generate_content(prompt).text
+
+    async def agenerate(self, prompt):
+        return (await self.model.generate_content_async(prompt)).text
+
+    async def astream(self, prompt):
+        response = await self.model.generate_content_async(prompt, stream=True)
+        async for chunk in response:
+            if chunk.text:
+                yield chunk.text
+
+
+class FakeBackend(LLMBackend):
+    """
+    Modelo local determinístico
+
+    Cada chamada espera `latency` segundos (tempo até o primeiro token) e
+    depois produz a resposta a `tokens_per_second` palavras por segundo
+    (0 = instantâneo). Registra o pico de chamadas simultâneas.
+    """
+
+    name = 'fake'
+
+    DEFAULT_ANSWER = "🔍 homelab-dev - CPU: 45%"
+
+    def __init__(self, latency=0.2, tokens_per_second=0, answer=DEFAULT_ANSWER):
+        self.latency = latency
+        self.tokens_per_second = tokens_per_second
+        self.answer = answer
+        self.calls = 0
+        self.in_flight = 0
+        self.peak_in_flight = 0
+        self._lock = threading.Lock()
+
+    def _enter(self):
+        with self._lock:
+            self.calls += 1
+            self.in_flight += 1
+            self.peak_in_flight = max(self.peak_in_flight, self.in_flight)
+
+    def _exit(self):
+        with self._lock:
+            self.in_flight -= 1
+
+    def _tokens(self):
+        words = self.answer.split(' ')
+        return [word if i == 0 else f" {word}" for i, word in enumerate(words)]
+
+    def _token_delay(self):
+        return 1 / self.tokens_per_second if self.tokens_per_second else 0.0
+
+    def generate(self, prompt):
+        self._enter()
+        try:
+            time.sleep(self.latency + len(self._tokens()) * self._token_delay())
+            return self.answer
+        finally:
+            self._exit()
+
+    async def agenerate(self, prompt):
+        self._enter()
+        try:
+            await asyncio.sleep(self.latency + len(self._tokens()) * self._token_delay())
+            return self.answer
+        finally:
+            self._exit()
+
+    async def astream(self, prompt):
+        self._enter()
+        try:
+            await asyncio.sleep(self.latency)
+            for token in self._tokens():
+                if self.tokens_per_second:
+                    await asyncio.sleep(self._token_delay())
+                yield token
+        finally:
+            self._exit()
+
+
+class OpenAICompatibleBackend(LLMBackend):
+    """
+    Backend para servidores compatíveis com a API da OpenAI
+
+    Usa POST {base_url}/chat/completions; o streaming lê os eventos SSE
+    ("data: {...}") em uma thread e os repassa ao event loop por uma fila
+    limitada. Se o consumidor para (aclose, desconexão), a thread para de
+    ler e fecha a resposta HTTP.
+    """
+
+    name = 'openai'
+
+    # Trechos lidos do servidor e ainda não consumidos no streaming
+    STREAM_BUFFER = 64
+
+    def __init__(self, base_url='http://localhost:8080/v1', model_name='local-model', api_key=None,
+                 timeout=60.0, max_tokens=None):
+        self.url = base_url.rstrip('/') + '/chat/completions'
+        self.model_name = model_name
+        self.api_key = api_key
+        self.timeout = timeout
+        self.max_tokens = max_tokens
+
+    def _request(self, prompt, stream):
+        payload = {
+            'model': self.model_name,
+            'messages': [{'role': 'user', 'content': prompt}],
+            'stream': stream,
+        }
+        if self.max_tokens:
+            payload['max_tokens'] = self.max_tokens
+        headers = {'Content-Type': 'application/json'}
+        if self.api_key:
+            headers['Authorization'] = f"Bearer {self.api_key}"
+        request = urllib.request.Request(self.url, json.dumps(payload).encode('utf-8'), headers)
+        try:
+            return urllib.request.urlopen(request, timeout=self.timeout)
+        except urllib.error.HTTPError as e:
+            # 429 e 5xx são transitórios: ConnectionError entra nas novas tentativas do cliente
+            if e.code == 429 or e.code >= 500:
+                raise ConnectionError(f"{self.url} respondeu HTTP {e.code}") from e
+            raise
+        except urllib.error.URLError as e:
+            raise ConnectionError(f"{self.url} inacessível: {e.reason}") from e
+
+    def generate(self, prompt):
+        with self._request(prompt, stream=False) as response:
+            body = json.load(response)
+        return body['choices'][0]['message']['content'] or ''
+
+    def _iter_stream(self, prompt):
+        with self._request(prompt, stream=True) as response:
+            for line in response:
+                line = line.strip()
+                if not line.startswith(b'data:'):
+                    continue
+                data = line[5:].strip()
+                if data == b'[DONE]':
+                    return
+                delta = json.loads(data)['choices'][0].get('delta', {})
+                if delta.get('content'):
+                    yield delta['content']
+
+    async def astream(self, prompt):
+        loop = asyncio.get_running_loop()
+        # Fila limitada: com o consumidor lento, a thread para de ler o servidor
+        queue = asyncio.Queue(maxsize=self.STREAM_BUFFER)
+        stop = threading.Event()
+        done = object()
+
+        def put(item):
+            # Espera vaga na fila sem bloquear o loop; desiste se o consumidor parou
+            if stop.is_set():
+                return
+            try:
+                future = asyncio.run_coroutine_threadsafe(queue.put(item), loop)
+            except RuntimeError:
+                # Event loop já encerrado
+                return
+            while True:
+                try:
+                    future.result(timeout=0.1)
+                    return
+                except FutureTimeoutError:
+                    if stop.is_set():
+                        future.cancel()
+                        return
+
+        def produce():
+            chunks = self._iter_stream(prompt)
+            try:
+                for text in chunks:
+                    if stop.is_set():
+                        return
+                    put(text)
+                put(done)
+            except BaseException as e:
+                put(e)
+            finally:
+                # Fecha a resposta HTTP também quando o consumidor parou no meio
+                chunks.close()
+
+        threading.Thread(target=produce, name='openai-stream', daemon=True).start()
+        try:
+            while True:
+                item = await queue.get()
+                if item is done:
+                    return
+                if isinstance(item, BaseException):
+                    raise item
+                yield item
+        finally:
+            # aclose(), cliente desconectado ou nova tentativa do ResilientClient
+            stop.set()
+
+
+def get_llm_backend():
+    """
+    Cria o backend de modelo conforme settings.POLDO_LLM_BACKEND
+
+    Returns:
+        LLMBackend: Backend configurado ('gemini' por padrão)
+    """
+    config = getattr(settings, 'POLDO_LLM_BACKEND', {})
+    backend = config.get('BACKEND', 'gemini')
+
+    if backend == 'fake':
+        return FakeBackend(
+            latency=config.get('FAKE_LATENCY', 0.2),
+            tokens_per_second=config.get('FAKE_TOKENS_PER_SECOND', 0),
+        )
+    if backend == 'openai':
+        return OpenAICompatibleBackend(
+            base_url=config.get('BASE_URL', 'http://localhost:8080/v1'),
+            model_name=config.get('MODEL') or 'local-model',
+            api_key=config.get('API_KEY'),
+            timeout=config.get('TIMEOUT', 60.0),
+            max_tokens=config.get('MAX_TOKENS'),
+        )
+    if backend != 'gemini':
+        raise ValueError(f"POLDO_LLM_BACKEND desconhecido: {backend!r}")
+    return GeminiBackend(model_name=config.get('MODEL') or 'gemini-2.0-flash')
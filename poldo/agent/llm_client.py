@@ -0,0 +1,544 @@
+"""
+Cliente resiliente para o modelo de linguagem
+
+Envolve o backend do modelo (agent/llm_backends.py) com os controles que
+faltavam quando o modelo fica lento ou começa a devolver erros de cota:
+
+- Limite de chamadas simultâneas (semáforo compartilhado por threads e
+  corrotinas)
+- Limite de taxa (token bucket)
+- Prazo por tentativa e prazo total da chamada
+- Novas tentativas com backoff exponencial e jitter, só para erros
+  transitórios (cota, indisponibilidade, timeout)
+- Circuit breaker: após falhas seguidas, falha na hora por um período,
+  para o ChatAgent responder em modo degradado sem esperar o modelo
+"""
+
+import asyncio
+import logging
+import random
+import sys
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeoutError
+
+from .llm_backends import LLMBackend
+
+logger = logging.getLogger(__name__)
+
+
+class LLMUnavailable(Exception):
+    """O modelo não pode ser chamado agora (sem consumir o prazo da requisição)"""
+
+
+class CircuitOpenError(LLMUnavailable):
+    """Circuit breaker aberto: o modelo falhou seguidamente há pouco"""
+
+
+class OverloadedError(LLMUnavailable):
+    """Limite de chamadas simultâneas ou de taxa não liberou dentro do prazo"""
+
+
+def retryable_errors():
+    """
+    Erros transitórios que merecem nova tentativa
+
+    Só é avaliada quando uma chamada falha. Os erros do Google só
+    aparecem se o SDK do Gemini já foi importado pelo backend, então não
+    é preciso importá-lo (caro) aqui.
+
+    Returns:
+        tuple: Classes de exceção
+    """
+    errors = (TimeoutError, ConnectionError)
+    google_exceptions = sys.modules.get('google.api_core.exceptions')
+    if google_exceptions is not None:
+        errors += (
+            google_exceptions.ResourceExhausted,
+            google_exceptions.ServiceUnavailable,
+            google_exceptions.DeadlineExceeded,
+            google_exceptions.InternalServerError,
+        )
+    return errors
+
+
+class TokenBucket:
+    """
+    Limite de taxa: até `burst` chamadas de uma vez, `rate` por segundo em média
+    """
+
+    def __init__(self, rate, burst):
+        self.rate = rate
+        self.burst = burst
+        self._tokens = float(burst)
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def reserve(self, max_wait):
+        """
+        Reserva um token
+
+        Args:
+            max_wait (float): Espera máxima aceitável em segundos
+
+        Returns:
+            float: Segundos a esperar antes da chamada, ou None se passar de max_wait
+        """
+        if not self.rate:
+            return 0.0
+        with self._lock:
+            now = time.monotonic()
+            self._tokens = min(self.burst, self._tokens + (now - self._updated) * self.rate)
+            self._updated = now
+            wait = max(0.0, (1 - self._tokens) / self.rate)
+            if wait > max_wait:
+                return None
+            self._tokens -= 1
+            return wait
+
+
+class CircuitBreaker:
+    """
+    Circuit breaker de três estados (fechado, aberto, meio-aberto)
+
+    Abre após `threshold` falhas seguidas; depois de `reset_timeout`
+    segundos deixa passar uma chamada de teste (meio-aberto), que fecha
+    o circuito se der certo ou o reabre se falhar. O teste é uma permissão
+    única de quem recebeu True de before_call: se a chamada terminar sem
+    resultado (cancelada, interrompida no meio do streaming), end_trial
+    devolve a permissão e o circuito volta a aberto, pronto para outro teste.
+    """
+
+    CLOSED, OPEN, HALF_OPEN = 'closed', 'open', 'half_open'
+
+    def __init__(self, threshold=5, reset_timeout=30.0):
+        self.threshold = threshold
+        self.reset_timeout = reset_timeout
+        self.state = self.CLOSED
+        self.failures = 0
+        self.opened_at = 0.0
+        self.trips = 0
+        self._lock = threading.Lock()
+
+    def _is_open(self):
+        return self.state == self.HALF_OPEN or (
+            self.state == self.OPEN and time.monotonic() - self.opened_at < self.reset_timeout
+        )
+
+    def check(self):
+        """Levanta CircuitOpenError se o circuito está aberto, sem reservar o teste"""
+        with self._lock:
+            if self._is_open():
+                raise CircuitOpenError("Modelo indisponível (circuit breaker aberto)")
+
+    def before_call(self):
+        """
+        Autoriza uma chamada ao modelo (logo antes de chamá-lo)
+
+        Returns:
+            bool: True se esta é a chamada de teste do meio-aberto; quem a
+                recebe deve chamar end_trial ao terminar, em qualquer caso
+
+        Raises:
+            CircuitOpenError: Se a chamada não deve ir ao modelo
+        """
+        with self._lock:
+            if self.state == self.CLOSED:
+                return False
+            if self._is_open():
+                raise CircuitOpenError("Modelo indisponível (circuit breaker aberto)")
+            self.state = self.HALF_OPEN
+            return True
+
+    def end_trial(self):
+        """Devolve a permissão de teste se a chamada terminou sem registrar sucesso ou falha"""
+        with self._lock:
+            if self.state == self.HALF_OPEN:
+                # opened_at antigo: a próxima chamada já pode fazer o teste
+                self.state = self.OPEN
+
+    def record_success(self):
+        with self._lock:
+            self.state = self.CLOSED
+            self.failures = 0
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            if self.state == self.HALF_OPEN or self.failures >= self.threshold:
+                if self.state != self.OPEN:
+                    self.trips += 1
+                    logger.warning("Circuit breaker do modelo aberto após %d falhas", self.failures)
+                self.state = self.OPEN
+                self.opened_at = time.monotonic()
+
+
+class SlotPool:
+    """
+    Vagas de chamadas simultâneas, compartilhadas por threads e corrotinas
+
+    As threads esperam em uma Condition; as corrotinas esperam em um
+    future do próprio event loop, sem ocupar uma thread. Uma vaga
+    liberada com corrotinas na fila passa direto para a primeira delas.
+    """
+
+    def __init__(self, size):
+        self.size = size
+        self.available = size
+        self._condition = threading.Condition()
+        self._waiters = deque()
+
+    def acquire(self, timeout):
+        """
+        Reserva uma vaga, bloqueando a thread
+
+        Args:
+            timeout (float): Espera máxima em segundos
+
+        Returns:
+            bool: True se reservou, False se o prazo acabou
+        """
+        ends_at = time.monotonic() + timeout
+        with self._condition:
+            while not self.available:
+                remaining = ends_at - time.monotonic()
+                if remaining <= 0:
+                    return False
+                self._condition.wait(remaining)
+            self.available -= 1
+            return True
+
+    async def aacquire(self, timeout):
+        """
+        Reserva uma vaga sem bloquear o event loop
+
+        Args:
+            timeout (float): Espera máxima em segundos
+
+        Returns:
+            bool: True se reservou, False se o prazo acabou
+        """
+        loop = asyncio.get_running_loop()
+        with self._condition:
+            if self.available:
+                self.available -= 1
+                return True
+            waiter = (loop, loop.create_future())
+            self._waiters.append(waiter)
+
+        future = waiter[1]
+        try:
+            await asyncio.wait_for(future, timeout)
+            return True
+        except (asyncio.TimeoutError, asyncio.CancelledError) as e:
+            with self._condition:
+                queued = waiter in self._waiters
+                if queued:
+                    self._waiters.remove(waiter)
+            future.cancel()
+            # Recebeu a vaga no mesmo instante em que desistiu: devolve
+            # (se a entrega ainda está pendente, _grant a devolve)
+            if not queued and not future.cancelled():
+                self.release()
+            if isinstance(e, asyncio.CancelledError):
+                raise
+            return False
+
+    def release(self):
+        """Libera uma vaga (para a primeira corrotina na fila, se houver)"""
+        with self._condition:
+            while self._waiters:
+                loop, future = self._waiters.popleft()
+                try:
+                    loop.call_soon_threadsafe(self._grant, future)
+                    return
+                except RuntimeError:
+                    # Event loop já encerrado: passa para o próximo
+                    continue
+            self.available += 1
+            self._condition.notify()
+
+    def _grant(self, future):
+        # Roda no event loop de quem espera
+        if future.done():
+            self.release()
+        else:
+            future.set_result(True)
+
+
+class ResilientClient:
+    """
+    CONTROLLER - Backend com limites de concorrência, taxa, prazo e circuit breaker
+
+    Mesma interface do backend envolvido (generate, agenerate e astream).
+    """
+
+    def __init__(self, backend, max_in_flight=8, rate=5.0, burst=10, timeout=30.0, deadline=60.0,
+                 retries=2, backoff=0.5, max_backoff=8.0, breaker_threshold=5, breaker_reset=30.0):
+        self.backend = backend
+        self.max_in_flight = max_in_flight
+        self.timeout = timeout
+        self.deadline = deadline
+        self.retries = retries
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.bucket = TokenBucket(rate, burst)
+        self.breaker = CircuitBreaker(breaker_threshold, breaker_reset)
+        self._slots = SlotPool(max_in_flight)
+        # Threads que executam as chamadas síncronas, para poder abandonar
+        # uma tentativa que passou do prazo (ela continua com a sua vaga)
+        self._executor = ThreadPoolExecutor(max_workers=max_in_flight, thread_name_prefix='llm')
+        # Backend sem agenerate próprio: o padrão roda generate em uma
+        # thread, que não para quando a tentativa é cancelada
+        self._threaded_async = getattr(type(backend), 'agenerate', None) is LLMBackend.agenerate
+        self._stats_lock = threading.Lock()
+        self.in_flight = 0
+        self.calls = 0
+        self.failures = 0
+        self.retried = 0
+        self.timeouts = 0
+        self.rejected = 0
+
+    def _count(self, counter, delta=1):
+        with self._stats_lock:
+            setattr(self, counter, getattr(self, counter) + delta)
+
+    def _backoff_delay(self, attempt):
+        # "Full jitter": espalha as novas tentativas de vários clientes
+        return random.uniform(0, min(self.max_backoff, self.backoff * 2 ** attempt))
+
+    def _admit(self, ends_at):
+        """Verifica o breaker (sem reservar o teste) e um token; retorna a espera necessária"""
+        try:
+            self.breaker.check()
+        except CircuitOpenError:
+            self._count('rejected')
+            raise
+        wait = self.bucket.reserve(max(0.0, ends_at - time.monotonic()))
+        if wait is None:
+            self._count('rejected')
+            raise OverloadedError("Limite de taxa do modelo atingido")
+        return wait
+
+    def _start_call(self):
+        """Autoriza a tentativa no breaker (com a vaga já reservada); True se é o teste"""
+        try:
+            return self.breaker.before_call()
+        except CircuitOpenError:
+            self._count('rejected')
+            raise
+
+    def _record_failure(self):
+        self._count('failures')
+        self.breaker.record_failure()
+
+    def _retry_delay(self, error, attempt, ends_at):
+        """Retorna a espera antes da próxima tentativa (ou levanta o erro)"""
+        delay = self._backoff_delay(attempt)
+        if attempt >= self.retries or time.monotonic() + delay >= ends_at:
+            raise error
+        self._count('retried')
+        return delay
+
+    def _attempt_timeout(self, ends_at):
+        return min(self.timeout, max(0.0, ends_at - time.monotonic()))
+
+    def _timeout_error(self):
+        self._count('timeouts')
+        return TimeoutError(f"Modelo não respondeu em {self.timeout:.0f}s")
+
+    def _acquire_slot(self, ends_at):
+        if not self._slots.acquire(max(0.0, ends_at - time.monotonic())):
+            self._count('rejected')
+            raise OverloadedError("Muitas chamadas simultâneas ao modelo")
+        self._count('in_flight')
+
+    async def _aacquire_slot(self, ends_at):
+        if not await self._slots.aacquire(max(0.0, ends_at - time.monotonic())):
+            self._count('rejected')
+            raise OverloadedError("Muitas chamadas simultâneas ao modelo")
+        self._count('in_flight')
+
+    def _release_slot(self):
+        self._count('in_flight', -1)
+        self._slots.release()
+
+    def generate(self, prompt):
+        """
+        Chama o backend de forma síncrona com todos os controles
+
+        Cada tentativa ocupa uma vaga até a chamada ao backend terminar de
+        fato: uma tentativa abandonada por prazo continua contando em
+        max_in_flight enquanto a thread dela espera o modelo.
+
+        Args:
+            prompt (str): Prompt completo
+
+        Returns:
+            str: Texto da resposta
+        """
+        ends_at = time.monotonic() + self.deadline
+        time.sleep(self._admit(ends_at))
+        attempt = 0
+        while True:
+            self._acquire_slot(ends_at)
+            trial = False
+            try:
+                trial = self._start_call()
+                future = self._executor.submit(self.backend.generate, prompt)
+            except BaseException:
+                if trial:
+                    self.breaker.end_trial()
+                self._release_slot()
+                raise
+            future.add_done_callback(lambda _: self._release_slot())
+
+            self._count('calls')
+            try:
+                answer = future.result(timeout=self._attempt_timeout(ends_at))
+                self.breaker.record_success()
+                return answer
+            except FutureTimeoutError:
+                error = self._timeout_error()
+                self._record_failure()
+            except retryable_errors() as e:
+                error = e
+                self._record_failure()
+            except Exception:
+                self._record_failure()
+                raise
+            finally:
+                if trial:
+                    self.breaker.end_trial()
+            time.sleep(self._retry_delay(error, attempt, ends_at))
+            attempt += 1
+
+    async def agenerate(self, prompt):
+        """
+        Versão assíncrona de generate
+
+        Backends sem agenerate próprio (ex: OpenAICompatibleBackend) rodam
+        generate nas threads do cliente e, como no caminho síncrono, a
+        vaga só é liberada quando a thread termina de fato.
+
+        Args:
+            prompt (str): Prompt completo
+
+        Returns:
+            str: Texto da resposta
+        """
+        ends_at = time.monotonic() + self.deadline
+        await asyncio.sleep(self._admit(ends_at))
+        attempt = 0
+        while True:
+            await self._aacquire_slot(ends_at)
+            trial = threaded = False
+            try:
+                trial = self._start_call()
+                self._count('calls')
+                if self._threaded_async:
+                    future = self._executor.submit(self.backend.generate, prompt)
+                    threaded = True
+                    future.add_done_callback(lambda _: self._release_slot())
+                    call = asyncio.wrap_future(future)
+                else:
+                    call = self.backend.agenerate(prompt)
+                answer = await asyncio.wait_for(call, timeout=self._attempt_timeout(ends_at))
+                self.breaker.record_success()
+                return answer
+            except asyncio.TimeoutError:
+                error = self._timeout_error()
+                self._record_failure()
+            except CircuitOpenError:
+                raise
+            except retryable_errors() as e:
+                error = e
+                self._record_failure()
+            except Exception:
+                self._record_failure()
+                raise
+            finally:
+                if trial:
+                    self.breaker.end_trial()
+                if not threaded:
+                    self._release_slot()
+            await asyncio.sleep(self._retry_delay(error, attempt, ends_at))
+            attempt += 1
+
+    async def astream(self, prompt):
+        """
+        Gera a resposta em partes com todos os controles
+
+        O prazo e as novas tentativas valem até a primeira parte chegar;
+        a vaga de chamada simultânea só é liberada no fim do streaming.
+
+        Args:
+            prompt (str): Prompt completo
+
+        Yields:
+            str: Trechos da resposta
+        """
+        ends_at = time.monotonic() + self.deadline
+        await asyncio.sleep(self._admit(ends_at))
+        attempt = 0
+        while True:
+            await self._aacquire_slot(ends_at)
+            trial = False
+            stream = None
+            try:
+                trial = self._start_call()
+                self._count('calls')
+                stream = self.backend.astream(prompt)
+                try:
+                    first = await asyncio.wait_for(anext(stream, None), timeout=self._attempt_timeout(ends_at))
+                except asyncio.TimeoutError:
+                    error = self._timeout_error()
+                    self._record_failure()
+                except retryable_errors() as e:
+                    error = e
+                    self._record_failure()
+                except Exception:
+                    self._record_failure()
+                    raise
+                else:
+                    try:
+                        if first is not None:
+                            yield first
+                            async for chunk in stream:
+                                yield chunk
+                    except Exception:
+                        self._record_failure()
+                        raise
+                    self.breaker.record_success()
+                    return
+            finally:
+                try:
+                    if stream is not None:
+                        await stream.aclose()
+                finally:
+                    # Cancelamento ou aclose() no meio do streaming: sem resultado
+                    if trial:
+                        self.breaker.end_trial()
+                    self._release_slot()
+            await asyncio.sleep(self._retry_delay(error, attempt, ends_at))
+            attempt += 1
+
+    def stats(self):
+        """
+        Retorna os contadores do cliente
+
+        Returns:
+            dict: Chamadas, falhas, novas tentativas, timeouts, rejeições e estado do breaker
+        """
+        return {
+            'in_flight': self.in_flight,
+            'max_in_flight': self.max_in_flight,
+            'calls': self.calls,
+            'failures': self.failures,
+            'retried': self.retried,
+            'timeouts': self.timeouts,
+            'rejected': self.rejected,
+            'breaker_state': self.breaker.state,
+            'breaker_trips': self.breaker.trips,
+        }
@@ -0,0 +1,90 @@
+"""
+Dados sintéticos de homelabs para os comandos de benchmark
+
+Gera snapshots no mesmo formato de agent/data/homelabs.json (lista de
+snapshots com timestamp) para qualquer número de hosts, e trocas de
+mensagens do chat (pergunta e resposta) sobre esses hosts.
+"""
+
+import random
+from datetime import datetime, timedelta
+
+ENVIRONMENTS = ('dev', 'test', 'prod')
+
+
+def synthetic_snapshots(n_hosts, n_snapshots, interval_minutes=15, seed=42):
+    """
+    Gera snapshots sintéticos de homelabs
+
+    Args:
+        n_hosts (int): Número de homelabs
+        n_snapshots (int): Número de snapshots
+        interval_minutes (int): Intervalo entre snapshots
+        seed (int): Semente do gerador aleatório (resultados reproduzíveis)
+
+    Returns:
+        list: Snapshots no formato de homelabs.json
+    """
+    rng = random.Random(seed)
+    start = datetime(2025, 9, 27, 0, 0, 0)
+    names = [f"homelab-{ENVIRONMENTS[i % len(ENVIRONMENTS)]}" + (f"-{i // len(ENVIRONMENTS)}" if i >= len(ENVIRONMENTS) else '')
+             for i in range(n_hosts)]
+
+    snapshots = []
+    for step in range(n_snapshots):
+        snapshot = {'timestamp': (start + timedelta(minutes=interval_minutes * step)).strftime('%Y-%m-%d %H:%M:%S')}
+        for index, name in enumerate(names):
+            snapshot[name] = {
+                'cpu': f"{rng.randint(1, 99)}%",
+                'memoria': f"{rng.randint(10, 95)}%",
+                'ram': f"{2 ** rng.randint(2, 6)}GB",
+                'docker': f"{rng.randint(0, 40)} containers ativos",
+                'portas': ['22'] + [str(rng.randint(1024, 9999)) for _ in range(rng.randint(1, 4))],
+                'rede': f"10.{index // 65536 % 256}.{index // 256 % 256}.{index % 256}",
+                'status': 'online' if rng.random() > 0.05 else 'offline',
+            }
+        snapshots.append(snapshot)
+    return snapshots
+
+
+_QUESTIONS = (
+    "qual a cpu do {host}?",
+    "status do {host}",
+    "quais portas estão abertas no {host}?",
+    "quanta memória o {host} está usando?",
+    "o {host} está online?",
+    "quantos containers rodam no {host}?",
+    "compare a cpu do {host} com o {other}",
+)
+
+
+def host_name(index):
+    """Nome do homelab de índice `index` (o mesmo de synthetic_snapshots)"""
+    environment = ENVIRONMENTS[index % len(ENVIRONMENTS)]
+    return f"homelab-{environment}" + (f"-{index // len(ENVIRONMENTS)}" if index >= len(ENVIRONMENTS) else '')
+
+
+def synthetic_messages(n_messages, n_hosts=300, seed=42):
+    """
+    Gera mensagens sintéticas do chat, alternando pergunta e resposta
+
+    Args:
+        n_messages (int): Número de mensagens
+        n_hosts (int): Número de homelabs citados
+        seed (int): Semente do gerador aleatório
+
+    Yields:
+        tuple: (papel, texto)
+    """
+    rng = random.Random(seed)
+    for i in range(0, n_messages, 2):
+        host = host_name(rng.randrange(n_hosts))
+        yield 'user', rng.choice(_QUESTIONS).format(host=host, other=host_name(rng.randrange(n_hosts)))
+        if i + 1 < n_messages:
+            yield 'bot', rng.choice((
+                f"🔍 {host} - CPU: {rng.randint(1, 99)}%",
+                f"📊 Status do {host}:\n• CPU: {rng.randint(1, 99)}%\n• Memória: {rng.randint(10, 95)}%\n"
+                f"• Portas: 22, {rng.randint(1024, 9999)}\n• Status: online",
+                f"🔍 {host} - Portas: 22, {rng.randint(1024, 9999)}, {rng.randint(1024, 9999)}",
+                f"O {host} tem {rng.randint(0, 40)} containers ativos e está online.",
+            ))
@@ -0,0 +1,66 @@
+"""
+Arquiva conversas antigas e compacta respostas de erro repetidas
+
+Move para ArchivedConversation (JSON comprimido) as conversas sem
+atividade há mais de --days dias e remove as tentativas repetidas que
+falharam com o mesmo erro. Com --every, roda periodicamente (para um
+processo separado, cron ou systemd).
+
+Uso:
+    python manage.py archive_conversations --days 90
+    python manage.py archive_conversations --every 3600
+    python manage.py archive_conversations --restore 42
+"""
+
+import time
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import close_old_connections
+from django.utils import timezone
+
+from agent.archive import archive_conversations, dedupe_error_replies, restore_conversation
+
+
+class Command(BaseCommand):
+    help = 'Arquiva conversas antigas e remove respostas de erro repetidas'
+
+    def add_arguments(self, parser):
+        config = getattr(settings, 'POLDO_ARCHIVE', {})
+        parser.add_argument('--days', type=int, default=config.get('AFTER_DAYS', 90),
+                            help='Arquiva conversas sem atividade há mais dias que isso')
+        parser.add_argument('--batch-size', type=int, default=config.get('BATCH_SIZE', 100),
+                            help='Conversas arquivadas por transação')
+        parser.add_argument('--no-dedupe', action='store_true',
+                            help='Não remove as respostas de erro repetidas')
+        parser.add_argument('--every', type=float,
+                            help='Repete a cada N segundos (job periódico)')
+        parser.add_argument('--restore', type=int, metavar='ID',
+                            help='Devolve a conversa arquivada ID às tabelas vivas')
+
+    def handle(self, *args, **options):
+        if options['restore'] is not None:
+            if restore_conversation(options['restore']) is None:
+                raise CommandError(f"Conversa {options['restore']} não está arquivada")
+            self.stdout.write(f"Conversa {options['restore']} restaurada")
+            return
+
+        while True:
+            self._run_once(options)
+            if not options['every']:
+                return
+            close_old_connections()
+            time.sleep(options['every'])
+
+    def _run_once(self, options):
+        before = timezone.now() - timedelta(days=options['days'])
+
+        if not options['no_dedupe']:
+            removed = dedupe_error_replies(before)
+            self.stdout.write(f"Respostas de erro repetidas removidas: {removed} mensagens")
+
+        result = archive_conversations(before, batch_size=options['batch_size'])
+        self.stdout.write(
+            f"Arquivadas: {result['conversations']} conversas, {result['messages']} mensagens"
+        )
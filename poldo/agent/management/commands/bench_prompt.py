@@ -0,0 +1,116 @@
+"""
+Benchmark do tamanho do prompt e da latência do modelo
+
+Compara o formato antigo (JSON indentado de todos os homelabs em todo
+prompt) com o formato compacto do PromptBuilder (CSV filtrado pela
+pergunta e limitado por orçamento de tokens), para vários tamanhos de frota.
+
+Sem --live, a latência vem de um modelo falso proporcional ao número de
+tokens do prompt; com --live, usa o backend configurado em POLDO_LLM_BACKEND.
+
+Uso:
+    python manage.py bench_prompt --homelabs 3 30 100 --snapshots 3
+"""
+
+import json
+import time
+
+from django.core.management.base import BaseCommand
+
+from agent import controller
+from agent.prompt_builder import estimate_tokens
+
+from ._synthetic import synthetic_snapshots
+
+LEGACY_TEMPLATE = """
+Você é o Poldo, um assistente especializado em monitoramento de homelabs.
+
+DADOS DOS HOMELABS DISPONÍVEIS:
+{homelabs_json}
+
+INSTRUÇÕES:
+1. Responda APENAS com base nos dados fornecidos acima
+2. Se o usuário perguntar sobre um homelab que não existe, informe os homelabs disponíveis
+3. Seja direto e objetivo nas respostas
+4. Use emojis quando apropriado para tornar as respostas mais amigáveis
+5. Se perguntarem sobre status completo, liste todas as métricas do homelab
+6. Se perguntarem sobre uma métrica específica, foque apenas nela
+7. Sempre responda em português brasileiro
+
+EXEMPLOS DE RESPOSTAS:
+- Para "qual a cpu do homelab-dev?": "🔍 homelab-dev - CPU: 45%"
+- Para "status do homelab-test": Liste todas as métricas do homelab-test
+- Para homelab inexistente: "❌ Homelab não encontrado. Homelabs disponíveis: homelab-dev, homelab-test, homelab-prod"
+"""
+
+QUESTIONS = (
+    'compare a cpu do homelab-dev com o homelab-prod',
+    'como evoluiu a memória do homelab-test?',
+    'quais homelabs estão offline?',
+)
+
+
+class Command(BaseCommand):
+    help = 'Compara tamanho do prompt e latência do modelo: JSON completo vs PromptBuilder'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--homelabs', type=int, nargs='+', default=[3, 30, 100],
+                            help='Tamanhos de frota a medir')
+        parser.add_argument('--snapshots', type=int, default=3,
+                            help='Snapshots por homelab')
+        parser.add_argument('--base-latency', type=float, default=0.2,
+                            help='Latência fixa do modelo falso (s)')
+        parser.add_argument('--per-token', type=float, default=0.00005,
+                            help='Latência do modelo falso por token de entrada (s)')
+        parser.add_argument('--live', action='store_true',
+                            help='Mede a latência real do backend configurado')
+
+    def handle(self, *args, **options):
+        agent = controller.chat_agent
+
+        self.stdout.write(
+            f"{'homelabs':>9}{'formato':>10}{'chars':>10}{'tokens':>9}{'build (ms)':>12}{'modelo (s)':>12}"
+        )
+        for n_hosts in options['homelabs']:
+            data = synthetic_snapshots(n_hosts, options['snapshots'])
+            context = agent.build_context(f"bench-{n_hosts}", data)
+
+            legacy = self._measure(options, lambda q: LEGACY_TEMPLATE.format(
+                homelabs_json=json.dumps(data, indent=2, ensure_ascii=False)
+            ) + f"\n\nPERGUNTA DO USUÁRIO: {q}")
+            compact = self._measure(options, lambda q: agent._build_prompt(context, q))
+
+            for name, result in (('json', legacy), ('compacto', compact)):
+                self.stdout.write(
+                    f"{n_hosts:>9}{name:>10}{result['chars']:>10}{result['tokens']:>9}"
+                    f"{result['build_ms']:>12.2f}{result['model_s']:>12.3f}"
+                )
+
+    def _measure(self, options, build):
+        """Média por pergunta de tamanho, tempo de montagem e latência do modelo"""
+        chars = tokens = build_time = model_time = 0
+        for question in QUESTIONS:
+            start = time.perf_counter()
+            prompt = build(question)
+            build_time += time.perf_counter() - start
+
+            chars += len(prompt)
+            tokens += estimate_tokens(prompt)
+            model_time += self._call_model(options, prompt)
+
+        count = len(QUESTIONS)
+        return {
+            'chars': chars // count,
+            'tokens': tokens // count,
+            'build_ms': build_time / count * 1000,
+            'model_s': model_time / count,
+        }
+
+    @staticmethod
+    def _call_model(options, prompt):
+        start = time.perf_counter()
+        if options['live']:
+            controller.chat_agent.backend.generate(prompt)
+        else:
+            time.sleep(options['base_latency'] + estimate_tokens(prompt) * options['per_token'])
+        return time.perf_counter() - start
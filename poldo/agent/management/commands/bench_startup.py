@@ -0,0 +1,150 @@
+"""
+Benchmark do custo de inicialização (cold start) e de criação de workers
+
+Cada medição roda em um processo Python novo:
+
+- importação: django.setup() e as URLs do projeto, com as importações
+  mais lentas vistas por `python -X importtime`
+- primeira requisição: do início do processo até a resposta de /stats/,
+  que cria o ChatAgent (e o backend do modelo)
+- fork: com o projeto já importado (como o gunicorn --preload), tempo do
+  fork e da primeira requisição no worker filho
+
+Uso:
+    python manage.py bench_startup --runs 5
+    python manage.py bench_startup --backend fake --top 15
+"""
+
+import json
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+# Executado em um processo novo; imprime os tempos medidos em JSON
+PROBE = r"""
+import json, os, sys, time
+
+started = time.perf_counter()
+import django
+django.setup()
+import poldo.urls
+imported = time.perf_counter()
+from django.test.utils import setup_test_environment
+setup_test_environment()
+from django.test import Client
+
+mode = sys.argv[1]
+if mode == 'import':
+    print(json.dumps({'import_s': imported - started}))
+elif mode == 'request':
+    client = Client()
+    first_start = time.perf_counter()
+    assert client.get('/stats/').status_code == 200
+    first_end = time.perf_counter()
+    client.get('/stats/')
+    print(json.dumps({
+        'import_s': imported - started,
+        'first_request_s': first_end - first_start,
+        'second_request_s': time.perf_counter() - first_end,
+        'ttfr_s': first_end - started,
+    }))
+else:
+    read_fd, write_fd = os.pipe()
+    fork_start = time.perf_counter()
+    pid = os.fork()
+    if pid == 0:
+        forked = time.perf_counter()
+        os.close(read_fd)
+        Client().get('/stats/')
+        done = time.perf_counter()
+        os.write(write_fd, json.dumps({
+            'fork_s': forked - fork_start,
+            'worker_first_request_s': done - forked,
+        }).encode())
+        os._exit(0)
+    os.close(write_fd)
+    with os.fdopen(read_fd) as pipe:
+        result = json.loads(pipe.read())
+    os.waitpid(pid, 0)
+    print(json.dumps(result))
+"""
+
+
+class Command(BaseCommand):
+    help = 'Mede importação, tempo até a primeira requisição e custo de fork de workers'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--runs', type=int, default=5,
+                            help='Processos por medição (mostra a mediana)')
+        parser.add_argument('--backend', choices=['gemini', 'fake', 'openai'],
+                            help='Backend do modelo (padrão: POLDO_LLM_BACKEND)')
+        parser.add_argument('--top', type=int, default=10,
+                            help='Quantas importações mais lentas listar')
+
+    def handle(self, *args, **options):
+        env = dict(os.environ, DJANGO_SETTINGS_MODULE=os.environ.get('DJANGO_SETTINGS_MODULE', 'poldo.settings'))
+        if options['backend']:
+            env['POLDO_LLM_BACKEND'] = options['backend']
+
+        rows = [('importação (setup + URLs)', self._median(options, env, 'import', 'import_s'))]
+        requests = [self._probe(env, 'request') for _ in range(options['runs'])]
+        for label, key in (('primeira requisição', 'first_request_s'),
+                           ('segunda requisição', 'second_request_s'),
+                           ('início até 1ª resposta', 'ttfr_s')):
+            rows.append((label, statistics.median(run[key] for run in requests)))
+        wall = [self._wall(env) for _ in range(options['runs'])]
+        rows.append(('processo (python + 1ª resposta)', statistics.median(wall)))
+        if hasattr(os, 'fork'):
+            forks = [self._probe(env, 'fork') for _ in range(options['runs'])]
+            rows.append(('fork do worker', statistics.median(run['fork_s'] for run in forks)))
+            rows.append(('1ª requisição no worker', statistics.median(run['worker_first_request_s'] for run in forks)))
+
+        self.stdout.write(f"{'medição':<34}{'mediana (ms)':>14}")
+        for label, seconds in rows:
+            self.stdout.write(f"{label:<34}{seconds * 1000:>14.1f}")
+
+        self.stdout.write("\nImportações mais lentas (acumulado, ms):")
+        for name, micros in self._slowest_imports(env, options['top']):
+            self.stdout.write(f"  {micros / 1000:>9.1f}  {name}")
+
+    def _probe(self, env, mode):
+        result = subprocess.run(
+            [sys.executable, '-c', PROBE, mode], cwd=settings.BASE_DIR, env=env,
+            capture_output=True, text=True, check=True,
+        )
+        return json.loads(result.stdout.strip().splitlines()[-1])
+
+    def _median(self, options, env, mode, key):
+        return statistics.median(self._probe(env, mode)[key] for _ in range(options['runs']))
+
+    def _wall(self, env):
+        """Tempo de parede do processo inteiro, incluindo o interpretador"""
+        start = time.perf_counter()
+        self._probe(env, 'request')
+        return time.perf_counter() - start
+
+    @staticmethod
+    def _slowest_imports(env, top):
+        """Importações de primeiro nível abaixo do projeto com maior tempo acumulado"""
+        result = subprocess.run(
+            [sys.executable, '-X', 'importtime', '-c', PROBE, 'import'], cwd=settings.BASE_DIR, env=env,
+            capture_output=True, text=True, check=True,
+        )
+        imports = {}
+        for line in result.stderr.splitlines():
+            if not line.startswith('import time:') or 'cumulative' in line:
+                continue
+            _, cumulative, name = line[len('import time:'):].split('|')
+            name = name.rstrip()
+            # Só pacotes de primeiro nível (sem os submódulos indentados)
+            if name.startswith(' ') and not name.startswith('  '):
+                name = name.strip()
+            elif name.startswith(' '):
+                continue
+            imports[name] = imports.get(name, 0) + int(cumulative)
+        return sorted(imports.items(), key=lambda item: -item[1])[:top]
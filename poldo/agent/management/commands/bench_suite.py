@@ -0,0 +1,425 @@
+"""
+Suíte de benchmarks de ponta a ponta do chat, sem rede
+
+Roda em um banco SQLite descartável com o FakeBackend no lugar do modelo
+e mede:
+
+- chat_view: tempo de renderização de /chat/ por número de conversas na
+  barra lateral e de mensagens na conversa aberta
+- send_message: latência (p50/p95) e vazão de /chat/send/ por nível de
+  concorrência, passando por todo o pipeline do ChatAgent
+- prompt: tempo de montagem e tamanho do prompt por número de homelabs
+- history: tempo de leitura do histórico de snapshots (JSON e JSON Lines)
+  por tamanho do arquivo
+- search: tempo da busca nas mensagens pelo índice textual do banco
+  (FTS5/tsvector) e por LIKE, por número de mensagens
+
+Os resultados vão para um arquivo JSON; com --compare, as medições são
+comparadas com um resultado anterior e o comando falha se alguma piorou
+além da tolerância (útil para comparar commits).
+
+Uso:
+    python manage.py bench_suite --output bench.json
+    python manage.py bench_suite --compare bench.json --tolerance 0.25
+    python manage.py bench_suite --only prompt history
+    python manage.py bench_suite --only search --search-messages 1000000
+"""
+
+import json
+import os
+import platform
+import shutil
+import statistics
+import subprocess
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+
+import django
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, connections
+from django.test import Client
+from django.test.utils import (
+    CaptureQueriesContext, setup_databases, setup_test_environment, teardown_databases,
+    teardown_test_environment,
+)
+from django.utils import timezone
+
+from agent import controller, search
+from agent.history_loader import snapshot_line
+from agent.llm_backends import FakeBackend
+from agent.llm_client import ResilientClient
+from agent.models import Conversation, HomelabHistoryStore, Message
+from agent.prompt_builder import estimate_tokens
+
+from ._synthetic import synthetic_messages, synthetic_snapshots
+from .bench_prompt import QUESTIONS
+
+BENCHMARKS = ('chat_view', 'send_message', 'prompt', 'history', 'search')
+
+# Buscas medidas (a última não encontra nada: pior caso do LIKE)
+SEARCH_QUERIES = ('portas homelab-prod-7', 'containers', 'memória homelab-dev-12', 'backup atrasado')
+
+# Métricas comparadas com --compare: tempos (menor é melhor) e vazão (maior é melhor)
+LOWER_IS_BETTER = ('median_ms', 'p50_ms', 'p95_ms', 'build_ms')
+HIGHER_IS_BETTER = ('throughput',)
+
+
+class Command(BaseCommand):
+    help = 'Benchmarks de ponta a ponta do chat (render, envio, prompt e histórico) com saída em JSON'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--only', nargs='+', choices=BENCHMARKS, default=list(BENCHMARKS),
+                            help='Benchmarks a rodar')
+        parser.add_argument('--output', default='bench_results.json',
+                            help='Arquivo JSON com os resultados')
+        parser.add_argument('--compare', metavar='BASELINE',
+                            help='Resultado anterior para detectar regressões')
+        parser.add_argument('--tolerance', type=float, default=0.25,
+                            help='Piora relativa aceita por métrica no --compare')
+        parser.add_argument('--repeat', type=int, default=5,
+                            help='Repetições por medição (mostra a mediana)')
+        parser.add_argument('--conversations', type=int, nargs='+', default=[10, 100, 1000],
+                            help='Conversas na barra lateral (chat_view)')
+        parser.add_argument('--messages', type=int, nargs='+', default=[10, 100, 1000],
+                            help='Mensagens na conversa aberta (chat_view)')
+        parser.add_argument('--concurrency', type=int, nargs='+', default=[1, 8, 32],
+                            help='Clientes simultâneos (send_message)')
+        parser.add_argument('--requests', type=int, default=64,
+                            help='Mensagens por nível de concorrência (send_message)')
+        parser.add_argument('--latency', type=float, default=0.05,
+                            help='Latência do modelo falso em segundos (send_message)')
+        parser.add_argument('--homelabs', type=int, nargs='+', default=[3, 30, 100, 300],
+                            help='Tamanhos de frota (prompt)')
+        parser.add_argument('--history-snapshots', type=int, nargs='+', default=[100, 1000, 5000],
+                            help='Snapshots no arquivo de histórico (history)')
+        parser.add_argument('--search-messages', type=int, nargs='+', default=[10000, 100000],
+                            help='Mensagens no banco (search)')
+        parser.add_argument('--history-hosts', type=int, default=30,
+                            help='Homelabs por snapshot do histórico (history)')
+
+    def handle(self, *args, **options):
+        if options['compare'] and not os.path.exists(options['compare']):
+            raise CommandError(f"Resultado de referência não encontrado: {options['compare']}")
+
+        results = []
+        if 'prompt' in options['only']:
+            results += self._bench_prompt(options)
+        if 'history' in options['only']:
+            results += self._bench_history(options)
+        if {'chat_view', 'send_message', 'search'} & set(options['only']):
+            results += self._with_database(options)
+
+        report = {'meta': self._meta(options), 'results': results}
+        with open(options['output'], 'w', encoding='utf-8') as file:
+            json.dump(report, file, indent=2, ensure_ascii=False)
+
+        for result in results:
+            params = ' '.join(f"{key}={value}" for key, value in result['params'].items())
+            metrics = ' '.join(
+                f"{key}={value:.2f}" if isinstance(value, float) else f"{key}={value}"
+                for key, value in result['metrics'].items()
+            )
+            self.stdout.write(f"{result['benchmark']:<13}{params:<40}{metrics}")
+        self.stdout.write(f"resultados gravados em {options['output']}")
+
+        if options['compare']:
+            self._compare(options, results)
+
+    # ------------------------------------------------------------------
+    # Benchmarks sem banco
+
+    def _bench_prompt(self, options):
+        """Montagem e tamanho do prompt por número de homelabs"""
+        agent = controller.chat_agent
+        results = []
+        for n_hosts in options['homelabs']:
+            data = synthetic_snapshots(n_hosts, 3)
+            start = time.perf_counter()
+            context = agent.build_context(f"bench-{n_hosts}", data)
+            context_ms = (time.perf_counter() - start) * 1000
+
+            timings, chars, tokens = [], 0, 0
+            for _ in range(options['repeat']):
+                for question in QUESTIONS:
+                    start = time.perf_counter()
+                    prompt = agent._build_prompt(context, question)
+                    timings.append((time.perf_counter() - start) * 1000)
+            for question in QUESTIONS:
+                prompt = agent._build_prompt(context, question)
+                chars += len(prompt)
+                tokens += estimate_tokens(prompt)
+
+            results.append(_result('prompt', {'homelabs': n_hosts}, {
+                'context_ms': context_ms,
+                'build_ms': statistics.median(timings),
+                'chars': chars // len(QUESTIONS),
+                'tokens': tokens // len(QUESTIONS),
+            }))
+        return results
+
+    def _bench_history(self, options):
+        """Leitura completa do histórico (JSON em blocos e JSON Lines)"""
+        results = []
+        workdir = tempfile.mkdtemp(prefix='poldo-bench-')
+        try:
+            for n_snapshots in options['history_snapshots']:
+                snapshots = synthetic_snapshots(options['history_hosts'], n_snapshots)
+                files = {
+                    'json': os.path.join(workdir, f"history-{n_snapshots}.json"),
+                    'jsonl': os.path.join(workdir, f"history-{n_snapshots}.jsonl"),
+                }
+                with open(files['json'], 'w', encoding='utf-8') as file:
+                    json.dump(snapshots, file, ensure_ascii=False)
+                with open(files['jsonl'], 'w', encoding='utf-8') as file:
+                    file.writelines(snapshot_line(snapshot) for snapshot in snapshots)
+
+                for file_format, path in files.items():
+                    timings = []
+                    for _ in range(options['repeat']):
+                        start = time.perf_counter()
+                        HomelabHistoryStore(path).get_homelab_names()
+                        timings.append(time.perf_counter() - start)
+                    median = statistics.median(timings)
+                    results.append(_result('history', {
+                        'snapshots': n_snapshots, 'hosts': options['history_hosts'], 'format': file_format,
+                    }, {
+                        'median_ms': median * 1000,
+                        'file_mb': os.path.getsize(path) / 2 ** 20,
+                        'snapshots_per_s': n_snapshots / median if median else 0.0,
+                    }))
+        finally:
+            shutil.rmtree(workdir, ignore_errors=True)
+        return results
+
+    # ------------------------------------------------------------------
+    # Benchmarks com banco
+
+    def _with_database(self, options):
+        """Roda chat_view e send_message em um banco de teste descartável"""
+        workdir = None
+        if connection.vendor == 'sqlite':
+            # Em arquivo, para que as threads do send_message usem WAL como em produção
+            workdir = tempfile.mkdtemp(prefix='poldo-bench-')
+            connection.settings_dict['TEST']['NAME'] = os.path.join(workdir, 'bench.sqlite3')
+
+        agent = controller.chat_agent
+        original_client = agent.client
+        setup_test_environment()
+        old_config = setup_databases(verbosity=0, interactive=False)
+        try:
+            results = []
+            if 'chat_view' in options['only']:
+                results += self._bench_chat_view(options)
+            if 'send_message' in options['only']:
+                results += self._bench_send_message(options)
+            if 'search' in options['only']:
+                results += self._bench_search(options)
+            return results
+        finally:
+            agent.client = original_client
+            connections.close_all()
+            teardown_databases(old_config, verbosity=0)
+            teardown_test_environment()
+            if workdir:
+                shutil.rmtree(workdir, ignore_errors=True)
+
+    def _bench_chat_view(self, options):
+        """Renderização de /chat/ por conversas e mensagens"""
+        client = Client()
+        results = []
+        for n_conversations in options['conversations']:
+            for n_messages in options['messages']:
+                conversation_id = _populate(n_conversations, n_messages)
+                url = f"/chat/?conversation_id={conversation_id}"
+
+                with CaptureQueriesContext(connection) as queries:
+                    assert client.get(url).status_code == 200
+                # Conta já: as próximas requisições limpam connection.queries
+                query_count = len(queries)
+                timings = []
+                for _ in range(options['repeat']):
+                    start = time.perf_counter()
+                    response = client.get(url)
+                    timings.append(time.perf_counter() - start)
+
+                results.append(_result('chat_view', {
+                    'conversations': n_conversations, 'messages': n_messages,
+                }, {
+                    'median_ms': statistics.median(timings) * 1000,
+                    'queries': query_count,
+                    'html_kb': len(response.content) / 1024,
+                }))
+        return results
+
+    def _bench_send_message(self, options):
+        """Latência e vazão de /chat/send/ com o modelo falso"""
+        Message.objects.all().delete()
+        Conversation.objects.all().delete()
+        results = []
+        for level in options['concurrency']:
+            fake = FakeBackend(options['latency'])
+            # Sem limite de taxa e com vagas para toda a concorrência: mede o chat, não os limites
+            controller.chat_agent.client = ResilientClient(fake, max_in_flight=level, rate=0)
+            conversation_ids = [Conversation.objects.create(title="Nova Conversa").id for _ in range(level)]
+
+            latencies, errors = [], 0
+            lock = threading.Lock()
+
+            def send(i):
+                nonlocal errors
+                payload = {
+                    # Perguntas distintas: cada uma passa pelo modelo (sem cache)
+                    'question': f"compare a cpu dos homelabs bench-{level}-{i}",
+                    'conversation_id': conversation_ids[i % level],
+                }
+                start = time.perf_counter()
+                try:
+                    response = Client().post('/chat/send/', json.dumps(payload), content_type='application/json')
+                    ok = response.json().get('ok')
+                except Exception:
+                    ok = False
+                elapsed = time.perf_counter() - start
+                with lock:
+                    latencies.append(elapsed)
+                    errors += not ok
+
+            start = time.perf_counter()
+            with ThreadPoolExecutor(max_workers=level) as pool:
+                list(pool.map(send, range(options['requests'])))
+            elapsed = time.perf_counter() - start
+            connections.close_all()
+
+            latencies.sort()
+            total = len(latencies)
+            results.append(_result('send_message', {'concurrency': level, 'latency_s': options['latency']}, {
+                'p50_ms': latencies[total // 2] * 1000,
+                'p95_ms': latencies[min(total - 1, int(total * 0.95))] * 1000,
+                'throughput': total / elapsed if elapsed else 0.0,
+                'errors': errors,
+                'model_calls': fake.calls,
+            }))
+        return results
+
+    def _bench_search(self, options):
+        """Busca nas mensagens: índice textual do banco contra LIKE"""
+        # Índice do banco e a mesma busca sem ele
+        backends = dict.fromkeys((search.search_backend(), 'like'))
+        results = []
+        for n_messages in options['search_messages']:
+            _populate_messages(n_messages)
+            for backend in backends:
+                timings = []
+                for query in SEARCH_QUERIES:
+                    for _ in range(options['repeat']):
+                        start = time.perf_counter()
+                        search.search_messages(query, backend=backend)
+                        timings.append(time.perf_counter() - start)
+                timings.sort()
+                results.append(_result('search', {'messages': n_messages, 'backend': backend}, {
+                    'median_ms': statistics.median(timings) * 1000,
+                    'p95_ms': timings[min(len(timings) - 1, int(len(timings) * 0.95))] * 1000,
+                }))
+        return results
+
+    # ------------------------------------------------------------------
+    # Relatório
+
+    @staticmethod
+    def _meta(options):
+        try:
+            commit = subprocess.run(
+                ['git', 'rev-parse', '--short', 'HEAD'], cwd=settings.BASE_DIR,
+                capture_output=True, text=True, check=True,
+            ).stdout.strip()
+        except (OSError, subprocess.CalledProcessError):
+            commit = None
+        return {
+            'commit': commit,
+            'created_at': timezone.now().isoformat(),
+            'python': platform.python_version(),
+            'django': django.get_version(),
+            'database': connection.vendor,
+            'repeat': options['repeat'],
+        }
+
+    def _compare(self, options, results):
+        """Compara com o resultado de referência e falha se houver regressão"""
+        with open(options['compare'], encoding='utf-8') as file:
+            baseline = {_identity(result): result['metrics'] for result in json.load(file)['results']}
+
+        regressions = []
+        for result in results:
+            previous = baseline.get(_identity(result))
+            if previous is None:
+                continue
+            for metric, value in result['metrics'].items():
+                old = previous.get(metric)
+                if not old:
+                    continue
+                change = (value - old) / old
+                if metric in LOWER_IS_BETTER and change > options['tolerance'] \
+                        or metric in HIGHER_IS_BETTER and -change > options['tolerance']:
+                    regressions.append(f"{_identity(result)} {metric}: {old:.2f} → {value:.2f} ({change:+.0%})")
+
+        if regressions:
+            raise CommandError("Regressões em relação a " + options['compare'] + ":\n" + '\n'.join(regressions))
+        self.stdout.write(f"sem regressões acima de {options['tolerance']:.0%} em relação a {options['compare']}")
+
+
+def _result(benchmark, params, metrics):
+    return {'benchmark': benchmark, 'params': params, 'metrics': metrics}
+
+
+def _identity(result):
+    params = ','.join(f"{key}={value}" for key, value in sorted(result['params'].items()))
+    return f"{result['benchmark']}[{params}]"
+
+
+def _populate(n_conversations, n_messages):
+    """
+    Recria as tabelas do chat com n_conversations conversas
+
+    Returns:
+        int: ID da conversa aberta, com n_messages mensagens
+    """
+    Message.objects.all().delete()
+    Conversation.objects.all().delete()
+    now = timezone.now()
+    conversations = Conversation.objects.bulk_create([
+        Conversation(title=f"Conversa {i}", has_user_message=True, created_at=now - timedelta(minutes=i))
+        for i in range(n_conversations)
+    ])
+    current = conversations[0]
+    Message.objects.bulk_create([
+        Message(
+            conversation=current,
+            role='user' if i % 2 == 0 else 'bot',
+            text=f"pergunta {i} sobre o homelab-dev" if i % 2 == 0 else f"🔍 homelab-dev - CPU: {i % 100}%",
+            created_at=now - timedelta(seconds=n_messages - i),
+        )
+        for i in range(n_messages)
+    ])
+    return current.id
+
+
+def _populate_messages(n_messages, batch_size=10000):
+    """Recria as tabelas do chat com n_messages mensagens sintéticas em conversas de 20"""
+    Message.objects.all().delete()
+    Conversation.objects.all().delete()
+    now = timezone.now()
+    conversations = Conversation.objects.bulk_create([
+        Conversation(title=f"Conversa {i}", has_user_message=True, created_at=now - timedelta(minutes=i))
+        for i in range(max(n_messages // 20, 1))
+    ])
+    batch = []
+    for i, (role, text) in enumerate(synthetic_messages(n_messages)):
+        batch.append(Message(conversation=conversations[i // 20 % len(conversations)], role=role, text=text,
+                             created_at=now - timedelta(seconds=n_messages - i)))
+        if len(batch) == batch_size:
+            Message.objects.bulk_create(batch)
+            batch = []
+    Message.objects.bulk_create(batch)
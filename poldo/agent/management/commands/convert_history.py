@@ -0,0 +1,36 @@
+"""
+Converte o histórico de snapshots de JSON (lista) para JSON Lines
+
+O formato JSON Lines é só de acréscimos: o coletor grava um snapshot por
+linha e o HomelabHistoryStore consome apenas as linhas novas.
+
+Uso:
+    python manage.py convert_history agent/data/homelabs_history.json agent/data/homelabs_history.jsonl
+"""
+
+import os
+
+from django.core.management.base import BaseCommand
+
+from agent.history_loader import iter_snapshots, snapshot_line
+
+
+class Command(BaseCommand):
+    help = 'Converte o histórico de snapshots para JSON Lines (um snapshot por linha)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('source', help='Histórico de origem (JSON ou JSON Lines)')
+        parser.add_argument('destination', help='Arquivo .jsonl de destino')
+
+    def handle(self, *args, **options):
+        destination = options['destination']
+        temporary = f"{destination}.tmp"
+
+        count = 0
+        with open(temporary, 'w', encoding='utf-8') as file:
+            for snapshot in iter_snapshots(options['source']):
+                file.write(snapshot_line(snapshot))
+                count += 1
+        os.replace(temporary, destination)
+
+        self.stdout.write(self.style.SUCCESS(f"{count} snapshots gravados em {destination}"))
@@ -0,0 +1,102 @@
+"""
+Teste de carga do envio de mensagens contra um modelo falso local
+
+Compara o caminho síncrono (ChatController.process_message, uma thread
+por requisição) com o caminho assíncrono (ChatController.aprocess_message
+em um único event loop), usando o FakeBackend (latência fixa, sem rede)
+no lugar do Gemini. Roda em um banco de teste descartável.
+
+Uso:
+    python manage.py loadtest_chat --requests 200 --concurrency 100 --latency 0.5
+"""
+
+import asyncio
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from django.core.management.base import BaseCommand
+from django.test.utils import setup_databases, teardown_databases
+
+from agent import controller
+from agent.controller import ChatController
+from agent.llm_backends import FakeBackend
+from agent.llm_client import ResilientClient
+
+
+class Command(BaseCommand):
+    help = 'Teste de carga do chat/send/ (síncrono vs assíncrono) com modelo falso'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--requests', type=int, default=200,
+                            help='Número total de mensagens por cenário')
+        parser.add_argument('--concurrency', type=int, default=100,
+                            help='Mensagens simultâneas no cenário assíncrono')
+        parser.add_argument('--threads', type=int, default=1,
+                            help='Threads do worker no cenário síncrono')
+        parser.add_argument('--latency', type=float, default=0.5,
+                            help='Latência fixa do modelo falso em segundos')
+        parser.add_argument('--tokens-per-second', type=float, default=0,
+                            help='Vazão do modelo falso (0 = resposta instantânea após a latência)')
+
+    def handle(self, *args, **options):
+        old_config = setup_databases(verbosity=0, interactive=False)
+        original_client = controller.chat_agent.client
+        # Sem limite de taxa e com vagas para toda a concorrência: mede o chat, não os limites
+        controller.chat_agent.client = ResilientClient(
+            None, max_in_flight=max(options['concurrency'], options['threads']), rate=0
+        )
+        try:
+            sync_result = self._run_sync(options)
+            async_result = self._run_async(options)
+        finally:
+            controller.chat_agent.client = original_client
+            teardown_databases(old_config, verbosity=0)
+
+        self.stdout.write(f"{'cenário':<12}{'req':>6}{'tempo (s)':>12}{'req/s':>10}{'pico em voo':>14}")
+        for name, result in (('síncrono', sync_result), ('assíncrono', async_result)):
+            self.stdout.write(
+                f"{name:<12}{result['requests']:>6}{result['elapsed']:>12.2f}"
+                f"{result['throughput']:>10.1f}{result['peak_in_flight']:>14}"
+            )
+
+    def _run_sync(self, options):
+        """Uma thread por requisição: o pico em voo é limitado por --threads"""
+        fake = FakeBackend(options['latency'], options['tokens_per_second'])
+        controller.chat_agent.backend = fake
+        total = options['requests']
+
+        start = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=options['threads']) as pool:
+            list(pool.map(lambda i: ChatController.process_message(f"compare a cpu dos homelabs sync-{i}"),
+                          range(total)))
+        elapsed = time.perf_counter() - start
+        return self._result(total, elapsed, fake)
+
+    def _run_async(self, options):
+        """Um único event loop com até --concurrency mensagens em voo"""
+        fake = FakeBackend(options['latency'], options['tokens_per_second'])
+        controller.chat_agent.backend = fake
+        total = options['requests']
+
+        async def run():
+            semaphore = asyncio.Semaphore(options['concurrency'])
+
+            async def one(i):
+                async with semaphore:
+                    await ChatController.aprocess_message(f"compare a cpu dos homelabs async-{i}")
+
+            await asyncio.gather(*(one(i) for i in range(total)))
+
+        start = time.perf_counter()
+        asyncio.run(run())
+        elapsed = time.perf_counter() - start
+        return self._result(total, elapsed, fake)
+
+    @staticmethod
+    def _result(total, elapsed, fake):
+        return {
+            'requests': total,
+            'elapsed': elapsed,
+            'throughput': total / elapsed if elapsed else 0.0,
+            'peak_in_flight': fake.peak_in_flight,
+        }
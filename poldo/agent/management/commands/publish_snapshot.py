@@ -0,0 +1,66 @@
+"""
+Publica o snapshot dos homelabs compartilhado entre os workers
+
+Lê os dados atuais (arquivo ou banco, conforme POLDO_HOMELAB_SOURCE) e as
+colunas do histórico e os grava no arquivo de POLDO_SHARED_SNAPSHOT, que
+os workers mapeiam em memória. Com --watch, republica a cada mudança dos
+dados ou snapshot novo no histórico JSON Lines e, sem mudanças, renova o
+horário da publicação a cada intervalo (os workers ignoram um snapshot
+mais velho que POLDO_SHARED_SNAPSHOT["MAX_AGE"]); rode um único
+publicador por máquina (ex: ao lado do gunicorn, ou no hook on_starting).
+
+Uso:
+    python manage.py publish_snapshot
+    python manage.py publish_snapshot --watch --interval 1
+"""
+
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from agent.models import HomelabHistoryStore, HomelabModel
+from agent.shared_snapshot import get_config, publish, touch
+
+
+class Command(BaseCommand):
+    help = 'Publica os dados e o histórico dos homelabs no snapshot compartilhado entre os workers'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--path', help='Arquivo do snapshot (padrão: POLDO_SHARED_SNAPSHOT["PATH"])')
+        parser.add_argument('--history', help='Arquivo do histórico (padrão: agent/data/homelabs_history.json)')
+        parser.add_argument('--no-history', action='store_true', help='Publica só os dados atuais')
+        parser.add_argument('--watch', action='store_true', help='Continua rodando e republica a cada mudança')
+        parser.add_argument('--interval', type=float,
+                            default=getattr(settings, 'POLDO_DATA_WATCH', {}).get('INTERVAL', 2.0),
+                            help='Intervalo entre verificações com --watch (segundos)')
+
+    def handle(self, *args, **options):
+        path = options['path'] or get_config()['PATH']
+        model = HomelabModel(shared=False)
+        store = None if options['no_history'] else HomelabHistoryStore(options['history'], shared=False)
+
+        published = None
+        while True:
+            version, data = model.get_versioned_data()
+            if store is not None:
+                store.refresh()
+            state = (version, store.snapshot_count if store is not None else 0)
+
+            if state == published and not touch(path):
+                # Arquivo removido ou inválido: publica de novo
+                published = None
+            if state != published:
+                generation = publish(
+                    path, version, data,
+                    history=store.get_series_map() if store is not None else None,
+                    history_snapshots=state[1],
+                )
+                published = state
+                self.stdout.write(self.style.SUCCESS(
+                    f"Geração {generation} publicada em {path} (dados {version}, {state[1]} snapshots no histórico)"
+                ))
+
+            if not options['watch']:
+                return
+            time.sleep(options['interval'])
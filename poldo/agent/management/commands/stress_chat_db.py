@@ -0,0 +1,141 @@
+"""
+Teste de estresse de escrita concorrente no chat/send/
+
+Várias threads enviam mensagens ao mesmo tempo pelo cliente de teste do
+Django, com um agente falso que responde na hora: o gargalo passa a ser
+o banco. Roda em um banco SQLite descartável em arquivo (não em memória),
+para que WAL e busy_timeout valham como em produção.
+
+Com --no-pragmas as conexões ficam com o journal padrão (rollback) e sem
+busy_timeout, para comparar.
+
+Uso:
+    python manage.py stress_chat_db --threads 16 --messages 50
+"""
+
+import json
+import os
+import tempfile
+import threading
+import time
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from unittest import mock
+
+from django.core.management.base import BaseCommand
+from django.db import connection, connections
+from django.test import Client, override_settings
+from django.test.utils import (
+    setup_databases, setup_test_environment, teardown_databases, teardown_test_environment,
+)
+
+from agent import controller
+from agent.models import Conversation, Message
+
+
+async def stub_answer(question, conversation_id=None):
+    return f"🔍 resposta para: {question}"
+
+
+class Command(BaseCommand):
+    help = 'Estressa o chat/send/ com escritas concorrentes contra um agente falso'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--threads', type=int, default=16,
+                            help='Clientes simultâneos')
+        parser.add_argument('--messages', type=int, default=50,
+                            help='Mensagens enviadas por cliente')
+        parser.add_argument('--conversations', type=int, default=4,
+                            help='Conversas compartilhadas pelos clientes')
+        parser.add_argument('--no-pragmas', action='store_true',
+                            help='Desliga os PRAGMAs de POLDO_SQLITE_PRAGMAS')
+
+    def handle(self, *args, **options):
+        if connection.vendor != 'sqlite':
+            self.stderr.write("Este teste mede o SQLite; o banco configurado é " + connection.vendor)
+            return
+
+        workdir = tempfile.mkdtemp(prefix='poldo-stress-')
+        connection.settings_dict['TEST']['NAME'] = os.path.join(workdir, 'stress.sqlite3')
+        pragmas = {'busy_timeout': 0} if options['no_pragmas'] else None
+
+        with override_settings(**({'POLDO_SQLITE_PRAGMAS': pragmas} if pragmas else {})):
+            setup_test_environment()
+            old_config = setup_databases(verbosity=0, interactive=False)
+            try:
+                result = self._run(options)
+            finally:
+                connections.close_all()
+                teardown_databases(old_config, verbosity=0)
+                teardown_test_environment()
+
+        self.stdout.write(f"journal_mode: {result['journal_mode']}")
+        self.stdout.write(
+            f"{'req':>6}{'ok':>6}{'erros':>7}{'tempo (s)':>11}{'req/s':>9}{'p50 (ms)':>10}{'p99 (ms)':>10}"
+        )
+        self.stdout.write(
+            f"{result['requests']:>6}{result['ok']:>6}{result['errors']:>7}{result['elapsed']:>11.2f}"
+            f"{result['throughput']:>9.1f}{result['p50']:>10.1f}{result['p99']:>10.1f}"
+        )
+        for error, count in result['error_kinds'].most_common():
+            self.stdout.write(f"  {count}x {error}")
+        self.stdout.write(f"mensagens gravadas: {result['messages']} (esperado {2 * result['ok']})")
+
+    def _run(self, options):
+        conversation_ids = [
+            Conversation.objects.create(title="Nova Conversa").id
+            for _ in range(options['conversations'])
+        ]
+        with connection.cursor() as cursor:
+            cursor.execute('PRAGMA journal_mode')
+            journal_mode = cursor.fetchone()[0]
+
+        latencies = []
+        errors = Counter()
+        lock = threading.Lock()
+
+        def client_loop(worker):
+            client = Client()
+            try:
+                for i in range(options['messages']):
+                    payload = {
+                        'question': f"compare os homelabs {worker}-{i}",
+                        'conversation_id': conversation_ids[(worker + i) % len(conversation_ids)],
+                    }
+                    start = time.perf_counter()
+                    try:
+                        response = client.post('/chat/send/', json.dumps(payload),
+                                               content_type='application/json')
+                        body = response.json()
+                        error = None if body.get('ok') else body.get('error', str(response.status_code))
+                    except Exception as e:
+                        error = f"{type(e).__name__}: {e}"
+                    elapsed = time.perf_counter() - start
+                    with lock:
+                        latencies.append(elapsed)
+                        if error:
+                            errors[error] += 1
+            finally:
+                connections.close_all()
+
+        with mock.patch.object(controller.chat_agent, 'aprocess_question', side_effect=stub_answer):
+            start = time.perf_counter()
+            with ThreadPoolExecutor(max_workers=options['threads']) as pool:
+                list(pool.map(client_loop, range(options['threads'])))
+            elapsed = time.perf_counter() - start
+
+        latencies.sort()
+        total = len(latencies)
+        failed = sum(errors.values())
+        return {
+            'journal_mode': journal_mode,
+            'requests': total,
+            'ok': total - failed,
+            'errors': failed,
+            'error_kinds': errors,
+            'elapsed': elapsed,
+            'throughput': total / elapsed if elapsed else 0.0,
+            'p50': latencies[total // 2] * 1000 if total else 0.0,
+            'p99': latencies[min(total - 1, int(total * 0.99))] * 1000 if total else 0.0,
+            'messages': Message.objects.count(),
+        }
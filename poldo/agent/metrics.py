@@ -0,0 +1,223 @@
+"""
+Métricas de latência por etapa no formato do Prometheus
+
+Cada etapa de uma mensagem (parse do JSON, validação, leitura e gravação
+no banco, caminho rápido, histórico, cache, montagem do prompt, chamada
+ao modelo e montagem do HTML) é medida com um span leve e agregada em
+histogramas em memória, sem guardar as medições individuais.
+
+Também conta as consultas ao banco por requisição (um execute_wrapper
+instalado em cada conexão soma em um contador da requisição atual, que
+acompanha o sync_to_async via contextvars) e os tokens estimados
+enviados e recebidos do modelo.
+
+As métricas ficam em memória por processo: com vários workers, o
+Prometheus deve coletar cada um (ou somar por instância).
+"""
+
+import bisect
+import contextvars
+import threading
+import time
+from contextlib import contextmanager
+
+# Limites dos histogramas de duração (segundos)
+DURATION_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+# Limites do histograma de consultas por requisição
+QUERY_BUCKETS = (1, 2, 3, 5, 8, 13, 21, 34, 55)
+
+HELP = {
+    'poldo_stage_duration_seconds': 'Duração de cada etapa do processamento de uma mensagem',
+    'poldo_request_duration_seconds': 'Duração total das requisições de envio de mensagem',
+    'poldo_db_queries_per_request': 'Consultas ao banco por requisição',
+    'poldo_llm_prompt_tokens_total': 'Tokens estimados enviados ao modelo',
+    'poldo_llm_completion_tokens_total': 'Tokens estimados recebidos do modelo',
+    'poldo_job_wait_seconds': 'Tempo dos jobs de geração na fila até começarem a rodar',
+    'poldo_job_run_seconds': 'Duração dos jobs de geração',
+}
+
+
+class Histogram:
+    """Histograma cumulativo (contagem por limite, soma e total)"""
+
+    __slots__ = ('buckets', 'counts', 'sum', 'count')
+
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+
+class MetricsRegistry:
+    """
+    MODEL - Histogramas e contadores em memória com saída para o Prometheus
+    """
+
+    def __init__(self):
+        self._histograms = {}
+        self._counters = {}
+        self._lock = threading.Lock()
+
+    def observe(self, name, value, buckets=DURATION_BUCKETS, **labels):
+        """
+        Registra uma medição em um histograma
+
+        Args:
+            name (str): Nome da métrica
+            value (float): Valor medido
+            buckets (tuple): Limites do histograma (usados na primeira medição)
+            **labels: Rótulos da série
+        """
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            histogram = self._histograms.get(key)
+            if histogram is None:
+                histogram = self._histograms[key] = Histogram(buckets)
+            histogram.observe(value)
+
+    def inc(self, name, amount=1, **labels):
+        """
+        Soma a um contador
+
+        Args:
+            name (str): Nome da métrica
+            amount (float): Valor somado
+            **labels: Rótulos da série
+        """
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + amount
+
+    @contextmanager
+    def span(self, stage):
+        """
+        Mede a duração de uma etapa
+
+        Args:
+            stage (str): Nome da etapa (rótulo "stage")
+        """
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe('poldo_stage_duration_seconds', time.perf_counter() - started, stage=stage)
+
+    def reset(self):
+        """Zera todas as métricas"""
+        with self._lock:
+            self._histograms.clear()
+            self._counters.clear()
+
+    def render(self, gauges=()):
+        """
+        Gera o texto de exposição do Prometheus (versão 0.0.4)
+
+        Args:
+            gauges (iterable): (nome, rótulos, valor, ajuda) calculados na hora
+                da coleta (ex: contadores dos componentes do ChatAgent)
+
+        Returns:
+            str: Métricas em texto
+        """
+        with self._lock:
+            histograms = [(key, list(h.counts), h.sum, h.count, h.buckets)
+                          for key, h in sorted(self._histograms.items())]
+            counters = sorted(self._counters.items())
+
+        lines = []
+        declared = set()
+
+        def declare(name, kind, help_text=None):
+            if name not in declared:
+                declared.add(name)
+                lines.append(f"# HELP {name} {help_text or HELP.get(name, name)}")
+                lines.append(f"# TYPE {name} {kind}")
+
+        for (name, labels), counts, total, count, buckets in histograms:
+            declare(name, 'histogram')
+            cumulative = 0
+            for bound, bucket_count in zip(buckets + (float('inf'),), counts):
+                cumulative += bucket_count
+                le = '+Inf' if bound == float('inf') else _number(bound)
+                lines.append(f"{name}_bucket{_labels(labels + (('le', le),))} {cumulative}")
+            lines.append(f"{name}_sum{_labels(labels)} {_number(total)}")
+            lines.append(f"{name}_count{_labels(labels)} {count}")
+
+        for (name, labels), value in counters:
+            declare(name, 'counter')
+            lines.append(f"{name}{_labels(labels)} {_number(value)}")
+
+        for name, labels, value, help_text in gauges:
+            declare(name, 'gauge', help_text)
+            lines.append(f"{name}{_labels(tuple(sorted(labels.items())))} {_number(value)}")
+
+        return '\n'.join(lines) + '\n'
+
+
+def _labels(labels):
+    if not labels:
+        return ''
+    pairs = ','.join(
+        '{}="{}"'.format(key, str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n'))
+        for key, value in labels
+    )
+    return '{' + pairs + '}'
+
+
+def _number(value):
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+# Registro global do processo
+metrics = MetricsRegistry()
+
+# Contador de consultas da requisição atual (lista de um elemento, para
+# ser compartilhado com as threads do sync_to_async, que copiam o contexto)
+_query_counter = contextvars.ContextVar('poldo_query_counter', default=None)
+
+
+def count_queries(execute, sql, params, many, context):
+    """execute_wrapper que soma as consultas da requisição atual"""
+    counter = _query_counter.get()
+    if counter is not None:
+        counter[0] += 1
+    return execute(sql, params, many, context)
+
+
+def install_query_counter(sender, connection, **kwargs):
+    """
+    Instala count_queries em uma nova conexão (receptor de connection_created)
+
+    Args:
+        sender: Classe do backend que criou a conexão
+        connection: Conexão Django recém-criada
+    """
+    if count_queries not in connection.execute_wrappers:
+        # No início da lista: connection.execute_wrapper() remove sempre o último
+        connection.execute_wrappers.insert(0, count_queries)
+
+
+@contextmanager
+def track_request(endpoint):
+    """
+    Mede a duração e as consultas ao banco de uma requisição
+
+    Args:
+        endpoint (str): Nome do endpoint (rótulo "endpoint")
+    """
+    counter = [0]
+    token = _query_counter.set(counter)
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        _query_counter.reset(token)
+        metrics.observe('poldo_request_duration_seconds', time.perf_counter() - started, endpoint=endpoint)
+        metrics.observe('poldo_db_queries_per_request', counter[0], buckets=QUERY_BUCKETS, endpoint=endpoint)
@@ -0,0 +1,45 @@
+# Generated by Django 5.2.18 on 2026-10-17 03:29
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('agent', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Host',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=100, unique=True)),
+                ('last_seen_at', models.DateTimeField(blank=True, null=True)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+            ],
+            options={
+                'verbose_name': 'Host',
+                'verbose_name_plural': 'Hosts',
+                'ordering': ['name'],
+            },
+        ),
+        migrations.CreateModel(
+            name='MetricSample',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('metric', models.CharField(max_length=50)),
+                ('value', models.FloatField(blank=True, null=True)),
+                ('raw', models.JSONField()),
+                ('collected_at', models.DateTimeField()),
+                ('host', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='samples', to='agent.host')),
+            ],
+            options={
+                'verbose_name': 'Amostra de métrica',
+                'verbose_name_plural': 'Amostras de métricas',
+                'ordering': ['collected_at'],
+                'indexes': [models.Index(fields=['host', 'collected_at'], name='agent_sample_host_time_idx'), models.Index(fields=['metric', 'collected_at'], name='agent_sample_metric_time_idx')],
+            },
+        ),
+    ]
@@ -0,0 +1,27 @@
+# Generated by Django 5.2.18 on 2026-10-17 03:31
+
+from django.db import migrations, models
+
+
+def mark_conversations_with_user_messages(apps, schema_editor):
+    Conversation = apps.get_model('agent', 'Conversation')
+    Message = apps.get_model('agent', 'Message')
+    Conversation.objects.filter(
+        id__in=Message.objects.filter(role='user').values('conversation_id')
+    ).update(has_user_message=True)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('agent', '0003_conversation_message_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='conversation',
+            name='has_user_message',
+            field=models.BooleanField(default=False),
+        ),
+        migrations.RunPython(mark_conversations_with_user_messages, migrations.RunPython.noop),
+    ]
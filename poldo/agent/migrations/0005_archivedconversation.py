@@ -0,0 +1,43 @@
+# Generated by Django 5.2.18 on 2026-10-17 03:35
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('agent', '0004_conversation_has_user_message'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='conversation',
+            name='created_at',
+            field=models.DateTimeField(default=django.utils.timezone.now, editable=False),
+        ),
+        migrations.AlterField(
+            model_name='message',
+            name='created_at',
+            field=models.DateTimeField(default=django.utils.timezone.now, editable=False),
+        ),
+        migrations.CreateModel(
+            name='ArchivedConversation',
+            fields=[
+                ('id', models.BigIntegerField(primary_key=True, serialize=False)),
+                ('title', models.CharField(max_length=200)),
+                ('has_user_message', models.BooleanField(default=False)),
+                ('created_at', models.DateTimeField()),
+                ('last_message_at', models.DateTimeField()),
+                ('archived_at', models.DateTimeField(auto_now_add=True)),
+                ('message_count', models.PositiveIntegerField(default=0)),
+                ('payload', models.BinaryField()),
+            ],
+            options={
+                'verbose_name': 'Conversa arquivada',
+                'verbose_name_plural': 'Conversas arquivadas',
+                'ordering': ['-created_at'],
+                'indexes': [models.Index(fields=['created_at'], name='agent_archived_created_idx')],
+            },
+        ),
+    ]
@@ -0,0 +1,85 @@
+from django.db import migrations
+from django.db.utils import OperationalError
+
+# Índice textual de Message.text (consultado por agent/search.py)
+
+SQLITE_CREATE = [
+    """
+    CREATE VIRTUAL TABLE agent_message_fts USING fts5(
+        text,
+        content='agent_message',
+        content_rowid='id',
+        tokenize="unicode61 remove_diacritics 2 tokenchars '-'"
+    )
+    """,
+    """
+    CREATE TRIGGER agent_message_fts_insert AFTER INSERT ON agent_message BEGIN
+        INSERT INTO agent_message_fts(rowid, text) VALUES (new.id, new.text);
+    END
+    """,
+    """
+    CREATE TRIGGER agent_message_fts_delete AFTER DELETE ON agent_message BEGIN
+        INSERT INTO agent_message_fts(agent_message_fts, rowid, text) VALUES ('delete', old.id, old.text);
+    END
+    """,
+    """
+    CREATE TRIGGER agent_message_fts_update AFTER UPDATE OF text ON agent_message BEGIN
+        INSERT INTO agent_message_fts(agent_message_fts, rowid, text) VALUES ('delete', old.id, old.text);
+        INSERT INTO agent_message_fts(rowid, text) VALUES (new.id, new.text);
+    END
+    """,
+    "INSERT INTO agent_message_fts(agent_message_fts) VALUES ('rebuild')",
+]
+
+SQLITE_DROP = [
+    'DROP TRIGGER IF EXISTS agent_message_fts_insert',
+    'DROP TRIGGER IF EXISTS agent_message_fts_delete',
+    'DROP TRIGGER IF EXISTS agent_message_fts_update',
+    'DROP TABLE IF EXISTS agent_message_fts',
+]
+
+# Coluna gerada: o PostgreSQL a mantém atualizada sem triggers (PostgreSQL 12+)
+POSTGRESQL_CREATE = [
+    """
+    ALTER TABLE agent_message ADD COLUMN search_vector tsvector
+        GENERATED ALWAYS AS (to_tsvector('portuguese'::regconfig, coalesce(text, ''))) STORED
+    """,
+    'CREATE INDEX agent_msg_search_idx ON agent_message USING GIN (search_vector)',
+]
+
+POSTGRESQL_DROP = [
+    'DROP INDEX IF EXISTS agent_msg_search_idx',
+    'ALTER TABLE agent_message DROP COLUMN IF EXISTS search_vector',
+]
+
+
+def create_search_index(apps, schema_editor):
+    vendor = schema_editor.connection.vendor
+    if vendor == 'sqlite':
+        try:
+            schema_editor.execute(SQLITE_CREATE[0])
+        except OperationalError:
+            # SQLite compilado sem FTS5: a busca usa LIKE
+            return
+        for statement in SQLITE_CREATE[1:]:
+            schema_editor.execute(statement)
+    elif vendor == 'postgresql':
+        for statement in POSTGRESQL_CREATE:
+            schema_editor.execute(statement)
+
+
+def drop_search_index(apps, schema_editor):
+    statements = {'sqlite': SQLITE_DROP, 'postgresql': POSTGRESQL_DROP}
+    for statement in statements.get(schema_editor.connection.vendor, []):
+        schema_editor.execute(statement)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('agent', '0006_conversation_summary'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_search_index, drop_search_index),
+    ]
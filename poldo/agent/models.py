@@ -1,9 +1,28 @@
+import hashlib
 import json
+import math
 import os
+import re
+import sys
+import threading
+import time
 import uuid
+from array import array
+from bisect import bisect_left, bisect_right
 from datetime import datetime
 from django.conf import settings
-from django.db import models
+from django.db import DatabaseError, models
+from django.db.models import Q
+from django.utils import timezone
+
+from .file_watcher import FileWatcher
+from .history_loader import iter_snapshots, is_jsonl, tail_snapshots
+from .shared_snapshot import get_shared_snapshot
+
+try:
+    import numpy as np
+except ImportError:  # NumPy é opcional: as colunas usam array da stdlib
+    np = None
 
 class ConversationModel:
     """
@@ -111,25 +130,168 @@ class HomelabModel:
     
     Esta classe representa a camada Model do padrão MVC.
     É responsável por carregar e gerenciar os dados dos homelabs
-    a partir do arquivo JSON.
+    a partir do arquivo JSON ou, com source='db', do último snapshot
+    recebido pela API de ingestão (MetricSample).
+    
+    Com POLDO_SHARED_SNAPSHOT ligado, lê a geração publicada no snapshot
+    compartilhado entre os workers (agent/shared_snapshot.py) e só usa a
+    origem própria enquanto nada foi publicado ou quando o publicador
+    parou de renovar o snapshot (mais velho que MAX_AGE).
     """
     
-    def __init__(self):
+    def __init__(self, data_file=None, source=None, shared=True):
         # Caminho para o arquivo JSON dos homelabs
-        self.data_file = os.path.join(os.path.dirname(__file__), 'data', 'homelabs.json')
-        self._data = None
+        self.data_file = data_file or os.path.join(os.path.dirname(__file__), 'data', 'homelabs.json')
+        self.source = source or getattr(settings, 'POLDO_HOMELAB_SOURCE', 'file')
+        # Snapshot compartilhado (None se desligado ou shared=False, como no publicador)
+        self.shared = get_shared_snapshot() if shared else None
+        # Se o snapshot atual veio da geração compartilhada
+        self._from_shared = False
+        
+        # (versão, dados): trocados juntos em uma única atribuição, então
+        # quem lê sempre vê uma versão coerente com os dados
+        self._snapshot = None
+        self._reload_lock = threading.Lock()
+        # Índices tipados do snapshot mais recente (refeitos quando a versão muda)
+        self._index = None
+        
+        watch = getattr(settings, 'POLDO_DATA_WATCH', {})
+        self._poll_interval = watch.get('INTERVAL', 2.0)
+        self._checked_at = 0.0
+        self._watcher = FileWatcher(
+            self.data_file,
+            poll_interval=self._poll_interval,
+            backend=watch.get('BACKEND', 'poll')
+        )
     
     def _load_data(self):
-        """Carrega os dados do arquivo JSON"""
-        if self._data is None:
-            try:
-                with open(self.data_file, 'r', encoding='utf-8') as file:
-                    self._data = json.load(file)
-            except FileNotFoundError:
-                self._data = {}
-            except json.JSONDecodeError:
-                self._data = {}
-        return self._data
+        """Carrega os dados do arquivo JSON, recarregando se o arquivo mudou"""
+        if self.source == 'db' and self._snapshot is not None:
+            # No banco, a atualização fica a cargo de get_versioned_data
+            # (chamado fora do event loop), então leituras nunca consultam o banco
+            return self._snapshot[1]
+        return self.get_versioned_data()[1]
+    
+    def get_versioned_data(self):
+        """
+        Retorna os dados atuais junto com sua versão
+        
+        O arquivo é relido quando o observador indica mudança, mas os
+        dados só são trocados se o hash do conteúdo for diferente.
+        
+        Returns:
+            tuple: (versão, dados) — versão é o hash do conteúdo do arquivo
+        """
+        if self.shared is not None:
+            view = self.shared.read()
+            if view is not None:
+                snapshot = self._snapshot
+                if snapshot is None or snapshot[0] != view.version:
+                    snapshot = self._snapshot = (view.version, view.data)
+                self._from_shared = True
+                return snapshot
+            if self._from_shared:
+                # Snapshot compartilhado parado: volta a ler a própria origem
+                self._from_shared = False
+                self._snapshot = None
+        
+        if self.source == 'db':
+            return self._get_versioned_db_data()
+        
+        snapshot = self._snapshot
+        if snapshot is not None and not self._watcher.changed():
+            return snapshot
+        
+        with self._reload_lock:
+            if self._snapshot is None or snapshot is self._snapshot:
+                self._reload()
+            return self._snapshot
+    
+    def _reload(self):
+        """Relê o arquivo e troca o snapshot se o conteúdo mudou"""
+        try:
+            with open(self.data_file, 'rb') as file:
+                content = file.read()
+        except FileNotFoundError:
+            content = b''
+        
+        version = hashlib.sha1(content).hexdigest()[:16]
+        if self._snapshot is not None and self._snapshot[0] == version:
+            return
+        
+        try:
+            data = json.loads(content.decode('utf-8')) if content else {}
+        except (json.JSONDecodeError, UnicodeDecodeError):
+            # Arquivo inválido (ex: escrita pela metade): mantém os dados atuais
+            if self._snapshot is not None:
+                return
+            data = {}
+        
+        self._snapshot = (version, data)
+    
+    def _get_versioned_db_data(self):
+        """Relê o último snapshot do banco no máximo uma vez por intervalo"""
+        snapshot = self._snapshot
+        if snapshot is not None and time.monotonic() - self._checked_at < self._poll_interval:
+            return snapshot
+        
+        with self._reload_lock:
+            if self._snapshot is snapshot:
+                self._checked_at = time.monotonic()
+                try:
+                    data = MetricSample.latest_snapshot()
+                except DatabaseError:
+                    # Banco ainda sem migrações (ex: durante o migrate)
+                    data = {}
+                version = hashlib.sha1(
+                    json.dumps(data, sort_keys=True, ensure_ascii=False).encode('utf-8')
+                ).hexdigest()[:16]
+                if snapshot is None or snapshot[0] != version:
+                    self._snapshot = (version, data)
+            return self._snapshot
+    
+    def get_version(self):
+        """
+        Retorna a versão (hash do conteúdo) dos dados atuais
+        
+        Returns:
+            str: Versão dos dados
+        """
+        return self.get_versioned_data()[0]
+    
+    def stats(self):
+        """
+        Retorna a origem e a versão dos dados deste processo
+        
+        Returns:
+            dict: Origem, versão e geração do snapshot compartilhado mapeada
+        """
+        return {
+            'source': self.source,
+            'version': self._snapshot[0] if self._snapshot else None,
+            'shared': self.shared.stats() if self.shared is not None else None,
+        }
+    
+    def get_index(self):
+        """
+        Retorna os registros tipados e os índices do snapshot mais recente
+        
+        O índice é montado uma vez por versão dos dados; leituras com os
+        dados inalterados não reprocessam nada.
+        
+        Returns:
+            HomelabIndex: Homelabs por nome, ambiente, status e porta
+        """
+        if self.source == 'db' and self._snapshot is not None:
+            # Como em _load_data: a atualização do banco fica em get_versioned_data
+            version, data = self._snapshot
+        else:
+            version, data = self.get_versioned_data()
+        
+        index = self._index
+        if index is None or index.version != version:
+            index = self._index = HomelabIndex.build(version, data)
+        return index
     
     def get_all_homelabs(self):
         """
@@ -150,8 +312,8 @@ class HomelabModel:
         Returns:
             dict: Dados do homelab ou None se não encontrado
         """
-        data = self._load_data()
-        return data.get(homelab_name)
+        host = self.get_index().hosts.get(homelab_name)
+        return host.raw if host else None
     
     def get_homelab_metric(self, homelab_name, metric):
         """
@@ -176,12 +338,7 @@ class HomelabModel:
         Returns:
             list: Lista de métricas disponíveis
         """
-        data = self._load_data()
-        if data:
-            # Pega as chaves do primeiro homelab como exemplo
-            first_homelab = list(data.values())[0]
-            return list(first_homelab.keys())
-        return []
+        return list(self.get_index().metrics)
     
     def get_homelab_names(self):
         """
@@ -190,7 +347,511 @@ class HomelabModel:
         Returns:
             list: Lista de nomes dos homelabs
         """
-        return list(self._load_data().keys())
+        return list(self.get_index().hosts)
+    
+    def get_host(self, homelab_name):
+        """
+        Busca o registro tipado de um homelab
+        
+        Args:
+            homelab_name (str): Nome do homelab
+            
+        Returns:
+            HostRecord: Registro ou None se não encontrado
+        """
+        return self.get_index().hosts.get(homelab_name)
+    
+    def get_hosts(self, environment=None, status=None):
+        """
+        Lista os homelabs de um ambiente e/ou status
+        
+        Args:
+            environment (str, optional): dev, test ou prod
+            status (str, optional): online, offline, ...
+            
+        Returns:
+            tuple: Registros (HostRecord) em ordem de nome no arquivo
+        """
+        index = self.get_index()
+        if environment is None and status is None:
+            return tuple(index.hosts.values())
+        if status is None:
+            return index.by_environment.get(environment, ())
+        if environment is None:
+            return index.by_status.get(status, ())
+        return tuple(host for host in index.by_environment.get(environment, ()) if host.status == status)
+    
+    def get_hosts_with_port(self, port):
+        """
+        Lista os homelabs com uma porta aberta
+        
+        Args:
+            port (int | str): Número da porta
+            
+        Returns:
+            tuple: Registros (HostRecord)
+        """
+        try:
+            return self.get_index().by_port.get(int(port), ())
+        except (TypeError, ValueError):
+            return ()
+
+
+# Métricas com valor numérico nos snapshots ("52%", "8GB", "11 containers ativos")
+NUMERIC_METRICS = ('cpu', 'memoria', 'ram', 'docker')
+
+_NUMBER_RE = re.compile(r'-?\d+(?:[.,]\d+)?')
+
+
+def parse_metric_value(value):
+    """
+    Extrai o valor numérico de uma métrica em texto
+    
+    Args:
+        value: Valor bruto (ex: "52%", "8GB", "11 containers ativos")
+        
+    Returns:
+        float: Valor numérico ou None se não houver número
+    """
+    if isinstance(value, (int, float)):
+        return float(value)
+    match = _NUMBER_RE.search(str(value or ''))
+    if not match:
+        return None
+    return float(match.group().replace(',', '.'))
+
+
+def to_epoch(value):
+    """
+    Converte um timestamp em segundos desde a época (int)
+    
+    Aceita int/float, datetime ou texto "YYYY-MM-DD HH:MM:SS" (interpretado
+    no fuso horário do projeto, como os snapshots do coletor).
+    
+    Args:
+        value: Timestamp
+        
+    Returns:
+        int: Segundos desde a época
+    """
+    if isinstance(value, (int, float)):
+        return int(value)
+    if isinstance(value, str):
+        value = datetime.fromisoformat(value)
+    if timezone.is_naive(value):
+        value = timezone.make_aware(value)
+    return int(value.timestamp())
+
+
+# Ambientes reconhecidos no nome dos homelabs (ex: homelab-prod-3)
+HOST_ENVIRONMENTS = ('dev', 'test', 'prod')
+
+_RAM_UNITS = {'tb': 1024.0, 'gb': 1.0, 'mb': 1 / 1024}
+
+
+def parse_ram_gb(value):
+    """
+    Converte a RAM em GB
+    
+    Args:
+        value: Valor bruto (ex: "8GB", "512MB")
+        
+    Returns:
+        float: RAM em GB ou None se não houver número
+    """
+    number = parse_metric_value(value)
+    if number is None or isinstance(value, (int, float)):
+        return number
+    unit = re.sub(r'[^a-z]', '', str(value).lower())
+    return number * _RAM_UNITS.get(unit, 1.0)
+
+
+def parse_ports(value):
+    """
+    Converte a lista de portas em uma tupla de inteiros
+    
+    Args:
+        value: Lista de portas (texto ou número) ou texto separado por vírgulas
+        
+    Returns:
+        tuple: Portas válidas, sem repetição, na ordem original
+    """
+    if isinstance(value, str):
+        value = value.split(',')
+    ports = []
+    for port in value or ():
+        try:
+            port = int(str(port).strip())
+        except ValueError:
+            continue
+        if port not in ports:
+            ports.append(port)
+    return tuple(ports)
+
+
+def host_environment(name):
+    """
+    Extrai o ambiente do nome do homelab
+    
+    Args:
+        name (str): Nome do homelab (ex: homelab-prod-3)
+        
+    Returns:
+        str: Ambiente (dev, test, prod) ou None
+    """
+    for part in name.split('-'):
+        if part in HOST_ENVIRONMENTS:
+            return part
+    return None
+
+
+def _intern(value):
+    return sys.intern(value) if isinstance(value, str) else value
+
+
+class HostRecord:
+    """
+    MODEL - Registro tipado de um homelab em um snapshot
+    
+    Guarda as métricas já convertidas (percentuais e RAM em float,
+    contagem de containers em int, portas em tupla de int). Os textos
+    repetidos entre hosts (ambiente e status) são internados, e raw
+    aponta para o dict original (já carregado) para as respostas em texto.
+    """
+    
+    __slots__ = ('name', 'environment', 'status', 'cpu', 'memoria', 'ram', 'containers', 'ports', 'rede', 'raw')
+    
+    def __init__(self, name, metrics):
+        self.name = name
+        self.environment = host_environment(name)
+        self.status = _intern(metrics.get('status'))
+        self.cpu = parse_metric_value(metrics.get('cpu'))
+        self.memoria = parse_metric_value(metrics.get('memoria'))
+        self.ram = parse_ram_gb(metrics.get('ram'))
+        containers = parse_metric_value(metrics.get('docker'))
+        self.containers = int(containers) if containers is not None else None
+        self.ports = parse_ports(metrics.get('portas'))
+        self.rede = metrics.get('rede')
+        self.raw = metrics
+    
+    def __repr__(self):
+        return f"<HostRecord {self.name} cpu={self.cpu} memoria={self.memoria} status={self.status}>"
+
+
+class HomelabIndex:
+    """
+    MODEL - Homelabs do snapshot mais recente com índices O(1)
+    
+    Aceita os dois formatos do homelabs.json (dict por homelab ou lista
+    de snapshots com timestamp, da qual usa o último).
+    """
+    
+    __slots__ = ('version', 'timestamp', 'hosts', 'by_environment', 'by_status', 'by_port', 'metrics')
+    
+    def __init__(self, version, timestamp, hosts):
+        self.version = version
+        self.timestamp = timestamp
+        self.hosts = {host.name: host for host in hosts}
+        
+        by_environment, by_status, by_port, metrics = {}, {}, {}, {}
+        for host in hosts:
+            by_environment.setdefault(host.environment, []).append(host)
+            by_status.setdefault(host.status, []).append(host)
+            for port in host.ports:
+                by_port.setdefault(port, []).append(host)
+            metrics.update(dict.fromkeys(host.raw))
+        
+        self.by_environment = {key: tuple(value) for key, value in by_environment.items()}
+        self.by_status = {key: tuple(value) for key, value in by_status.items()}
+        self.by_port = {key: tuple(value) for key, value in by_port.items()}
+        self.metrics = tuple(metrics)
+    
+    @classmethod
+    def build(cls, version, data):
+        """
+        Monta o índice a partir dos dados carregados
+        
+        Args:
+            version (str): Versão dos dados
+            data (dict | list): Conteúdo do homelabs.json
+            
+        Returns:
+            HomelabIndex: Índice do snapshot mais recente
+        """
+        timestamp, latest = None, {}
+        if isinstance(data, list):
+            if data:
+                timestamp = data[-1].get('timestamp')
+                latest = {name: metrics for name, metrics in data[-1].items() if name != 'timestamp'}
+        elif isinstance(data, dict):
+            latest = data
+        hosts = [HostRecord(name, metrics) for name, metrics in latest.items() if isinstance(metrics, dict)]
+        return cls(version, timestamp, hosts)
+
+
+class MetricSeries:
+    """
+    Coluna tipada de uma métrica de um homelab
+    
+    Timestamps (epoch, int64) e valores (float64) ficam em arrays
+    contíguos, ordenados por tempo.
+    """
+    
+    __slots__ = ('timestamps', 'values')
+    
+    def __init__(self):
+        self.timestamps = array('q')
+        self.values = array('d')
+    
+    def append(self, timestamp, value):
+        """Adiciona um ponto mantendo a ordem por tempo"""
+        if not self.timestamps or timestamp >= self.timestamps[-1]:
+            self.timestamps.append(timestamp)
+            self.values.append(value)
+        else:
+            index = bisect_right(self.timestamps, timestamp)
+            self.timestamps.insert(index, timestamp)
+            self.values.insert(index, value)
+    
+    def slice(self, t0=None, t1=None):
+        """Retorna os índices [início, fim) do intervalo fechado [t0, t1]"""
+        start = 0 if t0 is None else bisect_left(self.timestamps, t0)
+        end = len(self.timestamps) if t1 is None else bisect_right(self.timestamps, t1)
+        return start, end
+    
+    @classmethod
+    def from_buffers(cls, timestamps, values):
+        """
+        Coluna somente leitura sobre buffers existentes (sem cópia)
+        
+        Args:
+            timestamps: memoryview de int64 (formato 'q')
+            values: memoryview de float64 (formato 'd')
+            
+        Returns:
+            MetricSeries: Série que não aceita append
+        """
+        series = cls.__new__(cls)
+        series.timestamps = timestamps
+        series.values = values
+        return series
+    
+    def __len__(self):
+        return len(self.timestamps)
+
+
+class HomelabHistoryStore:
+    """
+    MODEL - Série temporal do histórico dos homelabs (MVC)
+    
+    Lê o homelabs_history.json uma única vez e guarda cada métrica
+    numérica de cada homelab como colunas tipadas, permitindo consultas
+    por intervalo, últimos N pontos, reamostragem e agregados sem
+    reprocessar o arquivo nem os textos das métricas.
+    
+    O arquivo é lido snapshot a snapshot (JSON ou JSON Lines); no formato
+    JSON Lines, refresh() consome apenas os snapshots acrescentados.
+    
+    Com POLDO_SHARED_SNAPSHOT ligado e uma geração publicada, as colunas
+    são as do snapshot compartilhado (somente leitura, sem cópia) e cada
+    consulta usa a geração mais recente; se o publicador parar de renovar
+    o snapshot, o store volta a ler o próprio arquivo.
+    """
+    
+    def __init__(self, data_file=None, shared=True):
+        self.data_file = data_file or os.path.join(os.path.dirname(__file__), 'data', 'homelabs_history.json')
+        self.shared = get_shared_snapshot() if shared else None
+        self._series = {}
+        self._loaded = False
+        self._offset = None
+        # Se as séries vieram da geração compartilhada
+        self._from_shared = False
+        # Snapshots já consumidos (do arquivo ou da geração compartilhada)
+        self.snapshot_count = 0
+    
+    def _load(self):
+        """Carrega o arquivo de histórico na primeira consulta"""
+        if self._load_shared():
+            self._loaded = True
+            return self._series
+        if self._from_shared:
+            # Snapshot compartilhado parado: recomeça pelo próprio arquivo
+            self._series, self.snapshot_count = {}, 0
+            self._from_shared = self._loaded = False
+        if not self._loaded:
+            self._loaded = True
+            try:
+                if is_jsonl(self.data_file):
+                    self._offset = 0
+                    self.refresh()
+                else:
+                    for snapshot in iter_snapshots(self.data_file):
+                        self.append(snapshot)
+            except FileNotFoundError:
+                pass
+            except ValueError:
+                # JSON inválido ou truncado: mantém o que já foi lido
+                pass
+        return self._series
+    
+    def refresh(self):
+        """
+        Consome os snapshots acrescentados ao histórico JSON Lines
+        
+        Returns:
+            int: Número de snapshots novos
+        """
+        loaded, before = self._loaded, self.snapshot_count
+        self._load()
+        if self._from_shared:
+            return max(self.snapshot_count - before, 0) if loaded else 0
+        if self._offset is None:
+            return 0
+        
+        count = 0
+        for snapshot, self._offset in tail_snapshots(self.data_file, self._offset):
+            if snapshot is None:
+                continue
+            self.append(snapshot)
+            count += 1
+        return count
+    
+    def append(self, snapshot):
+        """
+        Adiciona um snapshot ({"timestamp": ..., "homelab-x": {...}}) ao store
+        
+        Args:
+            snapshot (dict): Snapshot no formato do homelabs_history.json
+        """
+        timestamp = to_epoch(snapshot['timestamp'])
+        self.snapshot_count += 1
+        for name, metrics in snapshot.items():
+            if name == 'timestamp' or not isinstance(metrics, dict):
+                continue
+            for metric in NUMERIC_METRICS:
+                value = parse_metric_value(metrics.get(metric))
+                if value is not None:
+                    self._series.setdefault((name, metric), MetricSeries()).append(timestamp, value)
+    
+    def _load_shared(self):
+        """Usa as colunas da geração compartilhada mais recente, se houver"""
+        view = self.shared.read() if self.shared is not None else None
+        if view is None:
+            return False
+        self._series = view.series
+        self.snapshot_count = view.history_snapshots
+        self._from_shared = True
+        return True
+    
+    def get_series_map(self):
+        """Retorna todas as séries ({(homelab, métrica): MetricSeries})"""
+        return self._load()
+    
+    def get_homelab_names(self):
+        """Retorna os homelabs presentes no histórico"""
+        return sorted({name for name, _ in self._load()})
+    
+    def get_series(self, homelab_name, metric):
+        """Retorna a coluna (MetricSeries) de uma métrica ou None"""
+        return self._load().get((homelab_name, metric))
+    
+    def between(self, homelab_name, metric, t0=None, t1=None):
+        """
+        Pontos de uma métrica dentro do intervalo [t0, t1]
+        
+        Args:
+            homelab_name (str): Nome do homelab
+            metric (str): Métrica numérica (cpu, memoria, ram, docker)
+            t0, t1: Limites do intervalo (epoch, datetime ou texto); None = aberto
+            
+        Returns:
+            list: Lista de (timestamp, valor)
+        """
+        series = self.get_series(homelab_name, metric)
+        if series is None:
+            return []
+        start, end = series.slice(_epoch_or_none(t0), _epoch_or_none(t1))
+        return list(zip(series.timestamps[start:end], series.values[start:end]))
+    
+    def latest(self, homelab_name, metric, n=1):
+        """
+        Últimos N pontos de uma métrica
+        
+        Returns:
+            list: Lista de (timestamp, valor), do mais antigo ao mais recente
+        """
+        series = self.get_series(homelab_name, metric)
+        if series is None or n <= 0:
+            return []
+        start = max(len(series) - n, 0)
+        return list(zip(series.timestamps[start:], series.values[start:]))
+    
+    def resample(self, homelab_name, metric, step, how='avg', t0=None, t1=None):
+        """
+        Reamostra uma métrica em janelas de tamanho fixo
+        
+        Args:
+            homelab_name (str): Nome do homelab
+            metric (str): Métrica numérica
+            step (int): Tamanho da janela em segundos
+            how (str): Agregação por janela (min, max, avg, p95)
+            t0, t1: Limites do intervalo
+            
+        Returns:
+            list: Lista de (início da janela, valor agregado)
+        """
+        buckets = {}
+        for timestamp, value in self.between(homelab_name, metric, t0, t1):
+            buckets.setdefault(timestamp - timestamp % step, []).append(value)
+        return [(start, _aggregate(values)[how]) for start, values in sorted(buckets.items())]
+    
+    def aggregate(self, homelab_name, metric, t0=None, t1=None):
+        """
+        Agregados de uma métrica no intervalo [t0, t1]
+        
+        Returns:
+            dict: count, min, max, avg e p95 (valores None se não houver pontos)
+        """
+        series = self.get_series(homelab_name, metric)
+        if series is None:
+            return _aggregate([])
+        start, end = series.slice(_epoch_or_none(t0), _epoch_or_none(t1))
+        return _aggregate(series.values[start:end])
+    
+    def as_numpy(self, homelab_name, metric):
+        """
+        Visão NumPy (sem cópia) das colunas de uma métrica
+        
+        Returns:
+            tuple: (timestamps, valores) como ndarrays
+            
+        Raises:
+            RuntimeError: Se o NumPy não estiver instalado
+        """
+        if np is None:
+            raise RuntimeError("NumPy não está instalado")
+        series = self.get_series(homelab_name, metric) or MetricSeries()
+        return (np.frombuffer(series.timestamps, dtype=np.int64),
+                np.frombuffer(series.values, dtype=np.float64))
+
+
+def _epoch_or_none(value):
+    return None if value is None else to_epoch(value)
+
+
+def _aggregate(values):
+    """Calcula count/min/max/avg/p95 (p95 pelo método nearest-rank)"""
+    if not values:
+        return {'count': 0, 'min': None, 'max': None, 'avg': None, 'p95': None}
+    ordered = sorted(values)
+    count = len(ordered)
+    return {
+        'count': count,
+        'min': ordered[0],
+        'max': ordered[-1],
+        'avg': math.fsum(ordered) / count,
+        'p95': ordered[max(math.ceil(0.95 * count) - 1, 0)],
+    }
 
 
 # Django Models para persistência em banco de dados
@@ -199,12 +860,22 @@ class Conversation(models.Model):
     Model Django para representar uma conversa no chat
     """
     title = models.CharField(max_length=200, default="Nova Conversa")
-    created_at = models.DateTimeField(auto_now_add=True)
+    # Desnormalizado: evita um COUNT das mensagens para decidir o título
+    has_user_message = models.BooleanField(default=False)
+    # Resumo acumulado das trocas que saíram da janela do histórico
+    # (agent/history.py) e o ID da última mensagem já resumida
+    summary = models.TextField(blank=True, default='')
+    summary_until = models.BigIntegerField(null=True, blank=True)
+    # default em vez de auto_now_add: a restauração do arquivo mantém a data original
+    created_at = models.DateTimeField(default=timezone.now, editable=False)
     
     class Meta:
         ordering = ['-created_at']
         verbose_name = "Conversa"
         verbose_name_plural = "Conversas"
+        indexes = [
+            models.Index(fields=['created_at'], name='agent_conv_created_idx'),
+        ]
     
     def __str__(self):
         return self.title
@@ -226,12 +897,122 @@ class Message(models.Model):
     )
     role = models.CharField(max_length=10, choices=ROLE_CHOICES)
     text = models.TextField()
-    created_at = models.DateTimeField(auto_now_add=True)
+    created_at = models.DateTimeField(default=timezone.now, editable=False)
     
     class Meta:
         ordering = ['created_at']
         verbose_name = "Mensagem"
         verbose_name_plural = "Mensagens"
+        indexes = [
+            models.Index(fields=['conversation', 'created_at'], name='agent_msg_conv_created_idx'),
+        ]
+    
+    def __str__(self):
+        return f"{self.role}: {self.text[:50]}..."
+
+
+class ArchivedConversation(models.Model):
+    """
+    Model Django para uma conversa arquivada
+
+    As mensagens saem da tabela Message e ficam em um único blob JSON
+    comprimido com gzip (ver agent/archive.py). O id é o da conversa
+    original, para que links antigos continuem reabrindo a conversa.
+    """
+    id = models.BigIntegerField(primary_key=True)
+    title = models.CharField(max_length=200)
+    has_user_message = models.BooleanField(default=False)
+    created_at = models.DateTimeField()
+    last_message_at = models.DateTimeField()
+    archived_at = models.DateTimeField(auto_now_add=True)
+    message_count = models.PositiveIntegerField(default=0)
+    payload = models.BinaryField()
+
+    class Meta:
+        ordering = ['-created_at']
+        verbose_name = "Conversa arquivada"
+        verbose_name_plural = "Conversas arquivadas"
+        indexes = [
+            models.Index(fields=['created_at'], name='agent_archived_created_idx'),
+        ]
+
+    def __str__(self):
+        return self.title
+
+
+class Host(models.Model):
+    """
+    Model Django para um homelab monitorado pelos coletores
+    """
+    name = models.CharField(max_length=100, unique=True)
+    last_seen_at = models.DateTimeField(null=True, blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    
+    class Meta:
+        ordering = ['name']
+        verbose_name = "Host"
+        verbose_name_plural = "Hosts"
     
     def __str__(self):
-        return f"{self.role}: {self.text[:50]}..."
\ No newline at end of file
+        return self.name
+
+
+class MetricSample(models.Model):
+    """
+    Model Django para uma amostra de métrica enviada por um coletor
+    
+    Guarda o valor original (raw, ex: "52%" ou a lista de portas) e, quando
+    possível, o valor numérico já convertido.
+    """
+    host = models.ForeignKey(
+        Host,
+        on_delete=models.CASCADE,
+        related_name="samples"
+    )
+    metric = models.CharField(max_length=50)
+    value = models.FloatField(null=True, blank=True)
+    raw = models.JSONField()
+    collected_at = models.DateTimeField()
+    
+    class Meta:
+        ordering = ['collected_at']
+        verbose_name = "Amostra de métrica"
+        verbose_name_plural = "Amostras de métricas"
+        indexes = [
+            models.Index(fields=['host', 'collected_at'], name='agent_sample_host_time_idx'),
+            models.Index(fields=['metric', 'collected_at'], name='agent_sample_metric_time_idx'),
+        ]
+    
+    def __str__(self):
+        return f"{self.host_id} {self.metric}={self.raw}"
+    
+    # Hosts por consulta em latest_snapshot (2 parâmetros por host)
+    LATEST_BATCH = 500
+
+    @classmethod
+    def latest_snapshot(cls):
+        """
+        Retorna o último snapshot de cada host
+        
+        Parte dos hosts (tabela pequena) e busca, para cada um, só as
+        amostras de Host.last_seen_at (mantido pela ingestão), pares
+        (host, momento) que o índice (host, collected_at) resolve
+        direto. Um JOIN com collected_at = host.last_seen_at deixava o
+        SQLite percorrer a tabela de amostras inteira.
+        
+        Returns:
+            dict: {nome do host: {métrica: valor original}}
+        """
+        hosts = list(
+            Host.objects.filter(last_seen_at__isnull=False).values_list('id', 'name', 'last_seen_at')
+        )
+        names = {host_id: name for host_id, name, _ in hosts}
+        snapshot = {}
+        for start in range(0, len(hosts), cls.LATEST_BATCH):
+            latest = Q()
+            for host_id, _, last_seen_at in hosts[start:start + cls.LATEST_BATCH]:
+                latest |= Q(host_id=host_id, collected_at=last_seen_at)
+            rows = cls.objects.filter(latest).order_by().values_list('host_id', 'metric', 'raw')
+            for host_id, metric, raw in rows:
+                snapshot.setdefault(names[host_id], {})[metric] = raw
+        return snapshot
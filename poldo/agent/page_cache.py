@@ -0,0 +1,130 @@
+"""
+Versões da página do chat para GET condicional e cache de fragmentos
+
+A página /chat/ depende de duas coisas que mudam em ritmos diferentes:
+a lista de conversas da barra lateral e as mensagens da conversa aberta.
+Cada uma tem uma versão guardada no cache do Django (o instante da última
+mudança), trocada quando Conversation ou Message são gravadas:
+
+- post_save de Conversation e Message, para gravações uma a uma
+- chamadas explícitas nos caminhos em lote (bulk_create, update e delete
+  não disparam post_save), como ChatController._save_exchange e o
+  arquivamento
+
+As versões formam o ETag e o Last-Modified da página (uma página sem
+mudanças recebe 304 sem nenhuma consulta ao banco) e as chaves do
+{% cache %} dos fragmentos da barra lateral e da lista de mensagens.
+
+POLDO_PAGE_CACHE['ALIAS'] precisa apontar para um cache compartilhado
+(Redis, Memcached, banco): no LocMemCache padrão as versões trocadas em
+um worker não chegam aos outros, que responderiam 304 ou fragmentos
+antigos depois de uma gravação. Com um cache por processo, o GET
+condicional e os fragmentos ficam desligados, a menos que um único
+processo sirva o Poldo (POLDO_SINGLE_PROCESS).
+"""
+
+import time
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db import transaction
+from django.db.models.signals import post_save
+
+from .models import Conversation, Message
+from .response_cache import reaches_all_workers
+
+LIST_KEY = 'poldo:chat:list-version'
+
+
+def _conversation_key(conversation_id):
+    return f'poldo:chat:conversation-version:{conversation_id}'
+
+
+def _config():
+    return getattr(settings, 'POLDO_PAGE_CACHE', {})
+
+
+def is_enabled():
+    """Indica se o GET condicional e o cache de fragmentos estão ligados (e as versões chegam a todos os workers)"""
+    config = _config()
+    return config.get('ENABLED', True) and reaches_all_workers(config.get('ALIAS', 'default'))
+
+
+def fragment_settings():
+    """
+    Parâmetros do {% cache %} dos fragmentos
+
+    Returns:
+        dict: timeout (0 = sem cache) e alias do cache
+    """
+    config = _config()
+    return {
+        'timeout': config.get('TIMEOUT', 3600) if is_enabled() else 0,
+        'alias': config.get('ALIAS', 'default'),
+    }
+
+
+def _cache():
+    return caches[_config().get('ALIAS', 'default')]
+
+
+def get_versions(conversation_id):
+    """
+    Retorna as versões da lista de conversas e de uma conversa
+
+    Uma versão ausente (cache reiniciado ou chave removida) começa no
+    instante atual, então nunca coincide com um ETag emitido antes.
+
+    Args:
+        conversation_id (int): ID da conversa aberta
+
+    Returns:
+        tuple: (versão da lista, versão da conversa), em segundos desde a época
+    """
+    cache = _cache()
+    keys = [LIST_KEY, _conversation_key(conversation_id)]
+    versions = cache.get_many(keys)
+    for key in keys:
+        if key not in versions:
+            cache.add(key, time.time(), timeout=None)
+            versions[key] = cache.get(key, time.time())
+    return versions[LIST_KEY], versions[keys[1]]
+
+
+def invalidate(conversation_ids=(), conversation_list=False):
+    """
+    Troca as versões das conversas (e da lista) após o commit
+
+    Args:
+        conversation_ids (iterable): Conversas cujas mensagens mudaram
+        conversation_list (bool): Se a lista de conversas mudou (nova
+            conversa, título alterado, remoção)
+    """
+    keys = [_conversation_key(conversation_id) for conversation_id in conversation_ids]
+    if conversation_list:
+        keys.append(LIST_KEY)
+    if not keys:
+        return
+
+    def bump():
+        now = time.time()
+        _cache().set_many({key: now for key in keys}, timeout=None)
+
+    # Só depois do commit: antes disso outra requisição ainda lê os dados antigos
+    transaction.on_commit(bump)
+
+
+def conversation_saved(sender, instance, **kwargs):
+    """post_save de Conversation: título ou lista mudaram"""
+    invalidate([instance.pk], conversation_list=True)
+
+
+def message_saved(sender, instance, **kwargs):
+    """post_save de Message: mensagens da conversa mudaram"""
+    invalidate([instance.conversation_id])
+
+
+def connect_signals():
+    """Registra a invalidação por post_save (chamado em AgentConfig.ready)"""
+    post_save.connect(conversation_saved, sender=Conversation, dispatch_uid='poldo_page_conversation_saved')
+    post_save.connect(message_saved, sender=Message, dispatch_uid='poldo_page_message_saved')
@@ -0,0 +1,173 @@
+"""
+Montagem compacta do prompt enviado ao Gemini
+
+Em vez de colar o JSON indentado de todos os homelabs em todo prompt,
+os dados vão como uma tabela CSV contendo apenas os homelabs e métricas
+citados na pergunta, limitada por um orçamento estimado de tokens.
+"""
+
+import csv
+import io
+import re
+
+from .intent_router import METRIC_ALIASES
+from .response_cache import normalize_question
+
+# Orçamento padrão (em tokens estimados) para a seção de dados
+DEFAULT_TOKEN_BUDGET = 2000
+
+# Média aproximada de caracteres por token em texto pt-BR/CSV
+CHARS_PER_TOKEN = 4
+
+_ALIAS_TO_METRIC = {alias: metric for metric, aliases in METRIC_ALIASES.items() for alias in aliases}
+_WORD_RE = re.compile(r'[\w-]+')
+
+
+def estimate_tokens(text):
+    """
+    Estima o número de tokens de um texto
+
+    Heurística de ~4 caracteres por token: suficiente para controlar o
+    tamanho do prompt sem depender do tokenizador do modelo.
+
+    Args:
+        text (str): Texto a estimar
+
+    Returns:
+        int: Número estimado de tokens
+    """
+    return len(text) // CHARS_PER_TOKEN + 1
+
+
+def normalize_snapshots(data):
+    """
+    Converte os dados dos homelabs em uma lista de snapshots
+
+    Aceita tanto o formato {nome: métricas} quanto a lista de snapshots
+    com timestamp usada em homelabs.json.
+
+    Args:
+        data: Dados dos homelabs
+
+    Returns:
+        list: Lista de (timestamp, {nome: métricas}), do mais antigo ao mais recente
+    """
+    if isinstance(data, dict):
+        return [(None, data)] if data else []
+    return [
+        (item.get('timestamp'), {name: metrics for name, metrics in item.items() if name != 'timestamp'})
+        for item in data or []
+    ]
+
+
+class PromptBuilder:
+    """
+    CONTROLLER - Monta a seção de dados do prompt
+
+    Filtra homelabs e métricas relevantes para a pergunta e codifica o
+    resultado como CSV, do snapshot mais recente para trás até esgotar o
+    orçamento de tokens.
+    """
+
+    def __init__(self, homelabs_data, token_budget=DEFAULT_TOKEN_BUDGET):
+        self.snapshots = normalize_snapshots(homelabs_data)
+        self.token_budget = token_budget
+
+        # dicts preservam a ordem de aparição sem buscas lineares
+        hosts = {}
+        metrics = {}
+        for _, homelabs in self.snapshots:
+            for name, values in homelabs.items():
+                hosts[name] = None
+                metrics.update(dict.fromkeys(values))
+        self.hosts = list(hosts)
+        self.metrics = list(metrics)
+
+    def select(self, question):
+        """
+        Escolhe os homelabs e métricas citados na pergunta
+
+        Se a pergunta não cita nenhum homelab (ou nenhuma métrica),
+        todos são incluídos. Pedir apenas o "status" de um homelab
+        também inclui todas as métricas.
+
+        Args:
+            question (str): Pergunta do usuário
+
+        Returns:
+            tuple: (homelabs, métricas)
+        """
+        words = set(_WORD_RE.findall(normalize_question(question)))
+        hosts = [name for name in self.hosts if name in words]
+        metrics = [metric for metric in self.metrics if _metric_mentioned(metric, words)]
+        if metrics == ['status']:
+            metrics = []
+        return hosts or list(self.hosts), metrics or list(self.metrics)
+
+    def encode(self, snapshots, hosts, metrics):
+        """
+        Codifica snapshots como CSV (timestamp, homelab e uma coluna por métrica)
+
+        Args:
+            snapshots (list): Lista de (timestamp, {nome: métricas})
+            hosts (list): Homelabs a incluir
+            metrics (list): Métricas a incluir
+
+        Returns:
+            str: Tabela CSV
+        """
+        return _csv([['timestamp', 'homelab'] + metrics]) + ''.join(
+            self._rows(snapshot, hosts, metrics) for snapshot in snapshots
+        )
+
+    def _rows(self, snapshot, hosts, metrics):
+        timestamp, homelabs = snapshot
+        return _csv(
+            [timestamp or '', name] + [_cell(homelabs[name].get(metric)) for metric in metrics]
+            for name in hosts if name in homelabs
+        )
+
+    def build_data_section(self, question):
+        """
+        Monta a tabela de dados relevante para a pergunta dentro do orçamento
+
+        O snapshot mais recente sempre entra; os anteriores são incluídos
+        enquanto couberem no orçamento de tokens.
+
+        Args:
+            question (str): Pergunta do usuário
+
+        Returns:
+            str: Tabela CSV com os dados selecionados
+        """
+        hosts, metrics = self.select(question)
+        header = self.encode([], hosts, metrics)
+        used = estimate_tokens(header)
+
+        blocks = []
+        for snapshot in reversed(self.snapshots):
+            block = self._rows(snapshot, hosts, metrics)
+            cost = estimate_tokens(block)
+            if blocks and used + cost > self.token_budget:
+                break
+            blocks.append(block)
+            used += cost
+        return header + ''.join(reversed(blocks))
+
+
+def _metric_mentioned(metric, words):
+    return any(_ALIAS_TO_METRIC.get(word) == metric for word in words) or metric in words
+
+
+def _cell(value):
+    if value is None:
+        return ''
+    if isinstance(value, (list, tuple)):
+        return ' '.join(str(item) for item in value)
+    return str(value)
+
+
+def _csv(rows):
+    buffer = io.StringIO()
+    csv.writer(buffer, lineterminator='\n').writerows(rows)
+    return buffer.getvalue()
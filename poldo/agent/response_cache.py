@@ -0,0 +1,257 @@
+"""
+Cache de respostas do ChatAgent
+
+Evita pagar uma chamada ao modelo para perguntas repetidas. A chave é a
+pergunta normalizada mais a versão (hash) dos dados dos homelabs, então
+qualquer mudança nos dados invalida as respostas antigas automaticamente.
+
+Dois backends intercambiáveis, escolhidos em settings.POLDO_RESPONSE_CACHE:
+- 'lru': LRU em memória do processo, com TTL e limite de entradas
+- 'django': framework de cache do Django (CACHES), compartilhado entre workers
+"""
+
+import hashlib
+import json
+import re
+import threading
+import time
+import unicodedata
+from collections import OrderedDict
+
+from django.conf import settings
+from django.core.cache import caches
+from django.core.cache.backends.dummy import DummyCache
+from django.core.cache.backends.locmem import LocMemCache
+
+
+def normalize_question(question):
+    """
+    Normaliza a pergunta para uso na chave do cache
+
+    Ignora caixa, acentos, pontuação e espaços repetidos, então
+    "Qual a CPU do homelab-dev?" e "qual a cpu do homelab-dev" coincidem.
+
+    Args:
+        question (str): Pergunta do usuário
+
+    Returns:
+        str: Pergunta normalizada
+    """
+    text = unicodedata.normalize('NFKD', question.casefold())
+    text = ''.join(c for c in text if not unicodedata.combining(c))
+    text = re.sub(r'[^\w\s-]', ' ', text)
+    return ' '.join(text.split())
+
+
+def data_version(data):
+    """
+    Calcula a versão (hash) de um snapshot dos dados dos homelabs
+
+    Args:
+        data: Dados dos homelabs (dict ou lista de snapshots)
+
+    Returns:
+        str: Hash curto e estável do conteúdo
+    """
+    payload = json.dumps(data, sort_keys=True, ensure_ascii=False)
+    return hashlib.sha1(payload.encode('utf-8')).hexdigest()[:16]
+
+
+def make_key(question, version, history=''):
+    """
+    Monta a chave do cache a partir da pergunta e da versão dos dados
+
+    Args:
+        question (str): Pergunta do usuário
+        version (str): Versão dos dados dos homelabs
+        history (str): Histórico enviado junto (perguntas de seguimento
+            como "e a ram?" dependem dele)
+
+    Returns:
+        str: Chave do cache
+    """
+    material = f"{version}:{normalize_question(question)}"
+    if history:
+        material += f":{history}"
+    digest = hashlib.sha256(material.encode('utf-8')).hexdigest()
+    return f"poldo:resp:{digest}"
+
+
+class ResponseCache:
+    """
+    Base dos backends de cache de respostas
+
+    Mantém os contadores de acertos/falhas expostos para monitoramento.
+    """
+
+    backend = None
+
+    def __init__(self, ttl=300):
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self.sets = 0
+        self.evictions = 0
+        self._stats_lock = threading.Lock()
+
+    def _count(self, hit):
+        with self._stats_lock:
+            if hit:
+                self.hits += 1
+            else:
+                self.misses += 1
+
+    def get(self, key):
+        raise NotImplementedError
+
+    def set(self, key, value):
+        raise NotImplementedError
+
+    async def aget(self, key):
+        return self.get(key)
+
+    async def aset(self, key, value):
+        self.set(key, value)
+
+    def stats(self):
+        """
+        Retorna os contadores do cache
+
+        Returns:
+            dict: Backend, acertos, falhas, gravações, remoções e taxa de acerto
+        """
+        total = self.hits + self.misses
+        return {
+            'backend': self.backend,
+            'hits': self.hits,
+            'misses': self.misses,
+            'sets': self.sets,
+            'evictions': self.evictions,
+            'hit_rate': self.hits / total if total else 0.0,
+        }
+
+
+class LRUResponseCache(ResponseCache):
+    """
+    Cache LRU em memória com TTL e limite de entradas
+    """
+
+    backend = 'lru'
+
+    def __init__(self, max_entries=1024, ttl=300):
+        super().__init__(ttl=ttl)
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[0] < time.monotonic():
+                del self._entries[key]
+                self.evictions += 1
+                entry = None
+            if entry is not None:
+                self._entries.move_to_end(key)
+        self._count(entry is not None)
+        return entry[1] if entry is not None else None
+
+    def set(self, key, value):
+        with self._lock:
+            self._entries[key] = (time.monotonic() + self.ttl, value)
+            self._entries.move_to_end(key)
+            self.sets += 1
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def stats(self):
+        stats = super().stats()
+        stats['size'] = len(self._entries)
+        stats['max_entries'] = self.max_entries
+        return stats
+
+
+class DjangoResponseCache(ResponseCache):
+    """
+    Cache de respostas sobre o framework de cache do Django
+
+    O limite de tamanho e a remoção ficam a cargo do backend configurado
+    em CACHES (ex: OPTIONS.MAX_ENTRIES do LocMemCache/FileBasedCache).
+    """
+
+    backend = 'django'
+
+    def __init__(self, alias='default', ttl=300):
+        super().__init__(ttl=ttl)
+        self.alias = alias
+
+    @property
+    def cache(self):
+        return caches[self.alias]
+
+    def get(self, key):
+        value = self.cache.get(key)
+        self._count(value is not None)
+        return value
+
+    def set(self, key, value):
+        self.cache.set(key, value, timeout=self.ttl)
+        self.sets += 1
+
+    async def aget(self, key):
+        value = await self.cache.aget(key)
+        self._count(value is not None)
+        return value
+
+    async def aset(self, key, value):
+        await self.cache.aset(key, value, timeout=self.ttl)
+        self.sets += 1
+
+
+def get_response_cache():
+    """
+    Cria o cache de respostas conforme settings.POLDO_RESPONSE_CACHE
+
+    Returns:
+        ResponseCache: Backend configurado ('lru' por padrão)
+    """
+    config = getattr(settings, 'POLDO_RESPONSE_CACHE', {})
+    ttl = config.get('TTL', 300)
+
+    if config.get('BACKEND', 'lru') == 'django':
+        return DjangoResponseCache(alias=config.get('ALIAS', 'default'), ttl=ttl)
+
+    return LRUResponseCache(max_entries=config.get('MAX_ENTRIES', 1024), ttl=ttl)
+
+
+def is_shared_cache(alias):
+    """
+    Indica se um cache do Django é visto por todos os processos
+
+    LocMemCache e DummyCache são por processo: o que um worker grava os
+    outros não veem.
+
+    Args:
+        alias (str): Alias em CACHES
+
+    Returns:
+        bool: True para caches compartilhados (Redis, Memcached, banco, arquivos)
+    """
+    return not isinstance(caches[alias], (LocMemCache, DummyCache))
+
+
+def reaches_all_workers(alias):
+    """
+    Indica se um cache serve para estado que todos os workers precisam ver
+
+    Vale se o cache é compartilhado entre processos ou se o deploy roda um
+    único processo (settings.POLDO_SINGLE_PROCESS).
+
+    Args:
+        alias (str): Alias em CACHES
+
+    Returns:
+        bool: True se um valor gravado por um worker chega aos demais
+    """
+    return getattr(settings, 'POLDO_SINGLE_PROCESS', False) or is_shared_cache(alias)
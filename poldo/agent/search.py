@@ -0,0 +1,263 @@
+"""
+Busca textual nas mensagens das conversas
+
+O índice depende do banco (criado na migração 0007_message_search):
+
+- SQLite: tabela virtual FTS5 agent_message_fts, de conteúdo externo
+  (aponta para agent_message, sem duplicar o texto), mantida por
+  triggers de INSERT, UPDATE e DELETE. Assim bulk_create, update() e a
+  remoção no arquivamento também atualizam o índice, o que post_save não
+  faria. Ordenação por bm25.
+- PostgreSQL: coluna gerada search_vector (tsvector) com índice GIN,
+  ordenada por ts_rank_cd e com trechos de ts_headline
+- outros bancos (ou SQLite sem FTS5): LIKE, sem ranking
+
+O tokenizador mantém o hífen dentro da palavra, então "homelab-prod" é
+um termo só, e não "homelab" (presente em quase toda mensagem) mais
+"prod". Para ficar rápido com milhões de mensagens, o ranking é feito
+entre as POLDO_SEARCH['CANDIDATES'] ocorrências mais recentes: o índice
+é lido do fim para o início e para logo depois, em vez de calcular o
+bm25 de todas as mensagens que citam os termos.
+"""
+
+import html
+import re
+from collections import namedtuple
+
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, connection, connections
+from django.db.models.signals import post_migrate
+from django.utils.safestring import mark_safe
+
+from .models import Message
+
+FTS_TABLE = 'agent_message_fts'
+
+# Triggers que mantêm o FTS5 sincronizado (os mesmos da migração 0007).
+# O SQLite os remove junto com a tabela quando uma migração recria
+# agent_message, então ensure_sqlite_triggers os recria no post_migrate.
+SQLITE_TRIGGERS = {
+    'agent_message_fts_insert': f"""
+        CREATE TRIGGER agent_message_fts_insert AFTER INSERT ON agent_message BEGIN
+            INSERT INTO {FTS_TABLE}(rowid, text) VALUES (new.id, new.text);
+        END
+    """,
+    'agent_message_fts_delete': f"""
+        CREATE TRIGGER agent_message_fts_delete AFTER DELETE ON agent_message BEGIN
+            INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, text) VALUES ('delete', old.id, old.text);
+        END
+    """,
+    'agent_message_fts_update': f"""
+        CREATE TRIGGER agent_message_fts_update AFTER UPDATE OF text ON agent_message BEGIN
+            INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, text) VALUES ('delete', old.id, old.text);
+            INSERT INTO {FTS_TABLE}(rowid, text) VALUES (new.id, new.text);
+        END
+    """,
+}
+
+# Palavras da consulta (hífen só no meio: "homelab-prod")
+_TERM_RE = re.compile(r'\w+(?:-\w+)*')
+MAX_TERMS = 8
+
+# Marcadores dos termos no trecho: trocados por <mark> depois do escape do HTML
+_START, _END = '\x02', '\x03'
+SNIPPET_TOKENS = 12
+
+SearchResult = namedtuple('SearchResult', ['message', 'snippet', 'rank'])
+
+# Backend de busca por banco (a tabela FTS5 só é consultada uma vez)
+_backends = {}
+
+
+def get_config():
+    """
+    Configuração da busca (POLDO_SEARCH)
+
+    Returns:
+        dict: LIMIT, CANDIDATES e CONFIG (dicionário do PostgreSQL)
+    """
+    config = dict(getattr(settings, 'POLDO_SEARCH', {}))
+    config.setdefault('LIMIT', 20)
+    config.setdefault('CANDIDATES', 1000)
+    config.setdefault('CONFIG', 'portuguese')
+    return config
+
+
+def query_terms(query):
+    """
+    Extrai os termos de uma consulta
+
+    Args:
+        query (str): Texto digitado pelo usuário
+
+    Returns:
+        list: Termos em minúsculas, sem repetição (no máximo MAX_TERMS)
+    """
+    terms = []
+    for term in _TERM_RE.findall(query.lower()):
+        if term not in terms:
+            terms.append(term)
+    return terms[:MAX_TERMS]
+
+
+def search_backend():
+    """
+    Backend de busca do banco atual
+
+    Returns:
+        str: 'fts5', 'tsvector' ou 'like'
+    """
+    key = (connection.alias, connection.settings_dict['NAME'])
+    backend = _backends.get(key)
+    if backend is None:
+        if connection.vendor == 'postgresql':
+            backend = 'tsvector'
+        elif connection.vendor == 'sqlite' and FTS_TABLE in connection.introspection.table_names():
+            backend = 'fts5'
+        else:
+            backend = 'like'
+        _backends[key] = backend
+    return backend
+
+
+def search_messages(query, limit=None, backend=None):
+    """
+    Busca mensagens pelo texto
+
+    Args:
+        query (str): Texto da busca
+        limit (int, optional): Máximo de resultados (padrão: POLDO_SEARCH['LIMIT'])
+        backend (str, optional): Força um backend (ex: 'like' para comparar)
+
+    Returns:
+        list: SearchResult (mensagem com a conversa, trecho em HTML com os
+            termos em <mark> e relevância), do mais relevante ao menos
+    """
+    terms = query_terms(query)
+    if not terms:
+        return []
+    config = get_config()
+    limit = limit or config['LIMIT']
+
+    backend = backend or search_backend()
+    if backend == 'like':
+        return _search_like(terms, limit)
+
+    search = _search_fts5 if backend == 'fts5' else _search_tsvector
+    hits = search(terms, limit, config)
+    messages = (
+        Message.objects
+        .select_related('conversation')
+        .only('id', 'role', 'created_at', 'conversation__id', 'conversation__title')
+        .in_bulk([message_id for message_id, _, _ in hits])
+    )
+    return [
+        SearchResult(messages[message_id], _render_snippet(snippet), rank)
+        for message_id, snippet, rank in hits
+        if message_id in messages
+    ]
+
+
+def _search_fts5(terms, limit, config):
+    """IDs, trechos e bm25 (menor = mais relevante) no índice FTS5"""
+    # Cada termo entre aspas: o FTS5 não interpreta operadores digitados pelo usuário
+    match = ' '.join(f'"{term}"' for term in terms)
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f"""
+            SELECT id, snippet, rank FROM (
+                SELECT rowid AS id,
+                       snippet({FTS_TABLE}, 0, %s, %s, %s, %s) AS snippet,
+                       bm25({FTS_TABLE}) AS rank
+                FROM {FTS_TABLE}
+                WHERE {FTS_TABLE} MATCH %s
+                ORDER BY rowid DESC
+                LIMIT %s
+            )
+            ORDER BY rank
+            LIMIT %s
+            """,
+            [_START, _END, '…', SNIPPET_TOKENS, match, config['CANDIDATES'], limit],
+        )
+        return cursor.fetchall()
+
+
+def _search_tsvector(terms, limit, config):
+    """IDs, trechos e ts_rank_cd (maior = mais relevante) no tsvector do PostgreSQL"""
+    options = f'StartSel={_START}, StopSel={_END}, MaxWords={SNIPPET_TOKENS * 2}, MinWords={SNIPPET_TOKENS}'
+    with connection.cursor() as cursor:
+        cursor.execute(
+            """
+            SELECT hit.id, ts_headline(%s::regconfig, message.text, hit.query, %s), hit.rank FROM (
+                SELECT id, query, ts_rank_cd(search_vector, query) AS rank
+                FROM agent_message, plainto_tsquery(%s::regconfig, %s) AS query
+                WHERE search_vector @@ query
+                ORDER BY id DESC
+                LIMIT %s
+            ) AS hit
+            JOIN agent_message AS message ON message.id = hit.id
+            ORDER BY hit.rank DESC
+            LIMIT %s
+            """,
+            [config['CONFIG'], options, config['CONFIG'], ' '.join(terms), config['CANDIDATES'], limit],
+        )
+        return cursor.fetchall()
+
+
+def _search_like(terms, limit):
+    """Sem índice textual: LIKE por termo, mais recentes primeiro"""
+    messages = Message.objects.select_related('conversation')
+    for term in terms:
+        messages = messages.filter(text__icontains=term)
+    return [
+        SearchResult(message, _render_snippet(_like_snippet(message.text, terms)), None)
+        for message in messages.order_by('-id')[:limit]
+    ]
+
+
+def _like_snippet(text, terms):
+    """Trecho em volta do primeiro termo encontrado, com os termos marcados"""
+    pattern = re.compile('|'.join(re.escape(term) for term in terms), re.IGNORECASE)
+    words = text.split()
+    first = next((i for i, word in enumerate(words) if pattern.search(word)), 0)
+    start = max(first - SNIPPET_TOKENS // 2, 0)
+    excerpt = ' '.join(words[start:start + SNIPPET_TOKENS])
+    excerpt = pattern.sub(lambda match: f'{_START}{match.group(0)}{_END}', excerpt)
+    prefix = '…' if start > 0 else ''
+    suffix = '…' if start + SNIPPET_TOKENS < len(words) else ''
+    return f'{prefix}{excerpt}{suffix}'
+
+
+def _render_snippet(snippet):
+    """Escapa o trecho e troca os marcadores por <mark>"""
+    escaped = html.escape(snippet or '')
+    return mark_safe(escaped.replace(_START, '<mark>').replace(_END, '</mark>'))
+
+
+def ensure_sqlite_triggers(sender, using=DEFAULT_DB_ALIAS, **kwargs):
+    """
+    Recria os triggers do FTS5 que faltarem e reconstrói o índice (post_migrate)
+
+    Args:
+        sender: AppConfig que terminou de migrar
+        using (str): Alias do banco migrado
+    """
+    db = connections[using]
+    if db.vendor != 'sqlite':
+        return
+    with db.cursor() as cursor:
+        cursor.execute("SELECT name FROM sqlite_master WHERE name = %s OR name IN (%s, %s, %s)",
+                       [FTS_TABLE, *SQLITE_TRIGGERS])
+        existing = {name for name, in cursor.fetchall()}
+        missing = [name for name in SQLITE_TRIGGERS if name not in existing]
+        if FTS_TABLE not in existing or not missing:
+            return
+        for name in missing:
+            cursor.execute(SQLITE_TRIGGERS[name])
+        # Mensagens gravadas enquanto os triggers não existiam
+        cursor.execute(f"INSERT INTO {FTS_TABLE}({FTS_TABLE}) VALUES ('rebuild')")
+
+
+def connect_signals(app_config):
+    """Registra a verificação dos triggers (chamado em AgentConfig.ready)"""
+    post_migrate.connect(ensure_sqlite_triggers, sender=app_config, dispatch_uid='poldo_search_triggers')
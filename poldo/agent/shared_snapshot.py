@@ -0,0 +1,318 @@
+"""
+Snapshot dos homelabs compartilhado entre os workers
+
+Com N workers (gunicorn/uvicorn), cada processo lia o homelabs.json (ou
+o banco) e o histórico por conta própria: N cópias dos dados e workers
+vendo versões diferentes por alguns segundos. Com o snapshot
+compartilhado, um único publicador (`manage.py publish_snapshot`) grava
+os dados atuais e as colunas do histórico em um arquivo em memória
+(/dev/shm), e os workers o mapeiam somente leitura com mmap.
+
+Formato do arquivo:
+
+- cabeçalho fixo: assinatura, versão do formato, tamanho dos metadados,
+  geração (contador crescente), versão dos dados e horário da publicação
+- metadados em JSON: snapshot atual dos homelabs e o diretório das séries
+- colunas do histórico (timestamps int64 e valores float64), alinhadas
+  em 8 bytes
+
+As colunas viram memoryviews sobre o mapeamento, sem cópia, e as páginas
+são as mesmas em todos os workers. Já os dados atuais (meta['data']) são
+decodificados do JSON por cada worker a cada geração: só o histórico é
+compartilhado sem cópia. O publicador grava um arquivo novo e o troca
+com os.replace: quem ainda usa o mapeamento anterior continua lendo o
+arquivo antigo até remapear, nunca um arquivo pela metade.
+
+Com --watch, o publicador renova o horário da publicação a cada
+intervalo mesmo sem mudanças (touch). Se o horário ficar mais velho que
+MAX_AGE (publicador parado), read() deixa de devolver o snapshot e os
+workers voltam a ler a própria origem até uma nova publicação.
+"""
+
+import json
+import logging
+import mmap
+import os
+import struct
+import tempfile
+import threading
+import time
+from collections import namedtuple
+
+from django.conf import settings
+
+from .file_watcher import FileWatcher
+
+logger = logging.getLogger(__name__)
+
+MAGIC = b'POLDOSNP'
+LAYOUT = 2
+
+# assinatura, formato, tamanho dos metadados, geração, versão dos dados,
+# horário da publicação (epoch)
+HEADER = struct.Struct('<8sIIQ16sd')
+PUBLISHED_AT = struct.Struct('<d')
+PUBLISHED_AT_OFFSET = HEADER.size - PUBLISHED_AT.size
+
+# Dados mapeados de uma geração do arquivo
+SharedView = namedtuple('SharedView', ['generation', 'version', 'data', 'history_snapshots', 'series'])
+
+
+def default_path():
+    """
+    Caminho padrão do snapshot compartilhado
+
+    Returns:
+        str: /dev/shm/poldo-snapshot.bin (ou no diretório temporário, sem /dev/shm)
+    """
+    directory = '/dev/shm' if os.path.isdir('/dev/shm') else tempfile.gettempdir()
+    return os.path.join(directory, 'poldo-snapshot.bin')
+
+
+def get_config():
+    """
+    Configuração do snapshot compartilhado (POLDO_SHARED_SNAPSHOT)
+
+    Returns:
+        dict: ENABLED, PATH (já resolvido), INTERVAL e MAX_AGE
+    """
+    config = dict(getattr(settings, 'POLDO_SHARED_SNAPSHOT', {}))
+    config.setdefault('ENABLED', False)
+    config['PATH'] = config.get('PATH') or default_path()
+    config.setdefault('INTERVAL', 1.0)
+    config.setdefault('MAX_AGE', 30.0)
+    return config
+
+
+def _align(offset):
+    return (offset + 7) & ~7
+
+
+def read_header(path):
+    """
+    Lê o cabeçalho de um snapshot publicado
+
+    Args:
+        path (str): Caminho do arquivo
+
+    Returns:
+        tuple: (geração, versão dos dados) ou None se não houver snapshot válido
+    """
+    try:
+        with open(path, 'rb') as file:
+            header = file.read(HEADER.size)
+    except FileNotFoundError:
+        return None
+    if len(header) < HEADER.size:
+        return None
+    magic, layout, _, generation, version, _ = HEADER.unpack(header)
+    if magic != MAGIC or layout != LAYOUT:
+        return None
+    return generation, version.rstrip(b'\0').decode('ascii')
+
+
+def publish(path, version, data, history=None, history_snapshots=0):
+    """
+    Publica uma nova geração do snapshot
+
+    Args:
+        path (str): Caminho do arquivo compartilhado
+        version (str): Versão dos dados (hash do HomelabModel, até 16 caracteres)
+        data (dict | list): Dados atuais dos homelabs
+        history (dict): Séries do histórico, {(homelab, métrica): MetricSeries}
+        history_snapshots (int): Snapshots consumidos pelo histórico
+
+    Returns:
+        int: Geração publicada
+    """
+    current = read_header(path)
+    generation = current[0] + 1 if current else 1
+
+    # Posições das colunas relativas ao início da área de colunas, que só
+    # é conhecida depois de serializar os metadados
+    directory, columns, position = [], [], 0
+    for (name, metric), series in sorted((history or {}).items()):
+        count = len(series)
+        directory.append([name, metric, position, count])
+        columns += [series.timestamps, series.values]
+        position += 16 * count
+
+    meta = json.dumps({
+        'data': data,
+        'history_snapshots': history_snapshots,
+        'series': directory,
+    }, ensure_ascii=False, separators=(',', ':')).encode('utf-8')
+    start = _align(HEADER.size + len(meta))
+
+    temporary = f"{path}.{os.getpid()}.tmp"
+    with open(temporary, 'wb') as file:
+        file.write(HEADER.pack(MAGIC, LAYOUT, len(meta), generation, version.encode('ascii')[:16], time.time()))
+        file.write(meta)
+        file.write(b'\0' * (start - HEADER.size - len(meta)))
+        for column in columns:
+            column.tofile(file)
+    os.replace(temporary, path)
+    return generation
+
+
+def touch(path):
+    """
+    Renova o horário da publicação sem trocar a geração
+
+    Grava só o campo do horário no próprio arquivo: os workers que já o
+    mapearam veem o valor novo sem remapear.
+
+    Args:
+        path (str): Caminho do arquivo compartilhado
+
+    Returns:
+        bool: False se não houver snapshot válido para renovar
+    """
+    if read_header(path) is None:
+        return False
+    with open(path, 'r+b') as file:
+        file.seek(PUBLISHED_AT_OFFSET)
+        file.write(PUBLISHED_AT.pack(time.time()))
+    return True
+
+
+class SharedSnapshot:
+    """
+    MODEL - Leitor do snapshot compartilhado (um por processo)
+
+    Remapeia o arquivo quando o publicador troca a geração; entre uma
+    troca e outra, read() devolve sempre a mesma SharedView, enquanto o
+    horário da publicação não passar de max_age segundos.
+    """
+
+    def __init__(self, path, poll_interval=1.0, max_age=30.0):
+        self.path = path
+        self.max_age = max_age
+        self._watcher = FileWatcher(path, poll_interval=poll_interval)
+        self._view = None
+        self._mapped = None
+        self._stale = False
+        self._lock = threading.Lock()
+        self.remaps = 0
+
+    def read(self):
+        """
+        Retorna a geração publicada mais recente
+
+        Returns:
+            SharedView: Dados mapeados, ou None se ainda não há snapshot
+            publicado ou se o publicador parou de renová-lo
+        """
+        view = self._view
+        if view is None or self._watcher.changed():
+            with self._lock:
+                if self._view is view:
+                    self._view = self._map() or self._view
+                view = self._view
+        if view is None or not self._is_stale():
+            return view
+        return None
+
+    def age(self):
+        """
+        Segundos desde a última publicação (ou renovação) da geração mapeada
+
+        Returns:
+            float: Idade do snapshot, ou None se nada foi mapeado
+        """
+        mapped = self._mapped
+        if mapped is None:
+            return None
+        return time.time() - PUBLISHED_AT.unpack_from(mapped, PUBLISHED_AT_OFFSET)[0]
+
+    def _is_stale(self):
+        """Compara a idade com max_age, avisando no log a cada mudança de estado"""
+        age = self.age()
+        stale = age is not None and age > self.max_age
+        if stale != self._stale:
+            self._stale = stale
+            if stale:
+                logger.warning("Snapshot compartilhado %s sem publicação há %.0f s: "
+                               "lendo a origem local (publish_snapshot parou?)", self.path, age)
+            else:
+                logger.info("Snapshot compartilhado %s voltou a ser publicado", self.path)
+        return stale
+
+    def _map(self):
+        try:
+            with open(self.path, 'rb') as file:
+                mapped = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+        except (FileNotFoundError, ValueError):
+            # Sem arquivo ou arquivo vazio
+            return None
+
+        if len(mapped) < HEADER.size:
+            mapped.close()
+            return None
+        magic, layout, meta_length, generation, version, _ = HEADER.unpack_from(mapped)
+        if magic != MAGIC or layout != LAYOUT:
+            mapped.close()
+            return None
+        if self._view is not None and self._view.generation == generation:
+            # Só o horário foi renovado (touch): o mapeamento atual já o enxerga
+            mapped.close()
+            return None
+
+        meta = json.loads(mapped[HEADER.size:HEADER.size + meta_length].decode('utf-8'))
+        start = _align(HEADER.size + meta_length)
+        buffer = memoryview(mapped)
+
+        # Import local: models importa este módulo
+        from .models import MetricSeries
+        series = {}
+        for name, metric, position, count in meta['series']:
+            offset = start + position
+            series[(name, metric)] = MetricSeries.from_buffers(
+                buffer[offset:offset + 8 * count].cast('q'),
+                buffer[offset + 8 * count:offset + 16 * count].cast('d'),
+            )
+
+        self.remaps += 1
+        self._mapped = mapped
+        return SharedView(generation, version.rstrip(b'\0').decode('ascii'), meta['data'],
+                          meta['history_snapshots'], series)
+
+    def stats(self):
+        """
+        Retorna a geração mapeada por este processo
+
+        Returns:
+            dict: Caminho, geração, versão dos dados, idade, se está parado
+            e número de remapeamentos
+        """
+        view = self._view
+        return {
+            'path': self.path,
+            'generation': view.generation if view else None,
+            'version': view.version if view else None,
+            'age': self.age(),
+            'stale': self._stale,
+            'remaps': self.remaps,
+        }
+
+
+_readers = {}
+_readers_lock = threading.Lock()
+
+
+def get_shared_snapshot():
+    """
+    Leitor do processo para o snapshot configurado
+
+    Returns:
+        SharedSnapshot: Leitor compartilhado, ou None se POLDO_SHARED_SNAPSHOT está desligado
+    """
+    config = get_config()
+    if not config['ENABLED']:
+        return None
+    with _readers_lock:
+        reader = _readers.get(config['PATH'])
+        if reader is None:
+            reader = _readers[config['PATH']] = SharedSnapshot(
+                config['PATH'], config['INTERVAL'], config['MAX_AGE'])
+        return reader
@@ -0,0 +1,262 @@
+"""
+Coalescência de chamadas idênticas ao modelo (single-flight)
+
+Quando várias pessoas fazem a mesma pergunta ao mesmo tempo (ex: todo
+mundo abre o Poldo quando um alerta dispara), só a primeira requisição
+("líder") chama o Gemini; as demais ("seguidoras") aguardam o resultado
+dela.
+
+- Threads do mesmo processo: threading.Event por chave
+- Corrotinas do mesmo event loop: asyncio.Future por chave
+- Líder cancelado (cliente desconectou): as seguidoras recebem
+  LeaderCancelled e tentam de novo, e a primeira delas vira a líder
+- Entre processos (opcional): um lock no cache do Django (cache.add); a
+  seguidora espera o líder gravar a resposta no cache de respostas, que
+  precisa então ser compartilhado (POLDO_RESPONSE_CACHE BACKEND 'django')
+"""
+
+import asyncio
+import threading
+import time
+import uuid
+
+from django.core.cache import caches
+
+
+class LeaderCancelled(Exception):
+    """O líder foi cancelado antes de terminar; a seguidora deve tentar de novo"""
+
+
+def _loop_key(key):
+    # Futures só podem ser aguardados no loop que os criou (sob WSGI cada
+    # requisição assíncrona roda no seu próprio loop)
+    return id(asyncio.get_running_loop()), key
+
+
+class _Call:
+    """Chamada em andamento compartilhada entre líder e seguidoras (threads)"""
+
+    __slots__ = ('done', 'result', 'error')
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class SingleFlight:
+    """
+    CONTROLLER - Executa uma única chamada por chave em andamento
+    """
+
+    def __init__(self, cross_process=False, cache_alias='default', lock_timeout=30.0, poll_interval=0.1):
+        self.cross_process = cross_process
+        self.cache_alias = cache_alias
+        self.lock_timeout = lock_timeout
+        self.poll_interval = poll_interval
+        self._calls = {}
+        self._futures = {}
+        self._lock = threading.Lock()
+        self.leaders = 0
+        self.coalesced = 0
+        self.remote_coalesced = 0
+
+    def _count(self, counter):
+        with self._lock:
+            setattr(self, counter, getattr(self, counter) + 1)
+
+    def do(self, key, fn, lookup=None):
+        """
+        Executa fn uma única vez para chamadas simultâneas com a mesma chave
+
+        Args:
+            key (str): Chave da chamada (ex: chave do cache de respostas)
+            fn (callable): Função executada pelo líder
+            lookup (callable, optional): Busca o resultado gravado por um
+                líder de outro processo (usado só com cross_process)
+
+        Returns:
+            Resultado de fn (o mesmo para líder e seguidoras)
+        """
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = _Call()
+                self.leaders += 1
+            else:
+                self.coalesced += 1
+
+        if not leader:
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result
+
+        try:
+            call.result = self._run_across_processes(key, fn, lookup)
+            return call.result
+        except BaseException as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.done.set()
+
+    async def ado(self, key, coro_fn, lookup=None):
+        """
+        Versão assíncrona de do para corrotinas do mesmo event loop
+
+        Args:
+            key (str): Chave da chamada
+            coro_fn (callable): Função que retorna a corrotina do líder
+            lookup (callable, optional): Corrotina que busca o resultado de
+                um líder de outro processo
+
+        Returns:
+            Resultado da corrotina
+        """
+        while True:
+            future = self.follow(key)
+            if future is None:
+                break
+            try:
+                return await future
+            except LeaderCancelled:
+                # O líder desconectou: esta seguidora continua conectada
+                continue
+
+        flight = self.lead(key)
+        try:
+            result = await self._arun_across_processes(key, coro_fn, lookup)
+        except asyncio.CancelledError:
+            # O cancelamento é só do líder: as seguidoras tentam de novo
+            self.finish(key, error=LeaderCancelled("Geração interrompida"), future=flight)
+            raise
+        except BaseException as e:
+            self.finish(key, error=e, future=flight)
+            raise
+        self.finish(key, result, future=flight)
+        return result
+
+    def follow(self, key):
+        """
+        Retorna o Future de uma chamada assíncrona em andamento, se houver
+
+        Args:
+            key (str): Chave da chamada
+
+        Returns:
+            asyncio.Future: Resultado do líder ou None
+        """
+        future = self._futures.get(_loop_key(key))
+        if future is not None:
+            self._count('coalesced')
+            # shield: cancelar uma seguidora não cancela o líder
+            return asyncio.shield(future)
+        return None
+
+    def lead(self, key):
+        """
+        Registra a requisição atual como líder de uma chave
+
+        O líder deve chamar finish ao terminar (útil quando o resultado é
+        produzido aos poucos, como no streaming).
+
+        Args:
+            key (str): Chave da chamada
+
+        Returns:
+            asyncio.Future: Future que receberá o resultado
+        """
+        future = asyncio.get_running_loop().create_future()
+        self._futures[_loop_key(key)] = future
+        self._count('leaders')
+        return future
+
+    def finish(self, key, result=None, error=None, future=None):
+        """
+        Entrega o resultado (ou o erro) do líder às seguidoras
+
+        Args:
+            key (str): Chave da chamada
+            result: Resultado do líder
+            error (BaseException, optional): Erro do líder
+            future (asyncio.Future, optional): Future devolvido por lead; a
+                chave só é removida se ainda for deste líder (outro pode ter
+                assumido a chave depois de um finish anterior)
+        """
+        loop_key = _loop_key(key)
+        if future is None:
+            future = self._futures.pop(loop_key, None)
+        elif self._futures.get(loop_key) is future:
+            del self._futures[loop_key]
+        if future is None or future.done():
+            return
+        if error is not None:
+            future.set_exception(error)
+            # Evita o aviso "exception was never retrieved" sem seguidoras
+            future.exception()
+        else:
+            future.set_result(result)
+
+    def _run_across_processes(self, key, fn, lookup):
+        if not self.cross_process or lookup is None:
+            return fn()
+
+        cache = caches[self.cache_alias]
+        lock_key, token = f"{key}:lock", uuid.uuid4().hex
+        deadline = time.monotonic() + self.lock_timeout
+        while not cache.add(lock_key, token, timeout=self.lock_timeout):
+            # Outro processo lidera: espera a resposta dele aparecer no cache
+            time.sleep(self.poll_interval)
+            result = lookup()
+            if result is not None:
+                self._count('remote_coalesced')
+                return result
+            if time.monotonic() > deadline:
+                return fn()
+        try:
+            return fn()
+        finally:
+            if cache.get(lock_key) == token:
+                cache.delete(lock_key)
+
+    async def _arun_across_processes(self, key, coro_fn, lookup):
+        if not self.cross_process or lookup is None:
+            return await coro_fn()
+
+        cache = caches[self.cache_alias]
+        lock_key, token = f"{key}:lock", uuid.uuid4().hex
+        deadline = time.monotonic() + self.lock_timeout
+        while not await cache.aadd(lock_key, token, timeout=self.lock_timeout):
+            await asyncio.sleep(self.poll_interval)
+            result = await lookup()
+            if result is not None:
+                self._count('remote_coalesced')
+                return result
+            if time.monotonic() > deadline:
+                return await coro_fn()
+        try:
+            return await coro_fn()
+        finally:
+            if await cache.aget(lock_key) == token:
+                await cache.adelete(lock_key)
+
+    def stats(self):
+        """
+        Retorna os contadores de coalescência
+
+        Returns:
+            dict: Líderes, chamadas coalescidas (locais e entre processos) e em andamento
+        """
+        calls = self.leaders + self.coalesced
+        return {
+            'cross_process': self.cross_process,
+            'leaders': self.leaders,
+            'coalesced': self.coalesced,
+            'remote_coalesced': self.remote_coalesced,
+            'in_flight': len(self._calls) + len(self._futures),
+            'coalesced_rate': self.coalesced / calls if calls else 0.0,
+        }
@@ -1,3 +1,1509 @@
-from django.test import TestCase
+import asyncio
+import json
+import os
+import re
+import shutil
+import tempfile
+import threading
+import time
+from datetime import timedelta
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from unittest import mock
 
-# Create your tests here.
+from django.core.cache import cache, caches
+from django.db import DatabaseError, connection
+from django.db.models import QuerySet
+from django.test import SimpleTestCase, TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+
+from . import controller
+from .archive import ERROR_PREFIX, archive_conversations, dedupe_error_replies
+from .chat_agent import LazyChatAgent
+from .controller import ChatController, decode_cursor, encode_cursor
+from .file_watcher import FileWatcher
+from .history import ConversationHistory
+from .history_loader import append_snapshot, is_jsonl, iter_snapshots, snapshot_line, tail_snapshots
+from .ingest import SampleBuffer
+from .intent_router import IntentRouter
+from .jobs import JobQueue, QueueFull
+from .llm_backends import FakeBackend, LLMBackend, OpenAICompatibleBackend
+from .llm_client import CircuitOpenError, OverloadedError, ResilientClient
+from .metrics import MetricsRegistry, metrics
+from .single_flight import SingleFlight
+from .models import (
+    ArchivedConversation, Conversation, HomelabHistoryStore, HomelabModel, Message, MetricSample,
+)
+from .prompt_builder import PromptBuilder, estimate_tokens
+from .response_cache import LRUResponseCache, data_version, make_key, normalize_question
+from .search import ensure_sqlite_triggers, search_backend, search_messages
+from .shared_snapshot import SharedSnapshot, publish, touch
+
+
+class SendMessageTest(TestCase):
+    """Envio pelo caminho assíncrono (/chat/send/): resposta do modelo e mensagens gravadas"""
+
+    async def test_answer_is_saved(self):
+        backend = FakeBackend(latency=0, answer="Tudo certo com os homelabs")
+        client = ResilientClient(backend, rate=0)
+
+        with mock.patch.object(controller.chat_agent, 'client', client), \
+                mock.patch.object(controller.chat_agent, 'response_cache', LRUResponseCache()):
+            response = await self.async_client.post(
+                '/chat/send/', json.dumps({'question': 'Quais homelabs precisam de atenção?'}),
+                content_type='application/json')
+
+        self.assertEqual(response.status_code, 200)
+        data = response.json()
+        self.assertTrue(data['ok'])
+        self.assertIn('Quais homelabs precisam de atenção?', data['user_html'])
+        self.assertIn('Tudo certo com os homelabs', data['bot_html'])
+        self.assertEqual(backend.calls, 1)
+
+        messages = [m async for m in Message.objects.filter(
+            conversation_id=data['conversation_id']).order_by('id').values_list('role', 'text')]
+        self.assertEqual(messages, [('user', 'Quais homelabs precisam de atenção?'),
+                                    ('bot', 'Tudo certo com os homelabs')])
+        conversation = await Conversation.objects.aget(id=data['conversation_id'])
+        self.assertEqual(conversation.title, 'Quais homelabs precisam de atenção?')
+
+
+class StreamMessageTest(TestCase):
+    """Resposta em streaming (SSE): evento start, um evento por trecho e done"""
+
+    async def stream(self, data):
+        async def astream_question(question, conversation_id=None):
+            for chunk in ('Tudo ', 'certo', ' ✅'):
+                yield chunk
+
+        with mock.patch.object(controller.chat_agent, 'astream_question', astream_question):
+            response = await self.async_client.post('/chat/stream/', json.dumps(data),
+                                                    content_type='application/json')
+            self.assertEqual(response['Content-Type'], 'text/event-stream')
+            body = ''.join([chunk.decode('utf-8') async for chunk in response.streaming_content])
+
+        events = []
+        for block in body.split('\n\n')[:-1]:
+            fields = dict(line.split(': ', 1) for line in block.split('\n'))
+            events.append((fields.get('event'), json.loads(fields['data'])))
+        return events
+
+    async def test_event_sequence(self):
+        events = await self.stream({'question': 'status do homelab-dev?'})
+
+        self.assertEqual([name for name, _ in events], ['start', None, None, None, 'done'])
+        start, done = events[0][1], events[-1][1]
+        self.assertIn('status do homelab-dev?', start['user_html'])
+        self.assertEqual([data['text'] for _, data in events[1:-1]], ['Tudo ', 'certo', ' ✅'])
+        self.assertEqual(done['conversation_id'], start['conversation_id'])
+
+        # Pergunta e resposta gravadas juntas, só no fim
+        messages = [m async for m in Message.objects.filter(
+            conversation_id=start['conversation_id']).order_by('id').values_list('role', 'text')]
+        self.assertEqual(messages, [('user', 'status do homelab-dev?'), ('bot', 'Tudo certo ✅')])
+
+        events = await self.stream({'question': 'e o prod?', 'conversation_id': start['conversation_id']})
+        self.assertEqual(events[0][1]['conversation_id'], start['conversation_id'])
+        self.assertEqual(await Message.objects.filter(conversation_id=start['conversation_id']).acount(), 4)
+
+    async def test_invalid_requests(self):
+        response = await self.async_client.post('/chat/stream/', 'não é json', content_type='application/json')
+        self.assertEqual(response.status_code, 400)
+        response = await self.async_client.post('/chat/stream/', json.dumps({'question': '  '}),
+                                                content_type='application/json')
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(await Message.objects.acount(), 0)
+
+
+class ResponseCacheTest(SimpleTestCase):
+    """Cache de respostas: chave pela pergunta normalizada, histórico e versão dos dados"""
+
+    def test_key(self):
+        key = make_key('Qual a CPU do homelab-dev?', 'v1')
+        self.assertEqual(make_key('  qual a cpu   do Homelab-Dev', 'v1'), key)
+        self.assertEqual(normalize_question('Memória do homelab-prod?!'), 'memoria do homelab-prod')
+        self.assertNotEqual(make_key('Qual a CPU do homelab-prod?', 'v1'), key)
+        self.assertNotEqual(make_key('Qual a CPU do homelab-dev?', 'v2'), key)
+        self.assertNotEqual(make_key('Qual a CPU do homelab-dev?', 'v1', 'Usuário: e a ram?'), key)
+        self.assertEqual(data_version({'b': 1, 'a': 2}), data_version({'a': 2, 'b': 1}))
+
+    def test_lru_expires_and_evicts(self):
+        response_cache = LRUResponseCache(max_entries=2, ttl=60)
+        for key in ('a', 'b'):
+            response_cache.set(key, key.upper())
+        self.assertEqual(response_cache.get('a'), 'A')
+        response_cache.set('c', 'C')
+        self.assertIsNone(response_cache.get('b'))
+        self.assertEqual(response_cache.get('c'), 'C')
+
+        with mock.patch('agent.response_cache.time.monotonic', return_value=time.monotonic() + 61):
+            self.assertIsNone(response_cache.get('a'))
+        stats = response_cache.stats()
+        self.assertEqual((stats['hits'], stats['misses'], stats['evictions'], stats['size']), (2, 2, 2, 1))
+
+    def test_data_change_invalidates_answers(self):
+        agent = controller.chat_agent
+        backend = FlakyBackend()
+        version, data = agent.homelab_model.get_versioned_data()
+
+        with mock.patch.object(agent, 'client', ResilientClient(backend, rate=0)), \
+                mock.patch.object(agent, 'response_cache', LRUResponseCache()):
+            agent.process_question('Quais homelabs precisam de atenção?')
+            agent.process_question('quais homelabs precisam de atencao')
+            self.assertEqual(backend.calls, 1)
+
+            with mock.patch.object(agent.homelab_model, 'get_versioned_data', return_value=('outra', data)):
+                self.assertEqual(agent.process_question('Quais homelabs precisam de atenção?'), 'ok')
+            self.assertEqual(backend.calls, 2)
+
+
+class IntentRouterTest(SimpleTestCase):
+    """Caminho rápido: só consultas simples ao snapshot atual são respondidas sem o modelo"""
+
+    def setUp(self):
+        handle, path = tempfile.mkstemp(suffix='.json')
+        with os.fdopen(handle, 'w') as f:
+            json.dump({
+                'homelab-dev': {'cpu': '52%', 'portas': ['80', '22'], 'status': 'online'},
+                'homelab-prod': {'cpu': '15%', 'status': 'offline'},
+            }, f)
+        self.addCleanup(os.remove, path)
+        self.router = IntentRouter(HomelabModel(path, source='file'))
+
+    def test_simple_lookups(self):
+        self.assertEqual(self.router.route('Qual a CPU do homelab-dev?'),
+                         ('metric', '🔍 homelab-dev - CPU: 52%'))
+        self.assertEqual(self.router.route('portas abertas no homelab-dev'),
+                         ('metric', '🔍 homelab-dev - Portas: 80, 22'))
+        route, answer = self.router.route('status do homelab-prod')
+        self.assertEqual(route, 'status')
+        self.assertIn('• Status: offline', answer)
+
+    def test_falls_through_to_llm(self):
+        for question in [
+            'qual era a cpu do homelab-dev ontem?',
+            'cpu do homelab-dev na semana passada',
+            'compare a cpu do homelab-dev com o homelab-prod',
+            'qual a média de cpu do homelab-dev',
+            'cpu e ram do homelab-dev',
+            'cpu do homelab-qa',
+            'qual a cpu?',
+            'portas do homelab-prod',
+            'me explique em detalhes com calma qual é a cpu atual do homelab-dev',
+        ]:
+            with self.subTest(question=question):
+                self.assertIsNone(self.router.route(question))
+
+    def test_stats(self):
+        self.router.record('metric', 0.001)
+        self.router.record('llm', 0.5)
+        stats = self.router.stats()
+        self.assertEqual((stats['total'], stats['fast_path_hits'], stats['fast_path_hit_rate']), (2, 1, 0.5))
+        self.assertEqual(stats['routes']['llm']['max_ms'], 500.0)
+
+
+class PromptBuilderTest(SimpleTestCase):
+    """Seção de dados do prompt: só o que a pergunta cita, dentro do orçamento de tokens"""
+
+    SNAPSHOTS = [
+        {'timestamp': f'2025-09-27 {hour:02d}:00:00',
+         'homelab-dev': {'cpu': f'{hour}%', 'ram': '8GB', 'portas': ['80', '22'], 'status': 'online'},
+         'homelab-prod': {'cpu': f'{hour + 1}%', 'ram': '4GB', 'status': 'online'}}
+        for hour in range(24)
+    ]
+
+    def test_selects_cited_hosts_and_metrics(self):
+        builder = PromptBuilder(self.SNAPSHOTS[-1:])
+        self.assertEqual(builder.select('Qual o processador do homelab-dev?'), (['homelab-dev'], ['cpu']))
+        self.assertEqual(builder.select('status do homelab-prod'), (['homelab-prod'], builder.metrics))
+        self.assertEqual(builder.select('como estão as coisas?'), (builder.hosts, builder.metrics))
+
+        self.assertEqual(builder.build_data_section('cpu e portas do homelab-dev'),
+                         'timestamp,homelab,cpu,portas\n2025-09-27 23:00:00,homelab-dev,23%,80 22\n')
+
+    def test_budget_keeps_most_recent_snapshots(self):
+        full = PromptBuilder(self.SNAPSHOTS, token_budget=10 ** 6).build_data_section('cpu')
+        self.assertEqual(full.count('\n'), 1 + 2 * 24)
+
+        builder = PromptBuilder(self.SNAPSHOTS, token_budget=60)
+        section = builder.build_data_section('cpu')
+        lines = section.splitlines()
+        self.assertLessEqual(estimate_tokens(section), 60)
+        self.assertLess(len(lines), 1 + 2 * 24)
+        self.assertEqual(lines[0], 'timestamp,homelab,cpu')
+        self.assertEqual(lines[-2:], ['2025-09-27 23:00:00,homelab-dev,23%', '2025-09-27 23:00:00,homelab-prod,24%'])
+        self.assertEqual(len(lines) % 2, 1, 'snapshots entram inteiros')
+
+        # O snapshot mais recente entra mesmo acima do orçamento
+        section = PromptBuilder(self.SNAPSHOTS, token_budget=1).build_data_section('cpu')
+        self.assertEqual(section.splitlines()[1:], lines[-2:])
+
+
+class HistoryStoreTest(SimpleTestCase):
+    """Consultas do histórico por intervalo, reamostragem e agregados"""
+
+    def setUp(self):
+        self.store = HomelabHistoryStore(os.path.join(tempfile.gettempdir(), 'inexistente.json'), shared=False)
+        # Um ponto por minuto a partir de 1200 (múltiplo de 300): cpu 1%..20%
+        for i in range(20):
+            self.store.append({'timestamp': 1200 + 60 * i, 'homelab-dev': {'cpu': f'{i + 1}%'}})
+
+    def test_between_boundaries(self):
+        self.assertEqual(self.store.between('homelab-dev', 'cpu', 1260, 1380),
+                         [(1260, 2.0), (1320, 3.0), (1380, 4.0)])
+        self.assertEqual(self.store.between('homelab-dev', 'cpu', 1261, 1379), [(1320, 3.0)])
+        self.assertEqual(self.store.between('homelab-dev', 'cpu', t1=1259), [(1200, 1.0)])
+        self.assertEqual(len(self.store.between('homelab-dev', 'cpu', t0=2340)), 1)
+        self.assertEqual(self.store.between('homelab-dev', 'cpu', 1261, 1319), [])
+        self.assertEqual(self.store.between('homelab-dev', 'ram'), [])
+
+    def test_resample_buckets(self):
+        self.assertEqual(self.store.resample('homelab-dev', 'cpu', 300, how='count'),
+                         [(1200, 5), (1500, 5), (1800, 5), (2100, 5)])
+        # O ponto em 1500 abre a segunda janela
+        self.assertEqual(self.store.resample('homelab-dev', 'cpu', 300, how='max'),
+                         [(1200, 5.0), (1500, 10.0), (1800, 15.0), (2100, 20.0)])
+        self.assertEqual(self.store.resample('homelab-dev', 'cpu', 300, how='min', t0=1440, t1=1560),
+                         [(1200, 5.0), (1500, 6.0)])
+        self.assertEqual(self.store.resample('homelab-dev', 'cpu', 600, how='avg'),
+                         [(1200, 5.5), (1800, 15.5)])
+
+    def test_aggregate(self):
+        self.assertEqual(self.store.aggregate('homelab-dev', 'cpu'),
+                         {'count': 20, 'min': 1.0, 'max': 20.0, 'avg': 10.5, 'p95': 19.0})
+        # nearest-rank: posição ceil(0.95 * n)
+        self.assertEqual(self.store.aggregate('homelab-dev', 'cpu', t1=1200 + 60 * 9)['p95'], 10.0)
+        self.assertEqual(self.store.aggregate('homelab-dev', 'cpu', 1200, 1200)['p95'], 1.0)
+        self.assertEqual(self.store.aggregate('homelab-dev', 'cpu', 0, 100),
+                         {'count': 0, 'min': None, 'max': None, 'avg': None, 'p95': None})
+
+
+@override_settings(POLDO_DATA_WATCH={'INTERVAL': 0})
+class HotReloadTest(SimpleTestCase):
+    """homelabs.json trocado em disco: dados, contexto e caminho rápido seguem a versão nova"""
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory)
+        self.path = os.path.join(self.directory, 'homelabs.json')
+        self.replace({'homelab-x': {'cpu': '10%', 'status': 'online'}})
+
+    def replace(self, data):
+        """Grava como o coletor: arquivo temporário trocado com os.replace"""
+        temporary = f"{self.path}.tmp"
+        with open(temporary, 'w', encoding='utf-8') as file:
+            file.write(data if isinstance(data, str) else json.dumps(data))
+        os.replace(temporary, self.path)
+
+    def test_watcher_detects_replace(self):
+        watcher = FileWatcher(self.path, poll_interval=0)
+        self.assertFalse(watcher.changed())
+        self.replace({'homelab-x': {'cpu': '20%'}})
+        self.assertTrue(watcher.changed())
+        self.assertFalse(watcher.changed())
+
+    def test_model_reloads_only_new_content(self):
+        model = HomelabModel(self.path, source='file', shared=False)
+        snapshot = model.get_versioned_data()
+
+        # Mesmo conteúdo regravado: nem a versão nem o objeto mudam
+        self.replace({'homelab-x': {'cpu': '10%', 'status': 'online'}})
+        self.assertIs(model.get_versioned_data(), snapshot)
+
+        self.replace({'homelab-x': {'cpu': '20%', 'status': 'online'}})
+        version, data = model.get_versioned_data()
+        self.assertNotEqual(version, snapshot[0])
+        self.assertEqual(data['homelab-x']['cpu'], '20%')
+
+        # JSON inválido (escrita pela metade): mantém os dados anteriores
+        self.replace('{"homelab-x": {"cpu": ')
+        self.assertEqual(model.get_versioned_data(), (version, data))
+
+    def test_agent_serves_new_version(self):
+        agent = controller.chat_agent
+        model = HomelabModel(self.path, source='file', shared=False)
+
+        with mock.patch.object(agent, 'homelab_model', model), \
+                mock.patch.object(agent.intent_router, 'homelab_model', model):
+            context = agent.get_context()
+            self.assertIs(agent.get_context(), context)
+            self.assertEqual(agent.process_question('qual a cpu do homelab-x?'), '🔍 homelab-x - CPU: 10%')
+
+            self.replace({'homelab-x': {'cpu': '35%', 'status': 'online'}})
+            new_context = agent.get_context()
+            self.assertNotEqual(new_context.version, context.version)
+            self.assertIn('35%', new_context.prompt_builder.build_data_section('cpu'))
+            self.assertEqual(agent.process_question('qual a cpu do homelab-x?'), '🔍 homelab-x - CPU: 35%')
+
+
+class HistoryLoaderTest(SimpleTestCase):
+    """Leitura incremental do histórico: JSON em blocos e JSON Lines a partir de um offset"""
+
+    SNAPSHOTS = [
+        {'timestamp': f'2025-09-27 {hour:02d}:00:00', 'homelab-dev': {'cpu': f'{hour}%'}}
+        for hour in range(5)
+    ]
+
+    def setUp(self):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        self.directory = directory
+
+    def write(self, name, content):
+        path = os.path.join(self.directory, name)
+        with open(path, 'w', encoding='utf-8') as file:
+            file.write(content)
+        return path
+
+    def test_json_array_in_small_chunks(self):
+        path = self.write('history.json', json.dumps(self.SNAPSHOTS, indent=2))
+        self.assertFalse(is_jsonl(path))
+        self.assertEqual(list(iter_snapshots(path, chunk_size=7)), self.SNAPSHOTS)
+
+        truncated = self.write('truncated.json', json.dumps(self.SNAPSHOTS)[:-40])
+        with self.assertRaises(ValueError):
+            list(iter_snapshots(truncated, chunk_size=7))
+
+    def test_tail_skips_partial_line(self):
+        complete = ''.join(snapshot_line(snapshot) for snapshot in self.SNAPSHOTS[:3])
+        path = self.write('history.jsonl', complete + '\n' + snapshot_line(self.SNAPSHOTS[3])[:15])
+
+        read = list(tail_snapshots(path))
+        self.assertEqual([snapshot for snapshot, _ in read], self.SNAPSHOTS[:3])
+        offset = read[-1][1]
+        self.assertEqual(offset, len(complete.encode('utf-8')))
+
+        # O coletor termina a linha e acrescenta outra
+        with open(path, 'a', encoding='utf-8') as file:
+            file.write(snapshot_line(self.SNAPSHOTS[3])[15:])
+        append_snapshot(path, self.SNAPSHOTS[4])
+        self.assertEqual([snapshot for snapshot, _ in tail_snapshots(path, offset)], self.SNAPSHOTS[3:])
+
+    def test_malformed_line_is_skipped(self):
+        path = self.write('history.jsonl', snapshot_line(self.SNAPSHOTS[0]) + '{"timestamp": \n' + '[1, 2]\n')
+        with self.assertLogs('agent.history_loader', 'WARNING') as logs:
+            read = list(tail_snapshots(path))
+        self.assertEqual(len(logs.output), 2)
+        self.assertEqual([snapshot for snapshot, _ in read], [self.SNAPSHOTS[0], None, None])
+        self.assertEqual(read[-1][1], os.path.getsize(path))
+        with self.assertLogs('agent.history_loader', 'WARNING'):
+            self.assertEqual(list(iter_snapshots(path)), self.SNAPSHOTS[:1])
+
+        store = HomelabHistoryStore(path, shared=False)
+        with self.assertLogs('agent.history_loader', 'WARNING'):
+            self.assertEqual(store.snapshot_count, 0)
+            store.refresh()
+        self.assertEqual(store.snapshot_count, 1)
+
+        # As linhas inválidas não são relidas
+        append_snapshot(path, self.SNAPSHOTS[1])
+        with self.assertNoLogs('agent.history_loader', 'WARNING'):
+            self.assertEqual(store.refresh(), 1)
+        self.assertEqual([value for _, value in store.latest('homelab-dev', 'cpu', n=5)], [0.0, 1.0])
+
+    def test_store_refresh_consumes_only_new_lines(self):
+        path = self.write('history.jsonl', ''.join(snapshot_line(s) for s in self.SNAPSHOTS[:2]))
+        store = HomelabHistoryStore(path, shared=False)
+        self.assertEqual(store.latest('homelab-dev', 'cpu', n=5)[-1][1], 1.0)
+        self.assertEqual(store.refresh(), 0)
+
+        with open(path, 'a', encoding='utf-8') as file:
+            file.write(snapshot_line(self.SNAPSHOTS[2]) + snapshot_line(self.SNAPSHOTS[3])[:10])
+        self.assertEqual(store.refresh(), 1)
+        self.assertEqual(store.snapshot_count, 3)
+        self.assertEqual([value for _, value in store.latest('homelab-dev', 'cpu', n=5)], [0.0, 1.0, 2.0])
+
+
+@override_settings(POLDO_INGEST={'TOKEN': 'segredo'})
+class IngestTest(TestCase):
+    """Ingestão de snapshots: validação, autenticação e gravação em lote"""
+
+    def setUp(self):
+        self.buffer = SampleBuffer(max_size=1000, max_age=60)
+        patcher = mock.patch.object(controller, 'sample_buffer', self.buffer)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.addCleanup(self.buffer.close)
+
+    def post(self, data, token='segredo'):
+        headers = {'HTTP_AUTHORIZATION': f'Bearer {token}'} if token else {}
+        return self.client.post('/ingest/', json.dumps(data), content_type='application/json', **headers)
+
+    def test_accepts_snapshots(self):
+        response = self.post([
+            {'timestamp': '2025-01-01T12:00:00', 'homelab-dev': {'cpu': '45%', 'ports': [22, 80]}},
+            {'homelab-prod': {'cpu': '80%'}},
+        ])
+
+        self.assertEqual(response.status_code, 202)
+        self.assertEqual(response.json()['samples'], 3)
+        self.assertEqual(self.buffer.flush(), 3)
+        sample = MetricSample.objects.get(host__name='homelab-dev', metric='cpu')
+        self.assertEqual((sample.value, sample.raw), (45.0, '45%'))
+
+    def test_payload_formats(self):
+        snapshot = {'homelab-dev': {'cpu': '45%', 'ram': '8GB'}}
+        self.assertEqual(self.post(snapshot).json()['samples'], 2)
+        self.assertEqual(self.post({'snapshots': [snapshot, snapshot]}).json()['samples'], 4)
+        self.assertEqual(self.buffer.stats()['pending'], 6)
+
+        response = self.client.post('/ingest/', '{"homelab-dev":', content_type='application/json',
+                                    HTTP_AUTHORIZATION='Bearer segredo')
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(self.post({'snapshots': [snapshot, 'texto']}).status_code, 400)
+
+    def test_rejects_invalid_payloads(self):
+        invalid = [
+            {'timestamp': 1700000000, 'homelab-dev': {'cpu': '45%'}},
+            {'timestamp': 'ontem', 'homelab-dev': {'cpu': '45%'}},
+            {'h' * 101: {'cpu': '45%'}},
+            {'homelab-dev': {'m' * 51: 1}},
+        ]
+        for snapshot in invalid:
+            with self.subTest(snapshot=str(snapshot)[:40]):
+                self.assertEqual(self.post([snapshot]).status_code, 400)
+        self.assertEqual(self.post('não é lista').status_code, 400)
+        self.assertEqual(self.buffer.stats()['pending'], 0)
+
+    def test_requires_token(self):
+        self.assertEqual(self.post({'homelab-dev': {'cpu': 1}}, token='errado').status_code, 401)
+        self.assertEqual(self.post({'homelab-dev': {'cpu': 1}}, token=None).status_code, 401)
+        with override_settings(POLDO_INGEST={}):
+            self.assertEqual(self.post({'homelab-dev': {'cpu': 1}}, token=None).status_code, 403)
+        with override_settings(POLDO_INGEST={'ALLOW_ANONYMOUS': True}):
+            self.assertEqual(self.post({'homelab-dev': {'cpu': 1}}, token=None).status_code, 202)
+
+    def test_failed_flush_keeps_samples(self):
+        self.buffer.add_snapshots([{'homelab-dev': {'cpu': '45%', 'ram': '8GB'}}])
+
+        with mock.patch.object(MetricSample.objects, 'bulk_create', side_effect=DatabaseError('banco fora')):
+            with self.assertRaises(DatabaseError):
+                self.buffer.flush()
+        self.assertEqual(self.buffer.stats()['pending'], 2)
+
+        self.assertEqual(self.buffer.flush(), 2)
+        self.assertEqual(MetricSample.objects.count(), 2)
+
+    def test_null_value_is_rejected(self):
+        response = self.post([{'homelab-x': {'cpu': None, 'ram': '8GB'}}])
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('null', response.json()['error'])
+        self.assertEqual(self.buffer.stats()['pending'], 0)
+
+    def test_rows_refused_by_database_are_dropped(self):
+        # Linha que passaria da validação mas o banco recusa (raw NOT NULL)
+        buffer = SampleBuffer(max_size=1000, max_age=60, batch_size=2)
+        self.addCleanup(buffer.close)
+        buffer.add_snapshots([{'timestamp': '2025-01-01T12:00:00', 'homelab-dev': {'cpu': '45%', 'ram': '8GB'},
+                               'homelab-prod': {'cpu': '80%'}}])
+        buffer._rows.insert(1, ('homelab-dev', 'memoria', None, None, timezone.now()))
+
+        with self.assertLogs('agent.ingest', 'ERROR'):
+            self.assertEqual(buffer.flush(), 3)
+        stats = buffer.stats()
+        self.assertEqual((stats['pending'], stats['rejected'], stats['failed_flushes']), (0, 1, 0))
+        self.assertEqual(MetricSample.latest_snapshot(),
+                         {'homelab-dev': {'cpu': '45%', 'ram': '8GB'}, 'homelab-prod': {'cpu': '80%'}})
+
+        # As próximas gravações seguem normalmente
+        buffer.add_snapshots([{'homelab-dev': {'cpu': '50%'}}])
+        self.assertEqual(buffer.flush(), 1)
+
+    def test_latest_snapshot_uses_host_index(self):
+        self.buffer.add_snapshots([
+            {'timestamp': '2025-01-01T12:00:00', 'homelab-dev': {'cpu': '45%'}, 'homelab-prod': {'cpu': '80%'}},
+            {'timestamp': '2025-01-01T12:05:00', 'homelab-dev': {'cpu': '50%'}},
+        ])
+        self.buffer.flush()
+
+        # Hosts + amostras dos últimos momentos (um lote)
+        with self.assertNumQueries(2), CaptureQueriesContext(connection) as queries:
+            snapshot = MetricSample.latest_snapshot()
+        self.assertEqual(snapshot, {'homelab-dev': {'cpu': '50%'}, 'homelab-prod': {'cpu': '80%'}})
+
+        with connection.cursor() as cursor:
+            cursor.execute(f"EXPLAIN QUERY PLAN {queries[-1]['sql']}")
+            plan = ' '.join(str(row[-1]) for row in cursor.fetchall())
+        self.assertIn('agent_sample_host_time_idx', plan)
+        self.assertNotIn('SCAN agent_metricsample', plan)
+
+
+class KeysetPaginationTest(TestCase):
+    """Paginação por cursor (created_at, id) da barra lateral e do histórico"""
+
+    def setUp(self):
+        now = timezone.now().replace(microsecond=123456)
+        conversations = Conversation.objects.bulk_create([Conversation(title=f"c{i}") for i in range(5)])
+        # Duas conversas no mesmo instante: o id desempata
+        for conversation, minutes in zip(conversations, [3, 2, 2, 1, 0]):
+            Conversation.objects.filter(id=conversation.id).update(created_at=now - timedelta(minutes=minutes))
+        self.conversation = conversations[0]
+        Message.objects.bulk_create([
+            Message(conversation=self.conversation, role='user' if i % 2 == 0 else 'bot', text=f"m{i}")
+            for i in range(5)
+        ])
+        Message.objects.filter(conversation=self.conversation).update(created_at=now)
+
+    def test_cursor_round_trip(self):
+        created_at = timezone.now()
+        self.assertEqual(decode_cursor(encode_cursor(created_at, 42)), (created_at, 42))
+        for cursor in ('abc', '1_2_3', 'x_1'):
+            with self.subTest(cursor=cursor), self.assertRaises(ValueError):
+                decode_cursor(cursor)
+
+    def test_pages_cover_every_row_once(self):
+        titles, cursor = [], None
+        while True:
+            page, cursor = ChatController.get_conversation_page(cursor, limit=2)
+            titles += [conversation.title for conversation in page]
+            if cursor is None:
+                break
+        self.assertEqual(titles, ['c4', 'c3', 'c2', 'c1', 'c0'])
+
+        page, cursor = ChatController.get_conversation_page(limit=5)
+        self.assertEqual((len(page), cursor), (5, None))
+
+        messages, cursor = ChatController.get_message_page(self.conversation.id, limit=3)
+        self.assertEqual([m['text'] for m in messages], ['m2', 'm3', 'm4'])
+        messages, cursor = ChatController.get_message_page(self.conversation.id, cursor, limit=3)
+        self.assertEqual(([m['text'] for m in messages], cursor), (['m0', 'm1'], None))
+
+    def test_page_endpoints(self):
+        data = self.client.get('/conversations/').json()
+        self.assertTrue(data['ok'])
+        self.assertIsNone(data['next_cursor'])
+        self.assertIn('c4', data['html'])
+
+        _, cursor = ChatController.get_message_page(self.conversation.id, limit=4)
+        data = self.client.get(f'/chat/{self.conversation.id}/messages/', {'cursor': cursor}).json()
+        self.assertIn('m0', data['html'])
+        self.assertNotIn('m1', data['html'])
+
+        self.assertEqual(self.client.get('/conversations/', {'cursor': 'abc'}).status_code, 400)
+        self.assertEqual(self.client.get(f'/chat/{self.conversation.id}/messages/',
+                                         {'cursor': '1_x'}).status_code, 400)
+
+
+@mock.patch.object(controller.chat_agent, 'process_question', return_value='resposta')
+class ProcessMessageQueriesTest(TestCase):
+    """
+    Número de consultas por mensagem enviada
+
+    Dentro de um TestCase cada transaction.atomic vira um savepoint, que
+    conta como duas consultas (SAVEPOINT e RELEASE SAVEPOINT).
+    """
+
+    def test_new_conversation(self, process_question):
+        # savepoint + INSERT conversa + bulk_create das mensagens + release
+        with self.assertNumQueries(4):
+            result = ChatController.process_message('qual a cpu do homelab-dev?')
+
+        conversation = Conversation.objects.get(id=result['conversation_id'])
+        self.assertEqual(conversation.title, 'qual a cpu do homelab-dev?')
+        self.assertTrue(conversation.has_user_message)
+        self.assertEqual(
+            list(conversation.messages.order_by('id').values_list('role', 'text')),
+            [('user', 'qual a cpu do homelab-dev?'), ('bot', 'resposta')]
+        )
+
+    def test_first_message_sets_title(self, process_question):
+        conversation = Conversation.objects.create(title="Nova Conversa")
+        question = 'compare a memória de todos os homelabs da rede'
+
+        # SELECT conversa + savepoint + UPDATE título + bulk_create + release
+        with self.assertNumQueries(5):
+            ChatController.process_message(question, conversation.id)
+
+        conversation.refresh_from_db()
+        self.assertEqual(conversation.title, question[:40] + "...")
+        self.assertTrue(conversation.has_user_message)
+        self.assertEqual(conversation.messages.count(), 2)
+
+    def test_follow_up_keeps_title(self, process_question):
+        conversation = Conversation.objects.create(title="Primeira pergunta", has_user_message=True)
+
+        # SELECT conversa + savepoint + bulk_create + release
+        with self.assertNumQueries(4):
+            ChatController.process_message('e a ram?', conversation.id)
+
+        conversation.refresh_from_db()
+        self.assertEqual(conversation.title, "Primeira pergunta")
+        self.assertEqual(Message.objects.filter(conversation=conversation).count(), 2)
+
+
+class SQLitePragmasTest(TestCase):
+    """PRAGMAs de POLDO_SQLITE_PRAGMAS aplicados pelo sinal connection_created"""
+
+    def test_connection_is_tuned(self):
+        if connection.vendor != 'sqlite':
+            self.skipTest('apenas SQLite')
+        with connection.cursor() as cursor:
+            cursor.execute('PRAGMA busy_timeout')
+            self.assertEqual(cursor.fetchone()[0], 5000)
+            cursor.execute('PRAGMA synchronous')
+            self.assertEqual(cursor.fetchone()[0], 1)  # NORMAL
+
+
+class ArchiveTest(TestCase):
+    """Arquivamento, compactação de erros repetidos e reabertura"""
+
+    def setUp(self):
+        old = timezone.now() - timedelta(days=200)
+        self.error = f"{ERROR_PREFIX}: 429 quota\n\nPor favor, tente novamente."
+        self.old = Conversation.objects.create(title="antiga", has_user_message=True, created_at=old)
+        texts = [('user', 'qual a cpu?'), ('bot', self.error)] * 3 + [('user', 'e a ram?'), ('bot', '💾 40%')]
+        Message.objects.bulk_create([
+            Message(conversation=self.old, role=role, text=text, created_at=old + timedelta(seconds=i))
+            for i, (role, text) in enumerate(texts)
+        ])
+        self.recent = Conversation.objects.create(title="recente")
+        Message.objects.create(conversation=self.recent, role='user', text='oi')
+
+    def test_dedupe_keeps_first_failed_attempt(self):
+        self.assertEqual(dedupe_error_replies(), 4)
+        self.assertEqual(
+            list(self.old.messages.order_by('created_at').values_list('text', flat=True)),
+            ['qual a cpu?', self.error, 'e a ram?', '💾 40%']
+        )
+
+    def test_archive_and_reopen(self):
+        result = archive_conversations(timezone.now() - timedelta(days=90))
+
+        self.assertEqual(result, {'conversations': 1, 'messages': 8})
+        self.assertFalse(Conversation.objects.filter(id=self.old.id).exists())
+        self.assertFalse(Message.objects.filter(conversation_id=self.old.id).exists())
+        conversations, _ = ChatController.get_conversation_page()
+        self.assertEqual([c.id for c in conversations], [self.recent.id])
+
+        restored = ChatController.get_or_create_conversation(self.old.id)
+
+        self.assertEqual(restored.id, self.old.id)
+        self.assertEqual(restored.created_at, self.old.created_at)
+        self.assertEqual(restored.messages.count(), 8)
+        self.assertFalse(ArchivedConversation.objects.exists())
+
+    def test_message_added_before_lock_keeps_conversation(self):
+        select_for_update = QuerySet.select_for_update
+
+        def reply_then_lock(queryset, *args, **kwargs):
+            # Mensagem gravada entre a seleção das candidatas e a trava
+            Message.objects.create(conversation=self.old, role='user', text='ainda aqui?')
+            return select_for_update(queryset, *args, **kwargs)
+
+        with mock.patch.object(QuerySet, 'select_for_update', reply_then_lock):
+            result = archive_conversations(timezone.now() - timedelta(days=90))
+
+        self.assertEqual(result, {'conversations': 0, 'messages': 0})
+        self.assertEqual(self.old.messages.count(), 9)
+        self.assertFalse(ArchivedConversation.objects.exists())
+
+
+class ConversationHistoryTest(TestCase):
+    """Janela de trocas recentes e resumo acumulado das anteriores"""
+
+    def setUp(self):
+        self.conversation = Conversation.objects.create(title="longa", has_user_message=True)
+        self.history = ConversationHistory(max_turns=3, token_budget=600, summary_token_budget=200)
+        self.add_turns(range(10))
+
+    def add_turns(self, numbers):
+        Message.objects.bulk_create([
+            Message(conversation=self.conversation, role=role, text=text)
+            for n in numbers
+            for role, text in (('user', f'pergunta {n}'), ('bot', f'resposta {n}\ndetalhes'))
+        ])
+
+    def test_window_and_summary(self):
+        text = self.history.build(self.conversation.id)
+
+        self.assertIn("Usuário: pergunta 7\nPoldo: resposta 7", text)
+        self.assertNotIn("Usuário: pergunta 6\n", text)
+        self.assertIn("- Usuário: pergunta 0 → Poldo: resposta 0", text)
+        self.assertIn("- Usuário: pergunta 6 → Poldo: resposta 6", text)
+        self.conversation.refresh_from_db()
+        self.assertEqual(self.conversation.summary.count('\n'), 6)
+
+    def test_summary_is_incremental(self):
+        self.history.build(self.conversation.id)
+        self.add_turns([10])
+
+        # Uma consulta para a janela e um UPDATE para dobrar a troca que saiu dela
+        with self.assertNumQueries(2):
+            text = self.history.build(self.conversation.id)
+        self.assertIn("- Usuário: pergunta 7 → Poldo: resposta 7", text)
+        self.assertIn("Usuário: pergunta 10", text)
+
+        with self.assertNumQueries(1):
+            self.assertEqual(self.history.build(self.conversation.id), text)
+
+
+class SingleFlightTest(SimpleTestCase):
+    """Perguntas idênticas simultâneas compartilham uma única chamada"""
+
+    def test_threads_share_one_call(self):
+        flight = SingleFlight()
+        calls = []
+        barrier = threading.Barrier(8)
+
+        def slow_call():
+            calls.append(1)
+            time.sleep(0.2)
+            return 'resposta'
+
+        def ask(results):
+            barrier.wait()
+            results.append(flight.do('status do homelab-prod', slow_call))
+
+        results = []
+        threads = [threading.Thread(target=ask, args=(results,)) for _ in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(len(calls), 1)
+        self.assertEqual(results, ['resposta'] * 8)
+        self.assertEqual(flight.stats()['coalesced'], 7)
+
+    def test_coroutines_share_one_call_and_errors(self):
+        flight = SingleFlight()
+        calls = []
+
+        async def failing_call():
+            calls.append(1)
+            await asyncio.sleep(0.05)
+            raise TimeoutError('modelo lento')
+
+        async def run():
+            return await asyncio.gather(
+                *(flight.ado('status', failing_call) for _ in range(5)), return_exceptions=True
+            )
+
+        results = asyncio.run(run())
+
+        self.assertEqual(len(calls), 1)
+        self.assertTrue(all(isinstance(result, TimeoutError) for result in results))
+        self.assertEqual(flight.stats()['in_flight'], 0)
+
+
+    def test_cancelled_leader_hands_over_to_followers(self):
+        flight = SingleFlight()
+        calls = []
+
+        async def slow_call():
+            calls.append(1)
+            await asyncio.sleep(0.05)
+            return 'resposta'
+
+        async def run():
+            leader = asyncio.ensure_future(flight.ado('status', slow_call))
+            await asyncio.sleep(0)
+            followers = [asyncio.ensure_future(flight.ado('status', slow_call)) for _ in range(3)]
+            await asyncio.sleep(0.01)
+            leader.cancel()
+            return await asyncio.gather(*followers)
+
+        self.assertEqual(asyncio.run(run()), ['resposta'] * 3)
+        # Uma seguidora assumiu a liderança: uma chamada nova, não três
+        self.assertEqual(len(calls), 2)
+        self.assertEqual(flight.stats()['in_flight'], 0)
+
+    def test_stale_finish_keeps_new_leader(self):
+        async def run():
+            flight = SingleFlight()
+            first = flight.lead('status')
+            flight.finish('status', error=TimeoutError('modelo lento'), future=first)
+            second = flight.lead('status')
+            follower = flight.follow('status')
+
+            # O finally do primeiro líder roda depois que outro assumiu a chave
+            flight.finish('status', error=RuntimeError('interrompida'), future=first)
+            self.assertFalse(second.done())
+
+            flight.finish('status', 'resposta', future=second)
+            return await follower
+
+        self.assertEqual(asyncio.run(run()), 'resposta')
+
+
+class FlakyBackend(LLMBackend):
+    """Backend local que falha nas primeiras chamadas (ou demora) antes de responder"""
+
+    def __init__(self, failures=0, error=ConnectionError, delay=0.0):
+        self.failures = failures
+        self.error = error
+        self.delay = delay
+        self.calls = 0
+
+    def generate(self, prompt):
+        self.calls += 1
+        time.sleep(self.delay)
+        if self.calls <= self.failures:
+            raise self.error('upstream indisponível')
+        return 'ok'
+
+    async def agenerate(self, prompt):
+        self.calls += 1
+        await asyncio.sleep(self.delay)
+        if self.calls <= self.failures:
+            raise self.error('upstream indisponível')
+        return 'ok'
+
+
+class ResilientClientTest(SimpleTestCase):
+    """Novas tentativas, prazos e circuit breaker contra um modelo local"""
+
+    def test_retries_transient_errors(self):
+        backend = FlakyBackend(failures=2)
+        client = ResilientClient(backend, retries=2, backoff=0.001, rate=0)
+
+        self.assertEqual(client.generate('p'), 'ok')
+        self.assertEqual(backend.calls, 3)
+        self.assertEqual(client.stats()['retried'], 2)
+
+    def test_timeout_per_attempt(self):
+        client = ResilientClient(FlakyBackend(delay=0.5), timeout=0.05, retries=0, rate=0)
+
+        with self.assertRaises(TimeoutError):
+            asyncio.run(client.agenerate('p'))
+        self.assertEqual(client.stats()['timeouts'], 1)
+
+    def test_breaker_fails_fast_then_recovers(self):
+        backend = FlakyBackend(failures=3, error=ValueError)
+        client = ResilientClient(backend, retries=0, rate=0, breaker_threshold=3, breaker_reset=0.05)
+
+        for _ in range(3):
+            with self.assertRaises(ValueError):
+                client.generate('p')
+        with self.assertRaises(CircuitOpenError):
+            client.generate('p')
+        self.assertEqual(backend.calls, 3)
+
+        time.sleep(0.06)
+        self.assertEqual(client.generate('p'), 'ok')
+        self.assertEqual(client.stats()['breaker_state'], 'closed')
+
+    def test_trial_without_outcome_does_not_wedge_breaker(self):
+        backend = FakeBackend(latency=0.5)
+        client = ResilientClient(backend, retries=0, rate=0, breaker_threshold=1, breaker_reset=0.01)
+        client.breaker.record_failure()
+        time.sleep(0.02)
+
+        async def cancelled_trial():
+            task = asyncio.ensure_future(client.agenerate('p'))
+            await asyncio.sleep(0.05)
+            task.cancel()
+            with self.assertRaises(asyncio.CancelledError):
+                await task
+
+        asyncio.run(cancelled_trial())
+        self.assertEqual(client.stats()['breaker_state'], 'open')
+        self.assertEqual(client.stats()['in_flight'], 0)
+
+        backend.latency = 0
+        self.assertEqual(client.generate('p'), FakeBackend.DEFAULT_ANSWER)
+        self.assertEqual(client.stats()['breaker_state'], 'closed')
+
+    def test_cancelled_slot_waiter_does_not_leak(self):
+        client = ResilientClient(FakeBackend(latency=0.1), max_in_flight=1, rate=0)
+
+        async def run():
+            holder = asyncio.ensure_future(client.agenerate('p'))
+            await asyncio.sleep(0.01)
+            waiter = asyncio.ensure_future(client.agenerate('p'))
+            await asyncio.sleep(0.01)
+            waiter.cancel()
+            await holder
+            return await client.agenerate('p')
+
+        self.assertEqual(asyncio.run(run()), FakeBackend.DEFAULT_ANSWER)
+        self.assertEqual(client._slots.available, 1)
+
+    def test_abandoned_call_keeps_its_slot(self):
+        backend = FakeBackend(latency=0.3)
+        client = ResilientClient(backend, max_in_flight=1, timeout=0.05, deadline=0.1, retries=0, rate=0)
+
+        with self.assertRaises(TimeoutError):
+            client.generate('p')
+        # A thread abandonada ainda está no modelo: nenhuma vaga livre
+        self.assertEqual(client.stats()['in_flight'], 1)
+        with self.assertRaises(OverloadedError):
+            client.generate('p')
+        self.assertEqual(backend.peak_in_flight, 1)
+
+        time.sleep(0.35)
+        self.assertEqual(client.stats()['in_flight'], 0)
+
+    def test_abandoned_threaded_async_call_keeps_its_slot(self):
+        class BlockingBackend(LLMBackend):
+            # Só generate: agenerate padrão roda em uma thread
+            def __init__(self):
+                self.backend = FakeBackend(latency=0.3)
+
+            def generate(self, prompt):
+                return self.backend.generate(prompt)
+
+        blocking = BlockingBackend()
+        client = ResilientClient(blocking, max_in_flight=1, timeout=0.05, deadline=0.1, retries=0, rate=0)
+
+        async def run():
+            with self.assertRaises(TimeoutError):
+                await client.agenerate('p')
+            # A thread da tentativa cancelada ainda está no modelo
+            self.assertEqual(client.stats()['in_flight'], 1)
+            with self.assertRaises(OverloadedError):
+                await client.agenerate('p')
+
+        asyncio.run(run())
+        self.assertEqual(blocking.backend.peak_in_flight, 1)
+        time.sleep(0.35)
+        self.assertEqual(client.stats()['in_flight'], 0)
+
+    def test_agent_answers_from_data_while_breaker_is_open(self):
+        agent = controller.chat_agent
+        client = ResilientClient(FlakyBackend(), rate=0)
+        client.breaker.record_failure()
+        client.breaker.state = client.breaker.OPEN
+        client.breaker.opened_at = time.monotonic()
+
+        with mock.patch.object(agent, 'client', client):
+            answer = agent.process_question('compare a cpu do homelab-dev com o homelab-prod')
+
+        self.assertIn('sobrecarregado', answer)
+        self.assertIn('homelab-dev', answer)
+
+
+class CompletionsHandler(BaseHTTPRequestHandler):
+    """Servidor local compatível com /v1/chat/completions (com e sem streaming)"""
+
+    def do_POST(self):
+        body = json.loads(self.rfile.read(int(self.headers['Content-Length'])))
+        self.send_response(200)
+        if body['stream']:
+            self.send_header('Content-Type', 'text/event-stream')
+            self.end_headers()
+            for text in ('🔍 homelab-dev', ' - CPU: 45%'):
+                chunk = {'choices': [{'delta': {'content': text}}]}
+                self.wfile.write(f"data: {json.dumps(chunk)}\n\n".encode('utf-8'))
+            self.wfile.write(b"data: [DONE]\n\n")
+        else:
+            self.send_header('Content-Type', 'application/json')
+            self.end_headers()
+            answer = {'choices': [{'message': {'content': f"eco: {body['messages'][0]['content']}"}}]}
+            self.wfile.write(json.dumps(answer).encode('utf-8'))
+
+    def log_message(self, *args):
+        pass
+
+
+class EndlessStreamHandler(BaseHTTPRequestHandler):
+    """Servidor que continua enviando trechos até o cliente fechar a conexão"""
+
+    disconnected = threading.Event()
+
+    def do_POST(self):
+        self.rfile.read(int(self.headers['Content-Length']))
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/event-stream')
+        self.end_headers()
+        chunk = json.dumps({'choices': [{'delta': {'content': ' token'}}]})
+        try:
+            for _ in range(100000):
+                self.wfile.write(f"data: {chunk}\n\n".encode('utf-8'))
+                time.sleep(0.0005)
+        except OSError:
+            self.disconnected.set()
+
+    def log_message(self, *args):
+        pass
+
+
+class LLMBackendTest(SimpleTestCase):
+    """Backends offline: falso determinístico e servidor local compatível com OpenAI"""
+
+    def test_fake_backend_streams_through_client(self):
+        backend = FakeBackend(latency=0.01, tokens_per_second=1000)
+        client = ResilientClient(backend, rate=0)
+
+        async def collect():
+            return [chunk async for chunk in client.astream('p')]
+
+        chunks = asyncio.run(collect())
+        self.assertEqual(''.join(chunks), FakeBackend.DEFAULT_ANSWER)
+        self.assertGreater(len(chunks), 1)
+        self.assertEqual(client.stats()['in_flight'], 0)
+
+    def test_openai_compatible_backend(self):
+        server = ThreadingHTTPServer(('127.0.0.1', 0), CompletionsHandler)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        self.addCleanup(server.shutdown)
+        backend = OpenAICompatibleBackend(base_url=f"http://127.0.0.1:{server.server_port}/v1")
+
+        self.assertEqual(backend.generate('oi'), 'eco: oi')
+
+        async def collect():
+            return [chunk async for chunk in backend.astream('oi')]
+
+        self.assertEqual(asyncio.run(collect()), ['🔍 homelab-dev', ' - CPU: 45%'])
+
+    def test_openai_stream_stops_reading_when_consumer_closes(self):
+        server = ThreadingHTTPServer(('127.0.0.1', 0), EndlessStreamHandler)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        self.addCleanup(server.shutdown)
+        backend = OpenAICompatibleBackend(base_url=f"http://127.0.0.1:{server.server_port}/v1")
+
+        def producer_running():
+            return any(thread.name == 'openai-stream' for thread in threading.enumerate())
+
+        async def read_two():
+            stream = backend.astream('oi')
+            chunks = [await anext(stream), await anext(stream)]
+            await stream.aclose()
+            # Com o loop ainda vivo (como num servidor ASGI), a thread para sozinha
+            deadline = time.monotonic() + 2
+            while producer_running() and time.monotonic() < deadline:
+                await asyncio.sleep(0.01)
+            return chunks, producer_running()
+
+        chunks, running = asyncio.run(read_two())
+        self.assertEqual(chunks, [' token', ' token'])
+        self.assertFalse(running)
+        # A thread fechou a resposta HTTP: o servidor vê a desconexão
+        self.assertTrue(EndlessStreamHandler.disconnected.wait(5))
+
+
+class HomelabIndexTest(SimpleTestCase):
+    """Registros tipados e índices do snapshot, nos dois formatos do arquivo"""
+
+    HOSTS = {
+        'homelab-dev': {'cpu': '52%', 'memoria': '68%', 'ram': '8GB', 'docker': '11 containers ativos',
+                        'portas': ['80', '443', '22'], 'status': 'online'},
+        'homelab-prod-2': {'cpu': '15%', 'memoria': '28%', 'ram': '512MB', 'docker': '4 containers ativos',
+                           'portas': ['443', '5432'], 'status': 'offline'},
+    }
+
+    def model_for(self, data):
+        handle, path = tempfile.mkstemp(suffix='.json')
+        with os.fdopen(handle, 'w') as f:
+            json.dump(data, f)
+        self.addCleanup(os.remove, path)
+        return HomelabModel(path, source='file')
+
+    def test_dict_and_snapshot_list_layouts(self):
+        old = {'timestamp': '2025-09-27 21:00:00', 'homelab-old': {'cpu': '1%'}}
+        for data in (self.HOSTS, [old, dict(self.HOSTS, timestamp='2025-09-27 22:00:00')]):
+            model = self.model_for(data)
+            self.assertEqual(model.get_homelab_names(), ['homelab-dev', 'homelab-prod-2'])
+            self.assertEqual(model.get_homelab_metric('homelab-dev', 'cpu'), '52%')
+
+            host = model.get_host('homelab-prod-2')
+            self.assertEqual((host.environment, host.cpu, host.ram, host.containers), ('prod', 15.0, 0.5, 4))
+            self.assertEqual(host.ports, (443, 5432))
+
+    def test_indexes(self):
+        model = self.model_for(self.HOSTS)
+        index = model.get_index()
+        self.assertIs(model.get_index(), index)
+
+        self.assertEqual([h.name for h in model.get_hosts(environment='dev')], ['homelab-dev'])
+        self.assertEqual([h.name for h in model.get_hosts(status='offline')], ['homelab-prod-2'])
+        self.assertEqual(model.get_hosts(environment='prod', status='online'), ())
+        self.assertEqual([h.name for h in model.get_hosts_with_port('443')], ['homelab-dev', 'homelab-prod-2'])
+        self.assertEqual(model.get_hosts_with_port(8080), ())
+        self.assertIn('docker', index.metrics)
+
+
+class SharedSnapshotTest(SimpleTestCase):
+    """Workers leem dados e histórico do snapshot publicado, sem cópia das colunas"""
+
+    def setUp(self):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        self.path = os.path.join(directory, 'snapshot.bin')
+
+    def test_workers_map_published_generation(self):
+        store = HomelabHistoryStore(shared=False)
+        expected = store.aggregate('homelab-dev', 'cpu')
+        publish(self.path, 'v1', {'homelab-x': {'cpu': '10%'}},
+                history=store.get_series_map(), history_snapshots=store.snapshot_count)
+
+        with override_settings(POLDO_SHARED_SNAPSHOT={'ENABLED': True, 'PATH': self.path, 'INTERVAL': 0}):
+            model = HomelabModel(os.path.join(os.path.dirname(self.path), 'inexistente.json'))
+            history = HomelabHistoryStore(os.path.join(os.path.dirname(self.path), 'inexistente.json'))
+
+        self.assertEqual(model.get_versioned_data(), ('v1', {'homelab-x': {'cpu': '10%'}}))
+        self.assertEqual(history.aggregate('homelab-dev', 'cpu'), expected)
+        self.assertIsInstance(history.get_series('homelab-dev', 'cpu').values, memoryview)
+
+        publish(self.path, 'v2', {'homelab-y': {'cpu': '20%'}})
+        self.assertEqual(model.get_homelab_names(), ['homelab-y'])
+        self.assertEqual(model.stats()['shared']['generation'], 2)
+        self.assertEqual(history.refresh(), 0)
+        self.assertEqual(history.get_homelab_names(), [])
+
+    def test_nothing_published(self):
+        reader = SharedSnapshot(self.path, poll_interval=0)
+        self.assertIsNone(reader.read())
+
+    def test_stopped_publisher_falls_back_to_local_source(self):
+        data_file = os.path.join(os.path.dirname(self.path), 'homelabs.json')
+        with open(data_file, 'w') as file:
+            json.dump({'homelab-local': {'cpu': '5%'}}, file)
+        publish(self.path, 'v1', {'homelab-x': {'cpu': '10%'}},
+                history=HomelabHistoryStore(shared=False).get_series_map())
+
+        with override_settings(POLDO_SHARED_SNAPSHOT={'ENABLED': True, 'PATH': self.path,
+                                                      'INTERVAL': 0, 'MAX_AGE': 30}):
+            model = HomelabModel(data_file)
+            history = HomelabHistoryStore(os.path.join(os.path.dirname(self.path), 'inexistente.json'))
+        self.assertEqual(model.get_homelab_names(), ['homelab-x'])
+        self.assertIn('homelab-dev', history.get_homelab_names())
+
+        # Publicador parado há mais de MAX_AGE: ignora o snapshot
+        published_at = time.time()
+        with mock.patch('agent.shared_snapshot.time.time', return_value=published_at + 60):
+            with self.assertLogs('agent.shared_snapshot', 'WARNING'):
+                self.assertEqual(model.get_homelab_names(), ['homelab-local'])
+            self.assertEqual(history.get_homelab_names(), [])
+            self.assertTrue(model.stats()['shared']['stale'])
+
+            # Renovado pelo publicador: volta ao snapshot sem remapear
+            touch(self.path)
+            self.assertEqual(model.get_homelab_names(), ['homelab-x'])
+            self.assertIn('homelab-dev', history.get_homelab_names())
+        self.assertEqual(model.shared.remaps, 1)
+
+
+class MessageSearchTest(TestCase):
+    """Busca nas mensagens pelo índice textual, sincronizado por triggers"""
+
+    def setUp(self):
+        self.conversation = Conversation.objects.create(title="Portas do prod")
+        Message.objects.bulk_create([
+            Message(conversation=self.conversation, role='user', text="quais portas estão abertas no homelab-prod?"),
+            Message(conversation=self.conversation, role='bot', text="🔍 homelab-prod - Portas: 22, 443, <8080>"),
+            Message(conversation=self.conversation, role='user', text="qual a memória do homelab-dev?"),
+        ])
+
+    def test_ranked_results_with_highlighted_snippets(self):
+        self.assertEqual(search_backend(), 'fts5')
+        results = search_messages('Portas homelab-prod')
+        self.assertEqual(len(results), 2)
+        self.assertEqual({r.message.conversation.title for r in results}, {"Portas do prod"})
+        bot = next(r for r in results if r.message.role == 'bot')
+        self.assertIn('<mark>homelab-prod</mark>', bot.snippet)
+        self.assertIn('&lt;8080&gt;', bot.snippet)
+
+        # Sem acento e sem confundir "homelab-dev" com "homelab-prod"
+        self.assertEqual([r.message.role for r in search_messages('memoria homelab-dev')], ['user'])
+        self.assertEqual(search_messages('"*'), [])
+
+    def test_index_follows_updates_and_deletes(self):
+        Message.objects.filter(text__contains='memória').update(text="status do homelab-test")
+        self.assertEqual(search_messages('memoria'), [])
+        self.assertEqual(len(search_messages('homelab-test')), 1)
+
+        self.conversation.delete()
+        self.assertEqual(search_messages('portas'), [])
+
+    def test_missing_triggers_are_recreated(self):
+        with connection.cursor() as cursor:
+            cursor.execute('DROP TRIGGER agent_message_fts_insert')
+        Message.objects.create(conversation=self.conversation, role='bot', text="backup concluído")
+        self.assertEqual(search_messages('backup'), [])
+
+        ensure_sqlite_triggers(sender=None)
+        self.assertEqual(len(search_messages('backup')), 1)
+        Message.objects.create(conversation=self.conversation, role='bot', text="backup atrasado")
+        self.assertEqual(len(search_messages('backup')), 2)
+
+    def test_search_endpoint(self):
+        data = self.client.get('/search/', {'q': 'portas'}).json()
+        self.assertTrue(data['ok'])
+        self.assertEqual(len(data['results']), 2)
+        self.assertIn('<mark>', data['html'])
+        self.assertEqual(self.client.get('/search/', {'q': 'x' * 300}).status_code, 400)
+
+
+class JobQueueTest(SimpleTestCase):
+    """Fila de geração: ordem por conversa e limite de pendentes"""
+
+    def wait_idle(self, *queues):
+        # O job termina antes de a fila liberar a vez no cache: espera antes de apagar o cache
+        ends_at = time.monotonic() + 5
+        while any(queue.stats()['pending'] for queue in queues) and time.monotonic() < ends_at:
+            time.sleep(0.01)
+
+    def test_jobs_of_a_conversation_run_in_order(self):
+        queue = JobQueue(workers=4)
+        events = []
+        lock = threading.Lock()
+
+        def work(key, i):
+            with lock:
+                events.append(('start', key, i))
+            time.sleep(0.01)
+            with lock:
+                events.append(('end', key, i))
+            return i
+
+        jobs = [queue.submit(key, work, key, i) for i in range(5) for key in ('a', 'b')]
+        for job in jobs:
+            self.assertTrue(job.done.wait(5))
+
+        for key in ('a', 'b'):
+            lane = [(kind, i) for kind, k, i in events if k == key]
+            # Um de cada vez, na ordem de envio
+            self.assertEqual(lane, [(kind, i) for i in range(5) for kind in ('start', 'end')])
+        # Conversas diferentes em paralelo
+        self.assertLess(events.index(('start', 'b', 0)), events.index(('end', 'a', 0)))
+        self.assertEqual([job.result for job in jobs[::2]], list(range(5)))
+        self.assertEqual(queue.stats()['pending'], 0)
+
+    def test_bounded_queue_rejects(self):
+        queue = JobQueue(workers=1, max_pending=2)
+        release = threading.Event()
+        first = queue.submit(1, release.wait, 5)
+        queue.submit(2, lambda: None)
+
+        with self.assertRaises(QueueFull):
+            queue.submit(3, lambda: None)
+        self.assertEqual(queue.stats()['rejected'], 1)
+        self.assertEqual(queue.stats()['pending'], 2)
+
+        release.set()
+        self.assertTrue(first.done.wait(5))
+
+    def test_conversation_order_across_processes(self):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        shared = {'default': {'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+                              'LOCATION': directory}}
+        events = []
+
+        def work(i, delay):
+            events.append(('start', i))
+            time.sleep(delay)
+            events.append(('end', i))
+
+        # Duas filas com o mesmo cache compartilhado fazem o papel de dois workers
+        with override_settings(CACHES=shared):
+            first, second = JobQueue(poll_interval=0.01), JobQueue(poll_interval=0.01)
+            jobs = [first.submit(7, work, 0, 0.2), second.submit(7, work, 1, 0)]
+            for job in jobs:
+                self.assertTrue(job.done.wait(5))
+            self.wait_idle(first, second)
+
+        self.assertEqual([job.ticket for job in jobs], [1, 2])
+        self.assertEqual(events, [('start', 0), ('end', 0), ('start', 1), ('end', 1)])
+
+    def test_waiting_for_turn_frees_the_worker(self):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        shared = {'default': {'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+                              'LOCATION': directory}}
+
+        with override_settings(CACHES=shared):
+            queue = JobQueue(workers=1, poll_interval=0.01)
+            # Outro worker pegou a primeira senha da conversa 7 e ainda não terminou
+            self.assertEqual(JobQueue()._take_ticket(7), 1)
+
+            locked = []
+            take_ticket = queue._take_ticket
+
+            def take_ticket_unlocked(key):
+                locked.append(queue._lock.locked())
+                return take_ticket(key)
+
+            with mock.patch.object(queue, '_take_ticket', take_ticket_unlocked):
+                waiting = queue.submit(7, lambda: 'sete')
+            # Chamadas ao cache fora do lock da fila
+            self.assertEqual((waiting.ticket, locked), (2, [False]))
+
+            # Com um único worker, a outra conversa não fica presa atrás da espera
+            other = queue.submit(8, lambda: 'oito')
+            self.assertTrue(other.done.wait(5))
+            self.assertFalse(waiting.done.is_set())
+
+            caches['default'].incr(queue._lane_keys(7)[1])
+            self.assertTrue(waiting.done.wait(5))
+            self.wait_idle(queue)
+        self.assertEqual((waiting.result, other.result), ('sete', 'oito'))
+
+
+@override_settings(POLDO_SINGLE_PROCESS=True)
+@mock.patch.object(controller.chat_agent, 'process_question', return_value='resposta')
+class SendMessageJobTest(TransactionTestCase):
+    """/chat/send/ em segundo plano: 202 com o ID do job e consulta do resultado"""
+
+    def send(self, **extra):
+        return self.client.post('/chat/send/', json.dumps({'question': 'qual a cpu do homelab-dev?'}),
+                                content_type='application/json', **extra)
+
+    def test_enqueue_and_poll(self, _):
+        response = self.send(HTTP_PREFER='respond-async')
+        self.assertEqual(response.status_code, 202)
+        accepted = response.json()
+
+        # Consulta o banco só depois do job: no SQLite em memória dos testes,
+        # ler enquanto o worker grava dá "table is locked" em vez de esperar
+        state = self.client.get(accepted['status_url'], {'wait': 5}).json()
+        self.assertEqual(state['status'], 'done')
+        self.assertTrue(Conversation.objects.filter(id=accepted['conversation_id']).exists())
+        self.assertIn('resposta', state['result']['bot_html'])
+        self.assertEqual(Message.objects.filter(conversation_id=accepted['conversation_id']).count(), 2)
+
+        self.assertEqual(self.client.get('/chat/jobs/inexistente/').status_code, 404)
+
+    def test_full_queue_answers_503(self, _):
+        with mock.patch.object(controller.job_queue, 'max_pending', 0):
+            response = self.send(HTTP_PREFER='respond-async')
+        self.assertEqual(response.status_code, 503)
+        self.assertEqual(response['Retry-After'], '2')
+        self.assertIn('poldo_job_rejected 1', self.client.get('/metrics/').content.decode())
+
+    def test_process_local_cache_answers_synchronously(self, _):
+        # LocMemCache com vários workers: a consulta poderia cair em outro processo
+        with override_settings(POLDO_SINGLE_PROCESS=False):
+            response = self.send(HTTP_PREFER='respond-async')
+        self.assertEqual(response.status_code, 200)
+        self.assertNotIn('job_id', response.json())
+        self.assertIn('bot_html', response.json())
+
+
+class LazyChatAgentTest(SimpleTestCase):
+    """O ChatAgent só é criado no primeiro uso, uma única vez"""
+
+    def test_builds_once_on_first_use(self):
+        built = []
+
+        def slow_agent():
+            built.append(1)
+            time.sleep(0.1)
+            return mock.Mock(answer='ok')
+
+        with mock.patch('agent.chat_agent.ChatAgent', side_effect=slow_agent):
+            agent = LazyChatAgent()
+            self.assertFalse(agent.is_ready)
+
+            barrier = threading.Barrier(8)
+            answers = []
+
+            def use():
+                barrier.wait()
+                answers.append(agent.answer)
+
+            threads = [threading.Thread(target=use) for _ in range(8)]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+
+        self.assertEqual(len(built), 1)
+        self.assertEqual(answers, ['ok'] * 8)
+        self.assertTrue(agent.is_ready)
+
+
+@override_settings(POLDO_HOMELAB_SOURCE='db', POLDO_LLM_BACKEND={'BACKEND': 'fake', 'FAKE_LATENCY': 0})
+class LazyChatAgentAsyncTest(TestCase):
+    """Primeiro uso do ChatAgent nas views assíncronas, com os dados vindos do banco"""
+
+    def setUp(self):
+        buffer = SampleBuffer()
+        buffer.add_snapshots([{'homelab-x': {'cpu': '45%', 'status': 'online'}}])
+        buffer.flush()
+
+    async def test_builds_off_the_event_loop(self):
+        question = json.dumps({'question': 'qual a cpu do homelab-x?'})
+        for url in ('/chat/send/', '/chat/stream/'):
+            with self.subTest(url=url):
+                agent = LazyChatAgent()
+                with mock.patch.object(controller, 'chat_agent', agent):
+                    response = await self.async_client.post(url, question, content_type='application/json')
+                    if response.streaming:
+                        body = ''.join([chunk.decode('utf-8') async for chunk in response.streaming_content])
+                    else:
+                        body = response.content.decode('utf-8')
+
+                self.assertEqual(response.status_code, 200, body)
+                self.assertIn('homelab-x - CPU: 45%', body)
+                self.assertTrue(agent.is_ready)
+
+
+class MetricsTest(TestCase):
+    """Latência por etapa e consultas por requisição em /metrics/"""
+
+    def test_histogram_text_format(self):
+        registry = MetricsRegistry()
+        registry.observe('poldo_stage_duration_seconds', 0.003, stage='llm')
+        registry.observe('poldo_stage_duration_seconds', 0.2, stage='llm')
+        registry.inc('poldo_llm_prompt_tokens_total', 120, backend='fake')
+
+        text = registry.render([('poldo_llm_in_flight', {}, 2, 'Chamadas em andamento')])
+
+        self.assertIn('# TYPE poldo_stage_duration_seconds histogram', text)
+        self.assertIn('poldo_stage_duration_seconds_bucket{stage="llm",le="0.0025"} 0', text)
+        self.assertIn('poldo_stage_duration_seconds_bucket{stage="llm",le="0.005"} 1', text)
+        self.assertIn('poldo_stage_duration_seconds_bucket{stage="llm",le="+Inf"} 2', text)
+        self.assertIn('poldo_stage_duration_seconds_count{stage="llm"} 2', text)
+        self.assertIn('poldo_llm_prompt_tokens_total{backend="fake"} 120', text)
+        self.assertIn('poldo_llm_in_flight 2', text)
+
+    @mock.patch.object(controller.chat_agent, 'aprocess_question', return_value='resposta')
+    def test_send_message_is_measured(self, _):
+        metrics.reset()
+        response = self.client.post('/chat/send/', json.dumps({'question': 'oi'}),
+                                    content_type='application/json')
+        self.assertTrue(response.json()['ok'])
+
+        response = self.client.get('/metrics/')
+        self.assertEqual(response['Content-Type'], 'text/plain; version=0.0.4; charset=utf-8')
+        text = response.content.decode()
+        for stage in ('parse', 'validate', 'db_read', 'agent', 'db_write', 'render', 'response'):
+            self.assertIn(f'poldo_stage_duration_seconds_count{{stage="{stage}"}} 1', text)
+        self.assertIn('poldo_request_duration_seconds_count{endpoint="send_message"} 1', text)
+        # Conversa nova: INSERT da conversa e bulk INSERT das mensagens, mais os savepoints
+        queries = re.search(r'poldo_db_queries_per_request_sum\{endpoint="send_message"\} (\d+)', text)
+        self.assertGreaterEqual(int(queries.group(1)), 2)
+
+
+@override_settings(POLDO_SINGLE_PROCESS=True)
+class ChatPageCacheTest(TestCase):
+    """GET condicional e fragmentos em cache da página do chat"""
+
+    def setUp(self):
+        cache.clear()
+        with self.captureOnCommitCallbacks(execute=True):
+            self.conversation = Conversation.objects.create(title="Nova Conversa")
+        self.url = f'/chat/?conversation_id={self.conversation.id}'
+        # A primeira visita recebe o cookie CSRF (sem ele não há ETag)
+        self.client.get(self.url)
+
+    def test_unchanged_page_is_not_modified(self):
+        response = self.client.get(self.url)
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('no-cache', response['Cache-Control'])
+
+        with self.assertNumQueries(0):
+            response = self.client.get(self.url, HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(response.status_code, 304)
+
+    def test_new_message_invalidates_page_and_fragments(self):
+        etag = self.client.get(self.url)['ETag']
+
+        with self.captureOnCommitCallbacks(execute=True):
+            ChatController._save_exchange(self.conversation, 'status do homelab-prod', 'tudo online')
+
+        response = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+        self.assertContains(response, 'tudo online')
+        # O título mudou com a primeira pergunta: barra lateral e mensagem
+        self.assertContains(response, 'status do homelab-prod', count=2)
+
+    def test_disabled_with_process_local_cache(self):
+        # LocMemCache com vários workers: outro worker guardaria versões antigas
+        with override_settings(POLDO_SINGLE_PROCESS=False):
+            response = self.client.get(self.url)
+        self.assertEqual(response.status_code, 200)
+        self.assertFalse(response.has_header('ETag'))
@@ -10,6 +10,21 @@ urlpatterns = [
     path('chat/', views.chat_view, name='chat'),
     # Rota para nova conversa
     path('new-conversation/', views.new_conversation_view, name='new_conversation'),
+    # Rotas de paginação (AJAX) da barra lateral e do histórico
+    path('conversations/', views.conversation_page, name='conversation_page'),
+    path('chat/<int:conversation_id>/messages/', views.message_page, name='message_page'),
+    # Rota para a busca nas mensagens (AJAX)
+    path('search/', views.search_messages, name='search'),
     # Rota para envio de mensagens via AJAX
     path('chat/send/', views.send_message, name='send_message'),
+    # Rota para consultar o resultado de uma mensagem enviada em segundo plano
+    path('chat/jobs/<str:job_id>/', views.job_status, name='job_status'),
+    # Rota para envio de mensagens com resposta em streaming (SSE)
+    path('chat/stream/', views.stream_message, name='stream_message'),
+    # Rota para os contadores de monitoramento
+    path('stats/', views.stats_view, name='stats'),
+    # Rota para as métricas no formato do Prometheus
+    path('metrics/', views.metrics_view, name='metrics'),
+    # Rota para ingestão de métricas pelos coletores
+    path('ingest/', views.ingest_metrics, name='ingest'),
 ]
@@ -1,13 +1,23 @@
+from django.http import HttpResponse, JsonResponse
 from django.shortcuts import render, redirect
-from django.views.decorators.http import require_http_methods
-from .controller import ChatController
+from django.views.decorators.csrf import csrf_exempt
+from django.utils.cache import patch_cache_control
+from django.views.decorators.http import condition, require_http_methods
+from .controller import ChatController, IngestController
 
+@condition(
+    etag_func=lambda request: ChatController.get_page_validators(request)[0],
+    last_modified_func=lambda request: ChatController.get_page_validators(request)[1],
+)
 def chat_view(request):
     """
     VIEW - Página principal do chat
     
     Renderiza a interface do chat com o contexto necessário.
     Delega a lógica de negócio para o ChatController.
+    
+    Com ETag e Last-Modified: se nada mudou desde a última visita, o
+    navegador recebe 304 sem a página ser montada.
     """
     conversation_id = request.GET.get('conversation_id')
     
@@ -18,7 +28,10 @@ def chat_view(request):
     if not conversation_id and context['current_conversation']:
         return redirect(f'/chat/?conversation_id={context["current_conversation"].id}')
     
-    return render(request, 'agent/chat.html', context)
+    response = render(request, 'agent/chat.html', context)
+    # Sempre revalida com o servidor (a resposta pode ser um 304 barato)
+    patch_cache_control(response, private=True, no_cache=True)
+    return response
 
 def new_conversation_view(request):
     """
@@ -40,10 +53,97 @@ def home_view(request):
 
 
 @require_http_methods(["POST"])
-def send_message(request):
+async def send_message(request):
     """
     VIEW - Endpoint para envio de mensagens via AJAX
     
+    View assíncrona: sob ASGI a chamada ao modelo não bloqueia
+    uma thread do worker. Delega o processamento para o ChatController.
+    """
+    return await ChatController.ahandle_send_message_request(request)
+
+
+@require_http_methods(["GET"])
+async def job_status(request, job_id):
+    """
+    VIEW - Estado de um job de geração enfileirado por /chat/send/ (AJAX)
+    
+    Delega a consulta para o ChatController.
+    """
+    return await ChatController.ahandle_job_request(request, job_id)
+
+
+@require_http_methods(["POST"])
+async def stream_message(request):
+    """
+    VIEW - Endpoint para envio de mensagens com resposta em streaming (SSE)
+    
     Delega o processamento para o ChatController.
     """
-    return ChatController.handle_send_message_request(request)
\ No newline at end of file
+    return await ChatController.ahandle_stream_message_request(request)
+
+
+@require_http_methods(["GET"])
+def stats_view(request):
+    """
+    VIEW - Contadores de monitoramento (cache de respostas)
+    
+    Delega a coleta para o ChatController.
+    """
+    return JsonResponse(ChatController.get_stats())
+
+
+@require_http_methods(["GET"])
+def metrics_view(request):
+    """
+    VIEW - Métricas no formato de texto do Prometheus
+    
+    Delega a geração para o ChatController.
+    """
+    return HttpResponse(
+        ChatController.get_metrics(),
+        content_type='text/plain; version=0.0.4; charset=utf-8'
+    )
+
+
+@csrf_exempt
+@require_http_methods(["POST"])
+def ingest_metrics(request):
+    """
+    VIEW - Endpoint de ingestão de snapshots enviados pelos coletores
+    
+    Sem CSRF (chamado por máquinas); exige o token de
+    POLDO_INGEST['TOKEN'] (sem token, só com ALLOW_ANONYMOUS). Delega
+    para o IngestController.
+    """
+    return IngestController.handle_ingest_request(request)
+
+
+@require_http_methods(["GET"])
+def conversation_page(request):
+    """
+    VIEW - Próxima página de conversas da barra lateral (AJAX)
+    
+    Delega a paginação para o ChatController.
+    """
+    return ChatController.handle_conversation_page_request(request)
+
+
+@require_http_methods(["GET"])
+def message_page(request, conversation_id):
+    """
+    VIEW - Mensagens anteriores de uma conversa (AJAX)
+    
+    Delega a paginação para o ChatController.
+    """
+    return ChatController.handle_message_page_request(request, conversation_id)
+
+
+@require_http_methods(["GET"])
+def search_messages(request):
+    """
+    VIEW - Busca nas mensagens das conversas (AJAX)
+    
+    Delega a busca para o ChatController.
+    """
+    return ChatController.handle_search_request(request)
@@ -10,6 +10,7 @@ For the full list of settings and their values, see
 https://docs.djangoproject.com/en/5.2/ref/settings/
 """
 
+import os
 from pathlib import Path
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
@@ -73,11 +74,226 @@ WSGI_APPLICATION = 'poldo.wsgi.application'
 # Database
 # https://docs.djangoproject.com/en/5.2/ref/settings/#databases
 
-DATABASES = {
-    'default': {
-        'ENGINE': 'django.db.backends.sqlite3',
-        'NAME': BASE_DIR / 'db.sqlite3',
+# POLDO_DB_ENGINE=postgres troca o SQLite pelo PostgreSQL (requer psycopg[pool])
+POLDO_DB_ENGINE = os.getenv('POLDO_DB_ENGINE', 'sqlite')
+
+if POLDO_DB_ENGINE == 'postgres':
+    POLDO_DB_POOL_MAX = int(os.getenv('POLDO_DB_POOL_MAX', '10'))
+    DATABASES = {
+        'default': {
+            'ENGINE': 'django.db.backends.postgresql',
+            'NAME': os.getenv('POLDO_DB_NAME', 'poldo'),
+            'USER': os.getenv('POLDO_DB_USER', 'poldo'),
+            'PASSWORD': os.getenv('POLDO_DB_PASSWORD', ''),
+            'HOST': os.getenv('POLDO_DB_HOST', 'localhost'),
+            'PORT': os.getenv('POLDO_DB_PORT', '5432'),
+            # Pool do psycopg; POLDO_DB_POOL_MAX=0 volta às conexões persistentes
+            'CONN_MAX_AGE': 0 if POLDO_DB_POOL_MAX else int(os.getenv('POLDO_DB_CONN_MAX_AGE', '60')),
+            'CONN_HEALTH_CHECKS': True,
+            'OPTIONS': {
+                'pool': {
+                    'min_size': int(os.getenv('POLDO_DB_POOL_MIN', '2')),
+                    'max_size': POLDO_DB_POOL_MAX,
+                    'timeout': float(os.getenv('POLDO_DB_POOL_TIMEOUT', '10')),
+                },
+            } if POLDO_DB_POOL_MAX else {},
+        }
     }
+else:
+    DATABASES = {
+        'default': {
+            'ENGINE': 'django.db.backends.sqlite3',
+            'NAME': BASE_DIR / 'db.sqlite3',
+            # Reusa a conexão entre requisições da mesma thread
+            'CONN_MAX_AGE': int(os.getenv('POLDO_DB_CONN_MAX_AGE', '600')),
+            'CONN_HEALTH_CHECKS': True,
+            'OPTIONS': {
+                # Pega o lock de escrita no início da transação: com WAL evita
+                # "database is locked" ao promover uma leitura para escrita
+                'transaction_mode': 'IMMEDIATE',
+            },
+        }
+    }
+
+
+# PRAGMAs aplicados a cada nova conexão SQLite (agent/db.py)
+POLDO_SQLITE_PRAGMAS = {
+    'journal_mode': 'WAL',
+    'synchronous': 'NORMAL',
+    'busy_timeout': 5000,
+    'mmap_size': 128 * 1024 * 1024,
+    'temp_store': 'MEMORY',
+}
+
+
+# Cache de respostas do ChatAgent
+# BACKEND: 'lru' (memória do processo) ou 'django' (usa CACHES[ALIAS])
+
+POLDO_RESPONSE_CACHE = {
+    'BACKEND': 'lru',
+    'TTL': 300,
+    'MAX_ENTRIES': 1024,
+    'ALIAS': 'default',
+}
+
+
+# Orçamento (tokens estimados) da seção de dados no prompt do ChatAgent
+
+POLDO_PROMPT_TOKEN_BUDGET = 2000
+
+
+# Recarga dos dados dos homelabs quando homelabs.json muda
+# BACKEND: 'poll' (mtime, no máximo a cada INTERVAL segundos) ou 'inotify'
+# (requer o pacote inotify_simple)
+
+POLDO_DATA_WATCH = {
+    'BACKEND': 'poll',
+    'INTERVAL': 2.0,
+}
+
+
+# Origem dos dados dos homelabs: 'file' (agent/data/homelabs.json) ou
+# 'db' (último snapshot recebido pela API de ingestão)
+
+POLDO_HOMELAB_SOURCE = os.getenv('POLDO_HOMELAB_SOURCE', 'file')
+
+
+# Snapshot compartilhado entre os workers: `manage.py publish_snapshot --watch`
+# grava dados e histórico em PATH (None = /dev/shm/poldo-snapshot.bin) e os
+# workers o mapeiam em memória, verificando a geração a cada INTERVAL segundos.
+# O publicador renova o horário da publicação a cada --interval; um snapshot
+# mais velho que MAX_AGE segundos (publicador parado) é ignorado e os workers
+# voltam a ler a própria origem
+
+POLDO_SHARED_SNAPSHOT = {
+    'ENABLED': os.getenv('POLDO_SHARED_SNAPSHOT', '0') == '1',
+    'PATH': os.getenv('POLDO_SHARED_SNAPSHOT_PATH') or None,
+    'INTERVAL': 1.0,
+    'MAX_AGE': 30.0,
+}
+
+
+# Ingestão de métricas (POST /ingest/): buffer gravado com bulk_create
+# quando atinge MAX_BUFFER amostras ou MAX_AGE segundos. Exige o token
+# (Authorization: Bearer ...); sem TOKEN o endpoint fica desligado, a
+# menos que ALLOW_ANONYMOUS seja ligado (só em rede confiável)
+
+POLDO_INGEST = {
+    'TOKEN': os.getenv('POLDO_INGEST_TOKEN'),
+    'ALLOW_ANONYMOUS': os.getenv('POLDO_INGEST_ALLOW_ANONYMOUS') == '1',
+    'MAX_BUFFER': 5000,
+    'MAX_AGE': 2.0,
+    'BATCH_SIZE': 1000,
+    # Amostras guardadas enquanto o banco recusa as gravações
+    'MAX_PENDING': 50000,
+}
+
+
+# Coalescência de perguntas idênticas simultâneas (agent/single_flight.py).
+# CROSS_PROCESS usa um lock no cache do Django e exige o cache de respostas
+# compartilhado entre os processos (POLDO_RESPONSE_CACHE BACKEND 'django')
+POLDO_SINGLE_FLIGHT = {
+    'CROSS_PROCESS': False,
+    'CACHE_ALIAS': 'default',
+    'LOCK_TIMEOUT': 30.0,
+    'POLL_INTERVAL': 0.1,
+}
+
+
+# Backend do modelo (agent/llm_backends.py): 'gemini' (requer GEMINI_API_KEY),
+# 'fake' (local, determinístico, para benchmarks e CI) ou 'openai' (servidor
+# compatível com a API da OpenAI em BASE_URL, ex: llama.cpp, vLLM, Ollama)
+POLDO_LLM_BACKEND = {
+    'BACKEND': os.getenv('POLDO_LLM_BACKEND', 'gemini'),
+    'MODEL': os.getenv('POLDO_LLM_MODEL'),
+    'BASE_URL': os.getenv('POLDO_LLM_BASE_URL', 'http://localhost:8080/v1'),
+    'API_KEY': os.getenv('POLDO_LLM_API_KEY'),
+    'TIMEOUT': 60.0,
+    'FAKE_LATENCY': 0.2,
+    'FAKE_TOKENS_PER_SECOND': 0,
+}
+
+
+# Controles das chamadas ao modelo (agent/llm_client.py): chamadas simultâneas,
+# taxa (token bucket), prazos em segundos, novas tentativas com backoff e
+# circuit breaker (falhas seguidas para abrir, segundos até testar de novo)
+POLDO_LLM_CLIENT = {
+    'MAX_IN_FLIGHT': 8,
+    'RATE': 5.0,
+    'BURST': 10,
+    'TIMEOUT': 30.0,
+    'DEADLINE': 60.0,
+    'RETRIES': 2,
+    'BACKOFF': 0.5,
+    'MAX_BACKOFF': 8.0,
+    'BREAKER_THRESHOLD': 5,
+    'BREAKER_RESET': 30.0,
+}
+
+
+# Histórico enviado ao Gemini: últimas trocas (por turnos e tokens estimados)
+# e resumo acumulado das anteriores, guardado em Conversation.summary
+POLDO_HISTORY = {
+    'MAX_TURNS': 6,
+    'TOKEN_BUDGET': 600,
+    'SUMMARY_TOKEN_BUDGET': 200,
+}
+
+
+# Arquivamento de conversas antigas (manage.py archive_conversations)
+POLDO_ARCHIVE = {
+    'AFTER_DAYS': 90,
+    'BATCH_SIZE': 100,
+}
+
+
+# Um único processo servindo o Poldo (ex: runserver, ou um só worker). Com
+# ele ligado, a fila de jobs e o cache da página aceitam um cache por processo
+# (LocMemCache); sem ele, exigem um cache compartilhado em CACHES
+
+POLDO_SINGLE_PROCESS = os.getenv('POLDO_SINGLE_PROCESS') == '1'
+
+
+# GET condicional (ETag/Last-Modified) e cache de fragmentos da página do chat
+# ALIAS precisa ser um cache compartilhado entre os workers: com o LocMemCache
+# padrão (por processo) fica desligado, a menos que POLDO_SINGLE_PROCESS esteja
+# ligado; TIMEOUT em segundos, para os fragmentos
+
+POLDO_PAGE_CACHE = {
+    'ENABLED': True,
+    'ALIAS': 'default',
+    'TIMEOUT': 3600,
+}
+
+
+# Busca nas mensagens (agent/search.py): LIMIT resultados, ranqueados entre
+# as CANDIDATES ocorrências mais recentes; CONFIG é o dicionário de texto do
+# PostgreSQL (o mesmo da coluna search_vector criada na migração 0007)
+
+POLDO_SEARCH = {
+    'LIMIT': 20,
+    'CANDIDATES': 1000,
+    'CONFIG': 'portuguese',
+}
+
+
+# Fila de geração em segundo plano (agent/jobs.py): /chat/send/ com o cabeçalho
+# "Prefer: respond-async" (ou "async": true) responde 202 com o ID do job.
+# Acima de MAX_PENDING jobs, ou MAX_PER_CONVERSATION em uma conversa, responde
+# 503 com Retry-After. CACHE_ALIAS precisa ser um cache compartilhado (ou
+# POLDO_SINGLE_PROCESS ligado); senão o pedido é ignorado e a resposta sai na
+# própria requisição. LANE_TIMEOUT: espera máxima pelo job anterior da conversa
+# em outro worker
+
+POLDO_JOBS = {
+    'WORKERS': 4,
+    'MAX_PENDING': 100,
+    'MAX_PER_CONVERSATION': 10,
+    'RESULT_TTL': 600,
+    'CACHE_ALIAS': 'default',
+    'MAX_WAIT': 25,
+    'RETRY_AFTER': 2,
+    'LANE_TIMEOUT': 120,
 }
 
 